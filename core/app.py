@@ -8,11 +8,13 @@ import subprocess
 from PySide6.QtWidgets import (
     QApplication,
     QWidget,
-    QTableWidgetItem,
     QFileDialog,
     QMessageBox,
+    QComboBox,
+    QCompleter,
+    QInputDialog,
 )
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QTimer, QFileSystemWatcher
 from PySide6.QtGui import QAction
 from openpyxl import load_workbook
 import pyautogui
@@ -21,12 +23,30 @@ from core.utils import (
     init_logger,
     get_file_handler,
     write_default_categories_file,
-    read_categories_file,
-    get_skip_list,
+    get_category_config,
 )
 from resources.pembelian_ui_ss import Ui_pembelian
-from core.excel_functions import write_to_excel, init_catsheet, import_records
-from core.constants import APP_VERSION, DATE, CAT_REF, ExcelItem, LOGGER_NAME, Status
+from core.excel_functions import add_vendor, init_catsheet, import_records
+from core.write_queue import BatchPendingError, PurchaseError, write_batch_queued
+from core.service import ServiceClient, WorkbookMismatchError
+from core.workbook_io import WorkbookLockError, save_workbook
+from core.constants import (
+    APP_VERSION,
+    DATE,
+    CAT_REF,
+    BACKUP_BEFORE_WRITE,
+    SERVICE_URL,
+    ExcelItem,
+    LOGGER_NAME,
+    Status,
+)
+from core.item_store import ExcelItemStore
+from core.models import CatalogListModel, CommitTableModel
+from core.export import export_price_snapshot
+from core.fuzzy import NameIndex, normalize_name
+from core.preflight import PreflightError, format_problems
+from core.ingest import parse_purchase_text, read_purchase_file, build_catalog_index, validate_purchase_rows
+from core.catalog import CatalogRefresher, CatalogSnapshot, read_catalog
 
 
 # noinspection SpellCheckingInspection
@@ -39,7 +59,41 @@ class PembelianWidget(QWidget):
         self.logger = init_logger(LOGGER_NAME)
         self.logger.info("Initializing program")
 
-        self.cat_items_dict: dict[str, list[ExcelItem]] = {}
+        self.cat_items_dict: dict[str, ExcelItemStore] = {}
+        self.name_index = NameIndex()
+
+        # Item combo is backed by a model over the catalog, with type-ahead search
+        self.item_model = CatalogListModel(self)
+        self.ui.item_combo.setModel(self.item_model)
+        self.ui.item_combo.setEditable(True)
+        self.ui.item_combo.setInsertPolicy(QComboBox.NoInsert)
+        item_completer = QCompleter(self.item_model, self)
+        item_completer.setCaseSensitivity(Qt.CaseInsensitive)
+        item_completer.setFilterMode(Qt.MatchContains)
+        item_completer.setCompletionMode(QCompleter.PopupCompletion)
+        self.ui.item_combo.setCompleter(item_completer)
+
+        # Debounce category switches, scrolling through categories only loads the last one
+        self.category_timer = QTimer(self)
+        self.category_timer.setSingleShot(True)
+        self.category_timer.setInterval(150)
+        self.category_timer.timeout.connect(self.load_cat_items)
+
+        # Saves from Excel or other clients refresh the catalog in the background, once the file settles
+        self.catalog_checksums: dict[str, int] = {}
+        self.file_watcher = QFileSystemWatcher(self)
+        self.file_watcher.fileChanged.connect(self.workbook_changed)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh_catalog)
+        self.catalog_refresher = CatalogRefresher(self)
+        self.catalog_refresher.refreshed.connect(self.apply_catalog_refresh)
+        self.catalog_refresher.failed.connect(self.catalog_refresh_failed)
+
+        # Staged purchases live in a model, the table only displays them
+        self.commit_model = CommitTableModel(self)
+        self.ui.commit_table.setModel(self.commit_model)
 
         # Context menu setup
         self.ui.commit_table.setContextMenuPolicy(Qt.ActionsContextMenu)
@@ -48,6 +102,17 @@ class PembelianWidget(QWidget):
         # noinspection PyUnresolvedReferences
         self.del_row_action.triggered.connect(self.delete_table_row)
         self.ui.commit_table.addAction(self.del_row_action)
+        self.paste_rows_action = QAction(self, text="Paste Purchases")
+        self.paste_rows_action.triggered.connect(self.paste_purchases)
+        self.ui.commit_table.addAction(self.paste_rows_action)
+        self.load_rows_action = QAction(self, text="Load Purchases File...")
+        self.load_rows_action.triggered.connect(self.load_purchases_file)
+        self.ui.commit_table.addAction(self.load_rows_action)
+        # Purchases only go to existing vendor sheets, new vendors are added here first
+        self.ui.vendor_combo.setContextMenuPolicy(Qt.ActionsContextMenu)
+        self.add_vendor_action = QAction(self, text="Add Vendor...")
+        self.add_vendor_action.triggered.connect(self.add_new_vendor)
+        self.ui.vendor_combo.addAction(self.add_vendor_action)
 
         self.setWindowTitle(f"Poe Excel Automator {APP_VERSION}")
         self.ui.status_bar.setText("Ready for input.")
@@ -64,16 +129,15 @@ class PembelianWidget(QWidget):
         if not Path(CAT_REF).exists():
             self.logger.info("Creating new cat ref file")
             write_default_categories_file()
-        self.categories = read_categories_file()
-
-        self.skip_list = get_skip_list()
+        self.categories = get_category_config()
         self.ui.category_combo.clear()
         self.ui.category_combo.addItems(self.categories["CATEGORIES"])
 
         # Setup button Tooltips
         self.ui.file_browse_button.setToolTip("Select workbook to make active")
         self.ui.add_vendor_button.setToolTip("Add entry")
-        self.ui.import_button.setToolTip("Import price data from previous to active workbook")
+        self.ui.import_button.setToolTip("Import price data from previous workbooks to active workbook")
+        self.ui.export_button.setToolTip("Export average, min, max and last price of every item to CSV")
         self.ui.init_button.setToolTip("Clear and recheck category items")
         self.ui.confirm_button.setToolTip("Confirm entries to excel")
 
@@ -85,19 +149,21 @@ class PembelianWidget(QWidget):
         self.ui.confirm_button.clicked.connect(self.confirm_table)
         self.ui.init_button.clicked.connect(self.init_cat_button)
         self.ui.import_button.clicked.connect(self.import_data)
-        self.ui.category_combo.currentIndexChanged.connect(self.load_cat_items)
+        self.ui.export_button.clicked.connect(self.export_prices)
+        self.ui.category_combo.currentIndexChanged.connect(self.category_timer.start)
 
     def load_cat_items(self):
         """Load all items in cateogory"""
-        self.ui.item_combo.clear()
+        self.category_timer.stop()
         current_cat = self.ui.category_combo.currentText()
         # incase invalid text
         if not current_cat:
+            self.item_model.set_store(ExcelItemStore())
             self.logger.error("Category is empty, could not load items")
             return
 
-        for item in self.cat_items_dict[current_cat]:
-            self.ui.item_combo.addItem(item.name, userData=item)
+        self.item_model.set_store(self.cat_items_dict.get(current_cat, ExcelItemStore()))
+        self.ui.item_combo.setCurrentIndex(0)
 
     def item_input_toggle(self):
         """Toggle item input style"""
@@ -130,7 +196,7 @@ class PembelianWidget(QWidget):
             category_sheet = input_wb[cat]
             max_row = category_sheet.max_row
             category_sheet.delete_rows(3, max_row)
-        input_wb.save(self.ui.xls_file_browser.text())
+        save_workbook(input_wb, self.ui.xls_file_browser.text(), categories=self.categories)
 
     def make_backup(self):
         # Create a backup copy just in case
@@ -168,6 +234,9 @@ class PembelianWidget(QWidget):
         self.make_backup()
         try:
             init_catsheet(file, self.categories)
+        except PreflightError as error:
+            self.show_preflight_problems(error)
+            return
         except Exception as e:
             self.logger.error(e)
             self.__set_info(f"Failed to init data! Error: {e}", Status.FAIL)
@@ -211,14 +280,24 @@ class PembelianWidget(QWidget):
         # QMessageBox.information(self, "Finished!", "Finished Cleaning all categories!")
         self.__set_info("All done!", Status.DONE)
 
+    def show_preflight_problems(self, error: PreflightError):
+        self.__set_info("Fix the vendor rows first, nothing was changed", Status.FAIL)
+        QMessageBox.warning(
+            self,
+            "Problems in vendor sheets",
+            f"{len(error.problems)} vendor row(s) have problems:\n{format_problems(error.problems, limit=15)}",
+        )
+
     def import_data(self):
         """Import data from previous workbook to current active workbook"""
         new_workbook = self.ui.xls_file_browser.text()
         if not new_workbook:
             self.__set_info("Please select Workbook to import to!", Status.FAIL)
+            return
 
         try:
-            old_workbook = QFileDialog.getOpenFileName(filter="Old Workbook (*.xlsx)")[0]
+            # Yearly workbooks are named by year, so name order is oldest to newest
+            old_workbooks = sorted(QFileDialog.getOpenFileNames(filter="Old Workbooks (*.xlsx)")[0])
         except KeyError as error:
             self.__set_info(f"Failed to pick sheet! Vendor doesn't exist.", Status.FAIL)
             self.logger.error(error)
@@ -227,13 +306,95 @@ class PembelianWidget(QWidget):
             self.__set_info(f"Failed to pick sheet! Reason: {error}", Status.FAIL)
             self.logger.error(error)
             return
-        self.__set_info("Transferring records...")
-        import_records(old_workbook, new_workbook, self.categories)
+        if not old_workbooks:
+            self.__set_info("No workbook to import from!", Status.FAIL)
+            return
+
+        self.__set_info(f"Transferring records from {len(old_workbooks)} workbook(s)...")
+        try:
+            import_records(old_workbooks, new_workbook, self.categories)
+        except PreflightError as error:
+            self.show_preflight_problems(error)
+            return
         self.__set_info("Done Transferring!", Status.DONE)
 
+    def export_prices(self):
+        """Export the price snapshot of the active workbook"""
+        workbook = self.ui.xls_file_browser.text()
+        if not workbook:
+            self.__set_info("Please select Workbook to export from!", Status.FAIL)
+            return
+
+        default_name = str(Path(workbook).with_name(f"{Path(workbook).stem} prices.csv"))
+        output_path = QFileDialog.getSaveFileName(dir=default_name, filter="CSV (*.csv);;Parquet (*.parquet)")[0]
+        if not output_path:
+            return
+
+        try:
+            item_count = export_price_snapshot(workbook, output_path, self.categories)
+        except Exception as error:
+            self.__set_info(f"Failed to export prices! Reason: {error}", Status.FAIL)
+            self.logger.error(error)
+            return
+        self.__set_info(f"Exported prices of {item_count} items", Status.DONE)
+
     def delete_table_row(self):
-        current_row = self.ui.commit_table.currentRow()
-        self.ui.commit_table.removeRow(current_row)
+        current_row = self.ui.commit_table.currentIndex().row()
+        self.commit_model.remove_row(current_row)
+
+    def paste_purchases(self):
+        """Stage purchase rows copied from a spreadsheet, with a header row"""
+        self.stage_purchase_rows(parse_purchase_text(QApplication.clipboard().text()))
+
+    def load_purchases_file(self):
+        """Stage purchase rows from a CSV or TSV file, with a header row"""
+        purchase_file = QFileDialog.getOpenFileName(filter="Purchases (*.csv *.tsv *.txt)")[0]
+        if not purchase_file:
+            return
+        try:
+            rows = read_purchase_file(purchase_file)
+        except (OSError, UnicodeDecodeError, StopIteration) as error:
+            self.__set_info(f"Failed to read purchases! Reason: {error}", Status.FAIL)
+            return
+        self.stage_purchase_rows(rows)
+
+    def stage_purchase_rows(self, rows):
+        """Validate bulk purchase rows against the catalog and add the valid ones to the commit table"""
+        if not self.cat_items_dict:
+            self.__set_info("Please select Workbook first!", Status.FAIL)
+            return
+        if not rows:
+            self.__set_info("No purchase rows found", Status.FAIL)
+            return
+
+        excel_items, errors = validate_purchase_rows(
+            rows,
+            build_catalog_index(self.cat_items_dict),
+            self.cat_items_dict.keys(),
+            [self.ui.unit_combo.itemText(i) for i in range(self.ui.unit_combo.count())]
+            + [self.ui.isi_unit_combo.itemText(i) for i in range(self.ui.isi_unit_combo.count())],
+            [self.ui.vendor_combo.itemText(i) for i in range(self.ui.vendor_combo.count())],
+            default_date=datetime.strptime(self.ui.date_line.text(), "%d-%b-%y"),
+            default_vendor=self.ui.vendor_combo.currentText(),
+        )
+        if errors:
+            for error in errors:
+                self.logger.warning(error)
+            shown_errors = "\n".join(errors[:15])
+            if len(errors) > 15:
+                shown_errors += f"\n...and {len(errors) - 15} more, see the log"
+            result = QMessageBox.warning(
+                self,
+                "Problems in purchases",
+                f"{len(errors)} row(s) have problems:\n{shown_errors}\n\nAdd the {len(excel_items)} valid row(s)?",
+                QMessageBox.Cancel,
+                QMessageBox.Ok,
+            )
+            if result != QMessageBox.Ok:
+                return
+
+        self.commit_model.add_items(excel_items)
+        self.__set_info(f"Added {len(excel_items)} items to table")
 
     def get_excel_sheet(self):
         """Load Purchase Excelsheet and get vendors"""
@@ -255,34 +416,21 @@ class PembelianWidget(QWidget):
             return
 
         # Populate vendor drop down
-        purchase_book = load_workbook(file_dir)
-        skip_list = self.categories["CATEGORIES"] + self.categories["MISC"]
-        vendor_sheets = [_ for _ in purchase_book.sheetnames if _ not in skip_list]
-        for vendor in vendor_sheets:
+        snapshot = read_catalog(file_dir, self.categories)
+        for vendor in snapshot.vendors:
             self.ui.vendor_combo.addItem(vendor)
 
         # populate category selection with item lists
         bad_cats = []
-        for category in self.categories["CATEGORIES"]:
-            cat_items = []
-            try:
-                for row in purchase_book[category].iter_rows(min_row=3, values_only=True):
-                    name = row[0].strip()
-                    # In case of missing item names or empty rows, skip
-                    if not name:
-                        continue
-
-                    # Guard against missing units
-                    unit_beli = row[1] if row[1] else "NA"
-                    unit_isi = row[2] if row[2] else "NA"
-
-                    cat_items.append(ExcelItem(name=name, unit_beli=unit_beli, unit_isi=unit_isi))
-            except KeyError:
-                self.logger.info(f"{category} not in Workbook")
-                bad_cat_index = self.ui.category_combo.findText(category)
-                bad_cats.append(bad_cat_index)
-
-            self.cat_items_dict[category] = sorted(cat_items, key=lambda item: item.name)
+        for category in snapshot.missing_categories:
+            self.logger.info(f"{category} not in Workbook")
+            bad_cats.append(self.ui.category_combo.findText(category))
+        self.cat_items_dict.update(snapshot.stores)
+        self.build_name_index()
+        self.catalog_checksums = snapshot.checksums
+        if self.file_watcher.files():
+            self.file_watcher.removePaths(self.file_watcher.files())
+        self.file_watcher.addPath(file_dir)
 
         # Remove invalid categories from loaded sheet
         for cat in reversed(sorted(bad_cats)):
@@ -296,6 +444,76 @@ class PembelianWidget(QWidget):
         self.logger.addHandler(get_file_handler("excel_automator", log_dir))
         self.logger.debug("Init user logging")
 
+    def build_name_index(self):
+        self.name_index = NameIndex(
+            (name, category) for category, cat_items in self.cat_items_dict.items() for name in cat_items.names
+        )
+
+    def workbook_changed(self, path):
+        """Start the refresh once the file stops changing. Saves replace the file, which drops it from the watcher."""
+        self.refresh_timer.start()
+
+    def refresh_catalog(self):
+        file = self.ui.xls_file_browser.text()
+        if not file or not Path(file).exists():
+            return
+        if file not in self.file_watcher.files():
+            self.file_watcher.addPath(file)
+        if self.catalog_refresher.busy:
+            self.refresh_timer.start()
+            return
+        self.catalog_refresher.start(file, self.categories, self.catalog_checksums)
+
+    def apply_catalog_refresh(self, snapshot: CatalogSnapshot):
+        """Swap in the re-read category sheets and vendor list, and check the staged purchases still fit them"""
+        self.catalog_checksums = snapshot.checksums
+        vendors = [self.ui.vendor_combo.itemText(i) for i in range(self.ui.vendor_combo.count())]
+        if snapshot.vendors != vendors:
+            current_vendor = self.ui.vendor_combo.currentText()
+            self.ui.vendor_combo.clear()
+            self.ui.vendor_combo.addItems(snapshot.vendors)
+            self.ui.vendor_combo.setCurrentText(current_vendor)
+        if not snapshot.stores and not snapshot.missing_categories and snapshot.vendors == vendors:
+            return
+
+        self.cat_items_dict.update(snapshot.stores)
+        # Category sheets removed elsewhere, purchases can no longer go to them
+        for category in snapshot.missing_categories:
+            self.logger.warning(f"{category} was removed from the Workbook")
+            self.cat_items_dict.pop(category, None)
+            self.ui.category_combo.removeItem(self.ui.category_combo.findText(category))
+        self.build_name_index()
+        if self.ui.category_combo.currentText() in snapshot.stores:
+            self.load_cat_items()
+        self.logger.info(f"Workbook changed on disk, refreshed {', '.join(snapshot.stores) or 'the vendor list'}")
+
+        invalid_items = []
+        for excel_item in self.commit_model.items():
+            if excel_item.vendor not in snapshot.vendors:
+                invalid_items.append(f"{excel_item.name}: vendor {excel_item.vendor} is gone")
+                continue
+            if excel_item.category not in self.cat_items_dict:
+                invalid_items.append(f"{excel_item.name}: category {excel_item.category} is gone")
+                continue
+            existing_category = self.find_existing_item_category(excel_item.name)
+            if existing_category and existing_category != excel_item.category:
+                invalid_items.append(f"{excel_item.name}: now listed in {existing_category}")
+        if invalid_items:
+            self.__set_info("The workbook was changed elsewhere, check the staged purchases", Status.FAIL)
+            QMessageBox.warning(
+                self,
+                "Workbook changed",
+                "The workbook was saved from somewhere else. These staged purchases no longer match it:\n"
+                + "\n".join(invalid_items),
+            )
+        else:
+            self.__set_info("Workbook changed on disk, catalog refreshed")
+
+    def catalog_refresh_failed(self, error):
+        self.__set_info(
+            f"Could not refresh the catalog after a change on disk, it may be out of date. {error}", Status.FAIL
+        )
+
     def clear_inputs(self):
         """Clear out input fields"""
         self.ui.vendor_combo.clear()
@@ -305,11 +523,46 @@ class PembelianWidget(QWidget):
         self.ui.isi_spin.clear()
         self.__set_info("Cleared inputs!", status=Status.DONE)
 
+    def add_new_vendor(self):
+        """Ask for a vendor name and add its sheet to the workbook"""
+        file = self.ui.xls_file_browser.text()
+        if not file:
+            self.__set_info("Select the workbook first!", Status.FAIL)
+            return
+        vendor, accepted = QInputDialog.getText(self, "Add Vendor", "Vendor name:")
+        if not accepted or not vendor.strip():
+            return
+        try:
+            added = add_vendor(file, vendor, self.categories)
+        except (ValueError, WorkbookLockError) as error:
+            self.__set_info(f"Vendor not added. {error}", Status.FAIL)
+            self.logger.error(f"Error: {error}")
+            return
+        vendor = vendor.strip()
+        if self.ui.vendor_combo.findText(vendor) < 0:
+            self.ui.vendor_combo.addItem(vendor)
+        self.ui.vendor_combo.setCurrentText(vendor)
+        self.__set_info(f"Added vendor {vendor}" if added else f"{vendor} is already a vendor", Status.DONE)
+
     def find_existing_item_category(self, item):
-        for category in self.cat_items_dict.keys():
-            sanitized_items = [x.name for x in self.cat_items_dict[category]]
-            if item.strip().lower() in sanitized_items:
-                return category
+        existing_item = self.name_index.exact(item)
+        return existing_item[1] if existing_item else None
+
+    def confirm_new_item(self, new_item):
+        """Ask before staging a new item that looks like a typo of a catalog item"""
+        similar_items = self.name_index.similar(new_item)
+        if not similar_items:
+            return True
+        self.logger.debug(f"Items similar to {new_item}: {similar_items}")
+        shown_items = "\n".join(f"{name} ({category})" for _, name, category in similar_items)
+        result = QMessageBox.question(
+            self,
+            "Similar items",
+            f"'{new_item}' looks like:\n{shown_items}\n\nAdd it as a new item anyway?",
+            QMessageBox.No | QMessageBox.Yes,
+            QMessageBox.No,
+        )
+        return result == QMessageBox.Yes
 
     def add_to_table(self):
         # Table entry validation
@@ -326,83 +579,57 @@ class PembelianWidget(QWidget):
 
         # Check if item already exists in any category
         if self.ui.new_item_check.isChecked():
-            sanitized_new_item = self.ui.item_line.text().strip().lower()
-            sanitized_items = [item.name.strip().lower() for item_list in self.cat_items_dict.values() for item in item_list]
+            sanitized_new_item = normalize_name(self.ui.item_line.text())
 
-            if sanitized_new_item in sanitized_items:
+            if self.name_index.exact(sanitized_new_item):
                 self.logger.debug(f"Found pre-existing item {self.ui.item_line.text()}")
                 # Switch to category and select item if exists
                 self.ui.new_item_check.setChecked(False)
 
                 item_category = self.find_existing_item_category(sanitized_new_item)
                 self.ui.category_combo.setCurrentIndex(self.ui.category_combo.findText(item_category))
+                self.load_cat_items()
                 self.logger.debug(f"Found item in {item_category}")
 
-                category_items = [x.name.strip().lower() for x in self.cat_items_dict[item_category]]
+                category_items = [normalize_name(name) for name in self.cat_items_dict[item_category].names]
                 item_index = category_items.index(sanitized_new_item)
                 self.logger.debug(f"Found item index: {item_index}")
                 self.ui.item_combo.setCurrentIndex(item_index)
+            elif not self.confirm_new_item(self.ui.item_line.text()):
+                self.__set_info("New item not added, pick the existing item instead", Status.FAIL)
+                return
 
-        # Commit input to table
-        row_count = self.ui.commit_table.rowCount()
-        self.ui.commit_table.insertRow(row_count)
-        new_row = row_count
+        # Typed search text has to resolve to a catalog item
+        current_item: ExcelItem = self.ui.item_combo.currentData()
+        if not self.ui.new_item_check.isChecked() and (
+            not current_item or current_item.name != self.ui.item_combo.currentText()
+        ):
+            self.__set_info("Pick an item from the list, or check New Item", Status.FAIL)
+            return
 
-        details = self.get_ui_details()
-        for column, item in enumerate(details):
-            self.ui.commit_table.setItem(new_row, column, item)
+        # Commit input to table
+        self.commit_model.add_items([self.get_ui_details()])
         self.__set_info("Added item to table")
 
-    def get_ui_details(self) -> tuple:
-        """Get all information from data fields returned as a set"""
+    def get_ui_details(self) -> ExcelItem:
+        """Get all information from data fields returned as an ExcelItem"""
         date_text = self.ui.date_line.text()
-        date = datetime.strptime(date_text, "%d-%b-%y")
-        total_cost = self.ui.qty_spin.value() * self.ui.harga_spin.value()
-        unit_cost = total_cost / self.ui.isi_spin.value()
-        date_data = QTableWidgetItem(self.ui.date_line.text())
-        date_data.setData(Qt.UserRole, date)
-        vendor_data = QTableWidgetItem(self.ui.vendor_combo.currentText())
-        vendor_data.setData(Qt.UserRole, self.ui.vendor_combo.currentText())
-        if not self.ui.merek_line.text():
-            self.ui.merek_line.setText("")
-        merek_data = QTableWidgetItem(self.ui.merek_line.text())
-        merek_data.setData(Qt.UserRole, self.ui.merek_line.text())
         item_text = self.ui.item_combo.currentText()
         if self.ui.new_item_check.isChecked():
             item_text = self.ui.item_line.text().strip()
-        item_data = QTableWidgetItem(item_text)
-        item_data.setData(Qt.UserRole, item_text)
-        qty_data = QTableWidgetItem(self.ui.qty_spin.text())
-        qty_data.setData(Qt.UserRole, self.ui.qty_spin.value())
-        unit_data = QTableWidgetItem(self.ui.unit_combo.currentText())
-        unit_data.setData(Qt.UserRole, self.ui.unit_combo.currentText())
-        harga_data = QTableWidgetItem(self.ui.harga_spin.text())
-        harga_data.setData(Qt.UserRole, self.ui.harga_spin.value())
-        total_data = QTableWidgetItem(str(total_cost))
-        total_data.setData(Qt.UserRole, total_cost)
-        isi_data = QTableWidgetItem(self.ui.isi_spin.text())
-        isi_data.setData(Qt.UserRole, self.ui.isi_spin.value())
-        isi_unit_data = QTableWidgetItem(self.ui.isi_unit_combo.currentText())
-        isi_unit_data.setData(Qt.UserRole, self.ui.isi_unit_combo.currentText())
-        unit_harga_data = QTableWidgetItem(str(unit_cost))
-        unit_harga_data.setData(Qt.UserRole, unit_cost)
-        category_data = QTableWidgetItem(self.ui.category_combo.currentText())
-        category_data.setData(Qt.UserRole, self.ui.category_combo.currentText())
-        details = (
-            date_data,
-            item_data,
-            vendor_data,
-            merek_data,
-            qty_data,
-            unit_data,
-            harga_data,
-            total_data,
-            isi_data,
-            isi_unit_data,
-            unit_harga_data,
-            category_data,
+
+        return ExcelItem(
+            name=item_text,
+            vendor=self.ui.vendor_combo.currentText(),
+            brand=self.ui.merek_line.text(),
+            quantity=self.ui.qty_spin.value(),
+            unit_beli=self.ui.unit_combo.currentText(),
+            cost=self.ui.harga_spin.value(),
+            isi=self.ui.isi_spin.value(),
+            unit_isi=self.ui.isi_unit_combo.currentText(),
+            category=self.ui.category_combo.currentText(),
+            date=datetime.strptime(date_text, "%d-%b-%y"),
         )
-        return details
 
     def confirm_table(self):
         """Commit table to Excel file"""
@@ -413,51 +640,58 @@ class PembelianWidget(QWidget):
             self.__set_info("No file to write to!", Status.FAIL)
             return
 
-        if self.ui.commit_table.rowCount() == 0:
+        excel_items = self.commit_model.items()
+        if not excel_items:
             self.__set_info("Nothing to write")
             return
 
-        self.make_backup()
-        for row in range(self.ui.commit_table.rowCount()):
-            try:
-                # Get values from item ranges as an ExcelItem
-                date = self.ui.commit_table.item(row, 0).data(Qt.UserRole)
-                excel_item = self.create_excel_item(row)
-
-                if not excel_item.name:
-                    self.__set_info("item is empty")
-                    raise ValueError
+        for row, excel_item in enumerate(excel_items):
+            if not excel_item.name:
+                self.__set_info(f"Item on row {row + 1} is empty", Status.FAIL)
+                return
 
-                # Execute table to excel
+        if BACKUP_BEFORE_WRITE:
+            self.make_backup()
+        try:
+            if SERVICE_URL:
+                # The service holds the workbook and saves the purchases with its next batch
+                self.__set_info("Sending to the workbook service...")
+                submission = ServiceClient(SERVICE_URL).submit(file, excel_items)
+                done_message = f"Queued with the workbook service as {submission}, it is saved with the next batch"
+            else:
+                # Execute whole table to excel in one save, along with other clients' waiting batches
                 self.__set_info("Writing to Excel sheet...")
-                write_to_excel(date, file, excel_item)
-            except Exception as error:
-                self.__set_info(f"Failed writing to excel sheet! Reason: {error}", Status.FAIL)
-                self.logger.error(f"Failed on " f"{self.ui.commit_table.item(row, 1)}")
-                self.logger.error(f"Error: {error}")
-                return
+                write_batch_queued(file, excel_items, self.categories)
+                done_message = "All done writing!"
+        except WorkbookLockError as error:
+            self.__set_info(f"Workbook is busy, nothing written. Try again. {error}", Status.FAIL)
+            self.logger.error(f"Error: {error}")
+            return
+        except PurchaseError as error:
+            self.__set_info(f"Nothing written, the workbook cannot take these purchases. {error}", Status.FAIL)
+            self.logger.error(f"Error: {'; '.join(error.problems)}")
+            return
+        except WorkbookMismatchError as error:
+            self.__set_info(f"Nothing sent, pick the workbook the service writes. {error}", Status.FAIL)
+            self.logger.error(f"Error: {error}")
+            return
+        except BatchPendingError as error:
+            # Still in the queue, entering the purchases again would write them twice
+            self.clean_table()
+            self.__set_info(f"Purchases queued, not yet written. Check the workbook later. {error}", Status.FAIL)
+            self.logger.warning(f"Warning: {error}")
+            return
+        except Exception as error:
+            self.__set_info(f"Failed writing to excel sheet! Reason: {error}", Status.FAIL)
+            self.logger.error(f"Error: {error}")
+            return
 
         self.clean_table()
         self.logger.debug("Finished writing")
-        self.__set_info("All done writing!", status=Status.DONE)
-
-    def create_excel_item(self, row):
-        excel_item = ExcelItem()
-        excel_item.name = self.ui.commit_table.item(row, 1).data(Qt.UserRole)
-        excel_item.vendor = self.ui.commit_table.item(row, 2).data(Qt.UserRole)
-        excel_item.brand = self.ui.commit_table.item(row, 3).data(Qt.UserRole)
-        excel_item.quantity = self.ui.commit_table.item(row, 4).data(Qt.UserRole)
-        excel_item.unit = self.ui.commit_table.item(row, 5).data(Qt.UserRole)
-        excel_item.cost = self.ui.commit_table.item(row, 6).data(Qt.UserRole)
-        excel_item.isi = self.ui.commit_table.item(row, 8).data(Qt.UserRole)
-        excel_item.isi_unit = self.ui.commit_table.item(row, 9).data(Qt.UserRole)
-        excel_item.category = self.ui.commit_table.item(row, 11).data(Qt.UserRole)
-        return excel_item
+        self.__set_info(done_message, status=Status.DONE)
 
     def clean_table(self):
-        self.ui.commit_table.clearContents()
-        for row in reversed(range(self.ui.commit_table.rowCount())):
-            self.ui.commit_table.removeRow(row)
+        self.commit_model.clear()
 
     def __set_info(self, message, status: Status = Status.DEFAULT):
         """Display the info on the GUI
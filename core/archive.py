@@ -0,0 +1,214 @@
+from collections import Counter
+from copy import copy
+from dataclasses import dataclass
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+
+from openpyxl.formula.translate import Translator
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.workbook.workbook import Workbook
+from openpyxl.worksheet.worksheet import Worksheet
+
+from core.constants import LOGGER_NAME, CARRY_SHEET, HEADER_STYLE, RP_STYLE
+from core.export import row_unit_price
+from core.preflight import normalize_category
+
+CARRY_COLUMNS = ("ITEM", "COUNT", "PRICE SUM", "MAX PRICE", "CATEGORY", "UNIT BELI", "UNIT ISI")
+# Defined names the category formulas use to add the carried totals
+CARRY_RANGES = (("CarryItems", "A"), ("CarryCounts", "B"), ("CarrySums", "C"), ("CarryMax", "D"))
+
+
+@dataclass(slots=True)
+class CarryTotals:
+    """Purchases of one item that were moved to the archive, summed up the way the category formulas count them"""
+
+    name: str
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    category: str = None
+    unit_beli: str = None
+    unit_isi: str = None
+
+    def add(self, price):
+        # Like SUMIF/COUNTIF over J, a row without a price counts as a purchase at 0
+        self.count += 1
+        self.total += price or 0
+        self.max = max(self.max, price or 0)
+
+
+def archive_path(file) -> Path:
+    """Default archive workbook of a purchase workbook, e.g. "Pembelian 2023 archive.xlsx" """
+    file = Path(file)
+    return file.with_name(f"{file.stem} archive{file.suffix}")
+
+
+def read_carry(workbook: Workbook) -> dict[str, CarryTotals]:
+    """Carried totals of the workbook by lower case item name, empty when nothing was archived yet"""
+    carry = {}
+    if CARRY_SHEET not in workbook.sheetnames:
+        return carry
+    for row in workbook[CARRY_SHEET].iter_rows(min_row=2, max_col=7, values_only=True):
+        row = row + (None,) * (7 - len(row))
+        if row[0]:
+            carry[str(row[0]).lower()] = CarryTotals(str(row[0]), row[1] or 0, row[2] or 0, row[3] or 0, *row[4:])
+    return carry
+
+
+def write_carry_sheet(workbook: Workbook, carry: dict[str, CarryTotals]):
+    """Replace the hidden carry sheet with these totals and point the Carry ranges at it"""
+    if CARRY_SHEET in workbook.sheetnames:
+        workbook.remove(workbook[CARRY_SHEET])
+    carry_sheet = workbook.create_sheet(CARRY_SHEET)
+    carry_sheet.sheet_state = "hidden"
+    carry_sheet.append(CARRY_COLUMNS)
+    for cell in carry_sheet[1]:
+        cell.style = HEADER_STYLE
+    for totals in sorted(carry.values(), key=lambda totals: totals.name.lower()):
+        carry_sheet.append(
+            [totals.name, totals.count, totals.total, totals.max, totals.category, totals.unit_beli, totals.unit_isi]
+        )
+        row = carry_sheet.max_row
+        carry_sheet[f"C{row}"].style = RP_STYLE
+        carry_sheet[f"D{row}"].style = RP_STYLE
+
+    last_row = max(carry_sheet.max_row, 2)
+    for name, column in CARRY_RANGES:
+        workbook.defined_names.delete(name)
+        workbook.defined_names.append(DefinedName(name, attr_text=f"'{CARRY_SHEET}'!${column}$2:${column}${last_row}"))
+
+
+def add_to_carry(carry: dict[str, CarryTotals], rows: list, categories: list):
+    """Sum up moved vendor rows, as lists of cell values A to K, into the carried totals"""
+    for values in rows:
+        values = list(values) + [None] * (11 - len(values))
+        name = values[1]
+        if not name:
+            continue
+        name = str(name).strip()
+        totals = carry.get(name.lower())
+        if totals is None:
+            totals = carry[name.lower()] = CarryTotals(name)
+        totals.add(row_unit_price(values[3], values[5], values[7], values[9]))
+        totals.category = normalize_category(values[10], categories) or totals.category
+        totals.unit_beli = values[4] or totals.unit_beli
+        totals.unit_isi = values[8] or values[4] or totals.unit_isi
+
+
+def _move_cell(value, coordinate, destination):
+    if isinstance(value, str) and value.startswith("="):
+        return Translator(value, origin=coordinate).translate_formula(destination)
+    return value
+
+
+def _cell_style(cell):
+    # Style objects rather than the style array, which only means something inside its own workbook
+    if not cell.has_style:
+        return None
+    return copy(cell.font), copy(cell.fill), copy(cell.border), copy(cell.alignment), cell.number_format
+
+
+def _apply_style(style, target):
+    if style:
+        target.font, target.fill, target.border, target.alignment, target.number_format = style
+
+
+def split_vendor_sheet(sheet: Worksheet, cutoff: datetime) -> list[list]:
+    """Remove the purchase rows dated before the cutoff and close the gaps, keeping the header rows.
+
+    Rows without a date stay, their age is unknown. Formulas of the rows that move up are translated to their new
+    row, like Excel does when deleting rows.
+
+    :return: the removed rows, as lists of (column letter, value, style) with formulas translated to row 1
+    """
+    removed = []
+    new_row = 3
+    max_row, max_column = sheet.max_row, sheet.max_column
+    for row_cells in sheet.iter_rows(min_row=3, max_row=max_row, max_col=max_column):
+        row = row_cells[0].row
+        date = row_cells[0].value
+        if isinstance(date, datetime) and date < cutoff:
+            removed.append(
+                [
+                    (
+                        cell.column_letter,
+                        _move_cell(cell.value, cell.coordinate, f"{cell.column_letter}1"),
+                        _cell_style(cell),
+                    )
+                    for cell in row_cells
+                ]
+            )
+            continue
+        if row != new_row:
+            for cell in row_cells:
+                target = sheet.cell(new_row, cell.column)
+                target.value = _move_cell(cell.value, cell.coordinate, f"{cell.column_letter}{new_row}")
+                target._style = copy(cell._style)
+        new_row += 1
+    if removed:
+        sheet.delete_rows(new_row, max_row - new_row + 1)
+    return removed
+
+
+def _row_key(values):
+    # Formulas refer to their own row, which differs between the vendor sheet and the archive
+    return tuple(None if isinstance(value, str) and value.startswith("=") else value for value in values)
+
+
+def append_archive_rows(archive_wb: Workbook, vendor_sheet: Worksheet, removed: list[list]):
+    """Append removed vendor rows to the same named sheet of the archive workbook, creating it with the vendor
+    sheet's header rows. Rows the archive sheet already holds, e.g. from a replayed write, are not added again."""
+    if vendor_sheet.title in archive_wb.sheetnames:
+        archive_sheet = archive_wb[vendor_sheet.title]
+    else:
+        archive_sheet = archive_wb.create_sheet(vendor_sheet.title)
+        for row in vendor_sheet.iter_rows(max_row=2):
+            for cell in row:
+                _apply_style(_cell_style(cell), archive_sheet.cell(cell.row, cell.column, cell.value))
+        for merged_range in vendor_sheet.merged_cells.ranges:
+            if merged_range.max_row <= 2:
+                archive_sheet.merge_cells(merged_range.coord)
+        for column, dimension in vendor_sheet.column_dimensions.items():
+            archive_sheet.column_dimensions[column].width = dimension.width
+
+    width = max([archive_sheet.max_column] + [len(row_cells) for row_cells in removed])
+    archived = Counter(
+        _row_key(values) for values in archive_sheet.iter_rows(min_row=3, max_col=width, values_only=True)
+    )
+    for row_cells in removed:
+        key = _row_key(value for _, value, _ in row_cells)
+        key = key + (None,) * (width - len(key))
+        if archived[key]:
+            archived[key] -= 1
+            continue
+        row = max(archive_sheet.max_row + 1, 3)
+        for column, value, style in row_cells:
+            target = archive_sheet[f"{column}{row}"]
+            target.value = _move_cell(value, f"{column}1", f"{column}{row}")
+            _apply_style(style, target)
+
+
+def archive_workbook_rows(
+    input_wb: Workbook, archive_wb: Workbook, vendor_sheets: list, cutoff: datetime, categories: list
+) -> int:
+    """Move the vendor rows dated before the cutoff into the archive workbook and add them to the carry sheet.
+    Does not save either workbook.
+
+    :return: number of rows moved
+    """
+    logger = getLogger(LOGGER_NAME)
+    carry = read_carry(input_wb)
+    moved = 0
+    for vendor in vendor_sheets:
+        vendor_sheet = input_wb[vendor]
+        removed = split_vendor_sheet(vendor_sheet, cutoff)
+        if not removed:
+            continue
+        logger.info(f"Archiving {len(removed)} rows of {vendor}")
+        append_archive_rows(archive_wb, vendor_sheet, removed)
+        add_to_carry(carry, [[value for _, value, _ in row_cells][:11] for row_cells in removed], categories)
+        moved += len(removed)
+    if moved:
+        write_carry_sheet(input_wb, carry)
+    return moved
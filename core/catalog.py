@@ -0,0 +1,103 @@
+import threading
+from dataclasses import dataclass, field
+from logging import getLogger
+from zipfile import ZipFile
+
+import openpyxl
+from PySide6.QtCore import QObject, Signal
+
+from core.constants import LOGGER_NAME
+from core.diagnostics import sheet_parts
+from core.item_store import ExcelItemStore
+
+
+@dataclass
+class CatalogSnapshot:
+    """Vendors and category items read from a workbook, for the sheets that were read"""
+
+    vendors: list[str]
+    stores: dict[str, ExcelItemStore]
+    # Categories without a sheet in the workbook, they get no store
+    missing_categories: list[str]
+    # Sheet name -> CRC of its part in the file, to tell which sheets a later save changed
+    checksums: dict[str, int] = field(default_factory=dict)
+
+
+def sheet_checksums(path) -> dict[str, int]:
+    """CRC of every sheet's XML, read from the zip directory without decompressing anything"""
+    with ZipFile(path) as archive:
+        return {sheet_name: archive.getinfo(part).CRC for sheet_name, part in sheet_parts(archive)}
+
+
+def changed_sheet_names(before: dict[str, int], after: dict[str, int]) -> set[str]:
+    return {
+        sheet_name for sheet_name in before.keys() | after.keys() if before.get(sheet_name) != after.get(sheet_name)
+    }
+
+
+def read_catalog(path, categories, sheets=None, checksums=None) -> CatalogSnapshot:
+    """Read the vendor list and the items of the category sheets, in read-only mode
+
+    :param sheets: only read the category sheets with these names, all of them by default
+    :param checksums: sheet_checksums the caller took just before, read from the file by default
+    """
+    if checksums is None:
+        checksums = sheet_checksums(path)
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        vendors = [sheet_name for sheet_name in workbook.sheetnames if categories.is_vendor_sheet(sheet_name)]
+        stores = {}
+        missing_categories = []
+        for category in categories["CATEGORIES"]:
+            if sheets is not None and category not in sheets:
+                continue
+            if category not in workbook.sheetnames:
+                missing_categories.append(category)
+                continue
+            cat_items = stores[category] = ExcelItemStore()
+            for name, unit_beli, unit_isi in workbook[category].iter_rows(min_row=3, max_col=3, values_only=True):
+                # In case of missing item names or empty rows, skip
+                name = str(name).strip() if name else ""
+                if not name:
+                    continue
+                # Guard against missing units
+                cat_items.append(name=name, unit_beli=unit_beli or "NA", unit_isi=unit_isi or "NA")
+            cat_items.sort_by("name")
+    finally:
+        workbook.close()
+    return CatalogSnapshot(vendors, stores, missing_categories, checksums)
+
+
+class CatalogRefresher(QObject):
+    """Reads the category sheets a save changed in a background thread, and hands them back through a signal.
+
+    The signal is queued to the thread the refresher lives in, so the GUI applies the snapshot on its own thread.
+    """
+
+    refreshed = Signal(object)
+    failed = Signal(str)
+
+    def __init__(self, parent=None):
+        super(CatalogRefresher, self).__init__(parent)
+        self._thread = None
+
+    @property
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, path, categories, checksums: dict[str, int]):
+        self._thread = threading.Thread(target=self._refresh, args=(path, categories, checksums), daemon=True)
+        self._thread.start()
+
+    def _refresh(self, path, categories, checksums):
+        logger = getLogger(LOGGER_NAME)
+        try:
+            # The snapshot keeps the checksums the changed sheets were picked by, so a save after this read is not
+            # mistaken for one already seen
+            current = sheet_checksums(path)
+            changed = changed_sheet_names(checksums, current)
+            logger.debug(f"Sheets changed on disk: {sorted(changed)}")
+            self.refreshed.emit(read_catalog(path, categories, sheets=changed, checksums=current))
+        except Exception as error:
+            logger.warning(f"Could not refresh the catalog from {path}: {error}")
+            self.failed.emit(str(error))
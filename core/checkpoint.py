@@ -0,0 +1,68 @@
+import json
+import os
+from dataclasses import asdict
+from logging import getLogger
+from pathlib import Path
+
+from core.constants import LOGGER_NAME
+from core.workbook_io import FileFingerprint, file_fingerprint
+
+
+def checkpoint_path(file) -> Path:
+    return Path(f"{file}.init.json")
+
+
+class InitCheckpoint:
+    """Progress of an init, saved next to the workbook after every vendor sheet.
+
+    Init only saves the workbook at the end, so the file on disk is still the input of the interrupted run. The
+    checkpoint is tied to that file's fingerprint: a rerun on the same file replays the recorded category items
+    instead of scanning the completed sheets again, any other file starts over.
+    """
+
+    def __init__(self, file):
+        self.path = checkpoint_path(file)
+        self.fingerprint = file_fingerprint(file)
+        self.completed_sheets: list[str] = []
+        # Category entries in the order init added them, as {category, name, unit_beli, unit_isi}
+        self.category_items: list[dict] = []
+
+    def load(self) -> bool:
+        """Pick up the progress of an interrupted init of this same file
+
+        :return: True if there is progress to resume
+        """
+        logger = getLogger(LOGGER_NAME)
+        try:
+            with open(self.path, "r", encoding="utf-8") as checkpoint_file:
+                saved = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as error:
+            logger.warning(f"Ignoring unreadable init checkpoint {self.path}: {error}")
+            return False
+
+        if FileFingerprint(**saved["fingerprint"]) != self.fingerprint:
+            logger.info("Workbook changed since the interrupted init, starting over")
+            return False
+        self.completed_sheets = saved["completed_sheets"]
+        self.category_items = saved["category_items"]
+        logger.info(f"Resuming init after {len(self.completed_sheets)} completed vendor sheets")
+        return bool(self.completed_sheets)
+
+    def sheet_done(self, sheet_name, new_category_items: list[dict]):
+        """Record a finished vendor sheet and the category items it added"""
+        self.completed_sheets.append(sheet_name)
+        self.category_items.extend(new_category_items)
+        saved = {
+            "fingerprint": asdict(self.fingerprint),
+            "completed_sheets": self.completed_sheets,
+            "category_items": self.category_items,
+        }
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as checkpoint_file:
+            json.dump(saved, checkpoint_file)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
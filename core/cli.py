@@ -0,0 +1,118 @@
+"""Command line tools for the purchase workbooks, e.g. python -m core.cli diagnose "Pembelian 2023.xlsx" """
+
+import argparse
+import sys
+from datetime import datetime
+from logging import getLogger
+
+from core.compare import compare_workbooks, format_category_totals, write_comparison
+from core.constants import LOGGER_NAME, SERVICE_HOST, SERVICE_PORT, SERVICE_SAVE_INTERVAL
+from core.diagnostics import workbook_diagnostics, format_diagnostics
+from core.excel_functions import archive_vendor_rows
+from core.export import export_price_snapshot
+from core.preflight import preflight_scan, format_problems
+from core.service import serve
+from core.utils import get_category_config, init_logger
+from core.workbook_io import locked_update
+
+
+def diagnose(args):
+    print(format_diagnostics(workbook_diagnostics(args.workbook)))
+
+
+def optimise(args):
+    before = workbook_diagnostics(args.workbook)
+    locked_update(args.workbook, lambda workbook: None, optimise=True, categories=get_category_config())
+    after = workbook_diagnostics(args.workbook)
+    print(
+        f"File size: {before['file_size']:,} -> {after['file_size']:,} bytes, "
+        f"cell styles: {before['cell_styles']:,} -> {after['cell_styles']:,}"
+    )
+
+
+def export(args):
+    item_count = export_price_snapshot(args.workbook, args.output)
+    print(f"Exported prices of {item_count} items to {args.output}")
+
+
+def preflight(args):
+    problems = preflight_scan(args.workbook)
+    if problems:
+        print(format_problems(problems))
+        return 1 if any(not problem.warning for problem in problems) else 0
+    print("No problems found")
+
+
+def archive(args):
+    moved = archive_vendor_rows(args.workbook, args.before, args.archive)
+    print(f"Moved {moved} vendor rows to the archive")
+
+
+def compare(args):
+    comparisons, totals = compare_workbooks(args.old_workbook, args.new_workbook)
+    print(format_category_totals(totals))
+    if args.output:
+        write_comparison(comparisons, args.output)
+        print(f"Wrote {len(comparisons)} item prices to {args.output}")
+
+
+def run_service(args):
+    serve(args.workbook, args.host, args.port, args.interval)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="poe-automator", description="Miss Poe purchase workbook tools")
+    subparsers = parser.add_subparsers(required=True)
+
+    diagnose_parser = subparsers.add_parser("diagnose", help="Report sheet XML sizes, styles, strings and formulas")
+    diagnose_parser.add_argument("workbook")
+    diagnose_parser.set_defaults(func=diagnose)
+
+    optimise_parser = subparsers.add_parser("optimise", help="Re-save with compacted styles and maximum compression")
+    optimise_parser.add_argument("workbook")
+    optimise_parser.set_defaults(func=optimise)
+
+    export_parser = subparsers.add_parser("export", help="Export per item average, min, max and last prices")
+    export_parser.add_argument("workbook")
+    export_parser.add_argument("output", help="CSV file, or .parquet when pyarrow is installed")
+    export_parser.set_defaults(func=export)
+
+    preflight_parser = subparsers.add_parser("preflight", help="List vendor rows with category or unit problems")
+    preflight_parser.add_argument("workbook")
+    preflight_parser.set_defaults(func=preflight)
+
+    archive_parser = subparsers.add_parser("archive", help="Move vendor rows older than a date to an archive workbook")
+    archive_parser.add_argument("workbook")
+    archive_parser.add_argument(
+        "--before", required=True, type=datetime.fromisoformat, help="Cutoff date, e.g. 2022-01-01"
+    )
+    archive_parser.add_argument("--archive", help='Archive workbook, "<workbook> archive.xlsx" by default')
+    archive_parser.set_defaults(func=archive)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare item prices of two yearly workbooks")
+    compare_parser.add_argument("old_workbook")
+    compare_parser.add_argument("new_workbook")
+    compare_parser.add_argument("--output", help="CSV file for the per item price changes")
+    compare_parser.set_defaults(func=compare)
+
+    serve_parser = subparsers.add_parser("serve", help="Keep the workbook in memory and take purchases over HTTP")
+    serve_parser.add_argument("workbook")
+    serve_parser.add_argument("--host", default=SERVICE_HOST, help="0.0.0.0 to take purchases from other PCs")
+    serve_parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    serve_parser.add_argument("--interval", type=float, default=SERVICE_SAVE_INTERVAL, help="Seconds between saves")
+    serve_parser.set_defaults(func=run_service)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    init_logger(LOGGER_NAME)
+    try:
+        return args.func(args) or 0
+    except Exception as error:
+        getLogger(LOGGER_NAME).error(error)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
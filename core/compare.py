@@ -0,0 +1,151 @@
+import csv
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from logging import getLogger
+
+from core.constants import LOGGER_NAME
+from core.excel_functions import read_category_items
+from core.fuzzy import normalize_name
+from core.utils import get_category_config
+
+COMPARISON_COLUMNS = ("item", "category", "unit_isi", "status", "old_price", "new_price", "change", "change_percent")
+
+
+def _price(value):
+    # Formula text instead of a number when the workbook has no cached value
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+@dataclass(slots=True)
+class ItemComparison:
+    item: str
+    category: str
+    unit_isi: str
+    old_price: float = None
+    new_price: float = None
+    # Whether the category sheets of each year list the item, priced or not
+    in_old: bool = True
+    in_new: bool = True
+
+    @property
+    def status(self):
+        if not self.in_old:
+            return "new"
+        if not self.in_new:
+            return "discontinued"
+        if self.old_price is None or self.new_price is None:
+            return "no price"
+        return "compared"
+
+    @property
+    def change(self):
+        if self.status != "compared":
+            return None
+        return self.new_price - self.old_price
+
+    @property
+    def change_percent(self):
+        if self.status != "compared" or not self.old_price:
+            return None
+        return 100 * self.change / self.old_price
+
+
+@dataclass(slots=True)
+class CategoryTotals:
+    """Item counts of a category, and the price sums of the items in both years"""
+
+    category: str
+    compared: int = 0
+    new: int = 0
+    discontinued: int = 0
+    no_price: int = 0
+    old_total: float = 0.0
+    new_total: float = 0.0
+
+    def add(self, comparison: ItemComparison):
+        if comparison.status == "new":
+            self.new += 1
+        elif comparison.status == "discontinued":
+            self.discontinued += 1
+        elif comparison.status == "no price":
+            self.no_price += 1
+        elif comparison.status == "compared":
+            self.compared += 1
+            self.old_total += comparison.old_price
+            self.new_total += comparison.new_price
+
+    @property
+    def items(self):
+        return self.compared + self.new + self.discontinued + self.no_price
+
+    @property
+    def change_percent(self):
+        return 100 * (self.new_total - self.old_total) / self.old_total if self.old_total else None
+
+
+def _prices_by_name(category_items: dict) -> dict[str, dict]:
+    """Items keyed by normalized name, the first spelling wins like in the category sheets"""
+    items = {}
+    for item in category_items.values():
+        if item["name"]:
+            items.setdefault(normalize_name(item["name"]), item)
+    return items
+
+
+def compare_workbooks(old_path, new_path, categories=None) -> tuple[list[ItemComparison], list[CategoryTotals]]:
+    """Join the category sheet prices of two yearly workbooks on the normalized item name.
+
+    Streams both workbooks at once in read-only mode and uses the cached average prices, so Excel is never needed.
+    Items only listed in the new workbook are new, items only listed in the old one are discontinued. Items listed in
+    both without a cached price in either have no price, and are counted apart from the compared ones.
+
+    :return: per item comparisons and per category totals, both sorted
+    """
+    logger = getLogger(LOGGER_NAME)
+    categories = categories or get_category_config()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        old_items, new_items = executor.map(
+            lambda path: _prices_by_name(read_category_items(path, categories)), (old_path, new_path)
+        )
+
+    comparisons = []
+    for key in old_items.keys() | new_items.keys():
+        old_item, new_item = old_items.get(key), new_items.get(key)
+        item = new_item or old_item
+        comparisons.append(
+            ItemComparison(
+                item["name"],
+                item["category"],
+                item["unit_isi"],
+                _price(old_item["unit_price"]) if old_item else None,
+                _price(new_item["unit_price"]) if new_item else None,
+                in_old=old_item is not None,
+                in_new=new_item is not None,
+            )
+        )
+    comparisons.sort(key=lambda comparison: (comparison.category, normalize_name(comparison.item)))
+
+    totals = {category: CategoryTotals(category) for category in categories["CATEGORIES"]}
+    for comparison in comparisons:
+        totals.setdefault(comparison.category, CategoryTotals(comparison.category)).add(comparison)
+    logger.info(f"Compared {len(comparisons)} items of {old_path} and {new_path}")
+    return comparisons, [category_totals for category_totals in totals.values() if category_totals.items]
+
+
+def write_comparison(comparisons: list[ItemComparison], output_path):
+    with open(output_path, "w", encoding="utf-8-sig", newline="") as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(COMPARISON_COLUMNS)
+        for comparison in comparisons:
+            writer.writerow(getattr(comparison, column) for column in COMPARISON_COLUMNS)
+
+
+def format_category_totals(totals: list[CategoryTotals]) -> str:
+    lines = [f"{'Category':<14}{'Compared':>10}{'New':>6}{'Gone':>6}{'No price':>10}{'Change':>10}"]
+    for category_totals in totals:
+        change = category_totals.change_percent
+        lines.append(
+            f"{category_totals.category:<14}{category_totals.compared:>10}{category_totals.new:>6}"
+            f"{category_totals.discontinued:>6}{category_totals.no_price:>10}{'' if change is None else f'{change:+.1f}%':>10}"
+        )
+    return "\n".join(lines)
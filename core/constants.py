@@ -1,4 +1,4 @@
-from datetime import date
+from datetime import date, datetime
 from dataclasses import dataclass
 from enum import Enum
 
@@ -11,6 +11,43 @@ DATE_FORMAT = "dd-mmm-yy"
 COMMA_FORMAT = "#,##0"
 RP_FORMAT = u'_("Rp"* #,##0_);_("Rp"* (#,##0);_("Rp"* "-"_);_(@_)'
 
+# Named styles registered once per workbook, cells refer to them by name
+DATE_STYLE = "Poe Date"
+COMMA_STYLE = "Poe Comma"
+RP_STYLE = "Poe Rupiah"
+HEADER_STYLE = "Poe Header"
+
+# Saves are atomic, so a full copy before every commit is only needed as an undo
+BACKUP_BEFORE_WRITE = False
+
+# Category D/E formulas are stored once per column as shared formulas instead of once per row
+SHARED_FORMULAS = True
+
+# Store the values of the app's formulas in saved files, so readers get prices without an Excel round trip
+EVALUATE_FORMULAS = True
+
+# Keep a hidden sheet with one row per purchase, so category formulas read one bounded range instead of every vendor
+# sheet through INDIRECT. A workbook that already has the sheet keeps it up to date either way.
+CONSOLIDATED_PURCHASES = False
+PURCHASES_SHEET = "_PURCHASES_"
+
+# Hidden sheet with the per item purchase count, price sum and max of the vendor rows moved to the archive workbook
+CARRY_SHEET = "_CARRY_"
+
+# Sheets the app maintains itself, never vendor sheets
+INTERNAL_SHEETS = ("DATA", PURCHASES_SHEET, CARRY_SHEET)
+
+# Local service keeping the workbook in memory, see core/service.py. With SERVICE_URL set, e.g.
+# "http://192.168.1.10:8765", the GUI sends its purchases to the service instead of writing the workbook itself.
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_SAVE_INTERVAL = 10  # seconds between saves of the collected purchases
+SERVICE_URL = None
+
+# Windows of the rolling price averages written next to the all time average in the category sheets
+ROLLING_PURCHASES = 5
+ROLLING_DAYS = 90
+
 CAT_REF = "excel_categories.txt"
 DEFAULT_CATEGORIES = {
     "MISC": [
@@ -32,20 +69,41 @@ DEFAULT_CATEGORIES = {
     ],
 }
 
+# Common misspellings found in the vendor sheet category column, lower case -> category
+CATEGORY_TYPOS = {
+    "fresh food": "Fresh",
+    "frsh": "Fresh",
+    "sundry": "Sundries",
+    "sundires": "Sundries",
+    "packing": "Packaging",
+    "pakaging": "Packaging",
+    "utensil": "Utensils",
+    "appliance": "Appliances",
+    "aplliances": "Appliances",
+    "clean": "Cleaning",
+    "cleaning supplies": "Cleaning",
+    "stationary": "Stationery",
+    "advertisement": "Advertising",
+    "advertise": "Advertising",
+    "utilities": "Utility",
+    "maintainance": "Maintenance",
+    "maintenence": "Maintenance",
+}
+
 # Columns A, G, J are reserved for other data
 ITEM_INPUT_FORMAT = {
     "B": "name",
     "C": "brand",
     "D": "quantity",
-    "E": "unit",
+    "E": "unit_beli",
     "F": "cost",
     "H": "isi",
-    "I": "isi_unit",
+    "I": "unit_isi",
     "K": "category",
 }
 
 
-@dataclass()
+@dataclass(slots=True)
 class ExcelItem:
     """Basic class to hold item data"""
 
@@ -58,6 +116,7 @@ class ExcelItem:
     isi: int = None
     unit_isi: str = None
     category: str = None
+    date: datetime = None
 
 
 class Status(Enum):
@@ -0,0 +1,105 @@
+import os
+import posixpath
+from xml.etree.ElementTree import iterparse
+from zipfile import ZipFile
+
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def sheet_parts(archive: ZipFile) -> list[tuple[str, str]]:
+    """Get (sheet name, zip part) in workbook order"""
+    targets = {}
+    with archive.open("xl/_rels/workbook.xml.rels") as rels:
+        for _, element in iterparse(rels):
+            if element.tag == f"{PACKAGE_REL_NS}Relationship":
+                target = element.get("Target")
+                if target.startswith("/"):
+                    target = target[1:]
+                else:
+                    target = posixpath.normpath(posixpath.join("xl", target))
+                targets[element.get("Id")] = target
+
+    sheets = []
+    with archive.open("xl/workbook.xml") as workbook_xml:
+        for _, element in iterparse(workbook_xml):
+            if element.tag == f"{MAIN_NS}sheet":
+                sheets.append((element.get("name"), targets.get(element.get(f"{REL_NS}id"))))
+    return sheets
+
+
+def _count_sheet_xml(archive: ZipFile, part) -> dict:
+    cells = 0
+    inline_strings = 0
+    formulas = 0
+    formula_bytes = 0
+    with archive.open(part) as sheet_xml:
+        for _, element in iterparse(sheet_xml):
+            if element.tag == f"{MAIN_NS}c":
+                cells += 1
+                if element.get("t") == "inlineStr":
+                    inline_strings += 1
+                element.clear()
+            elif element.tag == f"{MAIN_NS}f":
+                formulas += 1
+                formula_bytes += len(element.text or "")
+    return {"cells": cells, "inline_strings": inline_strings, "formulas": formulas, "formula_bytes": formula_bytes}
+
+
+def _count_children(archive: ZipFile, part, parent_tag, child_tag):
+    """Count the direct children of every parent_tag element, e.g. the xf entries of cellXfs"""
+    if part not in archive.namelist():
+        return 0
+    count = 0
+    depth_stack = []
+    with archive.open(part) as xml:
+        for event, element in iterparse(xml, events=("start", "end")):
+            if event == "start":
+                depth_stack.append(element.tag)
+                continue
+            depth_stack.pop()
+            if element.tag == f"{MAIN_NS}{child_tag}" and depth_stack and depth_stack[-1] == f"{MAIN_NS}{parent_tag}":
+                count += 1
+    return count
+
+
+def workbook_diagnostics(path) -> dict:
+    """Measure what makes a workbook big, straight from the xlsx parts without loading it in openpyxl"""
+    report = {"file_size": os.path.getsize(path), "sheets": []}
+    with ZipFile(path) as archive:
+        for name, part in sheet_parts(archive):
+            if part not in archive.namelist():
+                continue
+            info = archive.getinfo(part)
+            sheet_report = {"name": name, "xml_size": info.file_size, "compressed_size": info.compress_size}
+            sheet_report.update(_count_sheet_xml(archive, part))
+            report["sheets"].append(sheet_report)
+
+        report["cell_styles"] = _count_children(archive, "xl/styles.xml", "cellXfs", "xf")
+        report["fonts"] = _count_children(archive, "xl/styles.xml", "fonts", "font")
+        report["number_formats"] = _count_children(archive, "xl/styles.xml", "numFmts", "numFmt")
+        report["shared_strings"] = _count_children(archive, "xl/sharedStrings.xml", "sst", "si")
+        report["styles_size"] = (
+            archive.getinfo("xl/styles.xml").file_size if "xl/styles.xml" in archive.namelist() else 0
+        )
+    return report
+
+
+def format_diagnostics(report: dict) -> str:
+    lines = [
+        f"File size: {report['file_size']:,} bytes",
+        f"Cell styles: {report['cell_styles']:,}, fonts: {report['fonts']:,}, "
+        f"number formats: {report['number_formats']:,}, styles.xml: {report['styles_size']:,} bytes",
+        # openpyxl writes strings inline, Excel moves them to the shared table
+        f"Shared strings: {report['shared_strings']:,}, "
+        f"inline strings: {sum(sheet['inline_strings'] for sheet in report['sheets']):,}",
+        "",
+        f"{'Sheet':<30}{'XML bytes':>14}{'Zipped':>12}{'Cells':>10}{'Formulas':>10}{'Formula bytes':>15}",
+    ]
+    for sheet in sorted(report["sheets"], key=lambda sheet: sheet["xml_size"], reverse=True):
+        lines.append(
+            f"{sheet['name'][:29]:<30}{sheet['xml_size']:>14,}{sheet['compressed_size']:>12,}"
+            f"{sheet['cells']:>10,}{sheet['formulas']:>10,}{sheet['formula_bytes']:>15,}"
+        )
+    return "\n".join(lines)
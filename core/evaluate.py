@@ -0,0 +1,184 @@
+import os
+import re
+import tempfile
+from logging import getLogger
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from openpyxl.formula.translate import Translator
+from openpyxl.workbook.workbook import Workbook
+
+from core.archive import read_carry
+from core.constants import LOGGER_NAME
+from core.diagnostics import sheet_parts
+from core.formulas import (
+    get_avg_price_formula,
+    get_consolidated_avg_formula,
+    get_consolidated_max_formula,
+    get_max_price_formula,
+    get_shared_max_price_formula,
+)
+
+# Formula cells as openpyxl writes them, with an empty cached value
+FORMULA_CELL = re.compile(r'<c r="([A-Z]+[0-9]+)"([^>]*)>(<f[^>]*/>|<f[^>]*>[^<]*</f>)(?:<v\s*/>|<v></v>)')
+
+# A value Excel would show as an error, or that depends on something we do not evaluate
+UNKNOWN = object()
+
+
+def _operand(value):
+    """Value of a cell used in arithmetic, blank counts as 0 like in Excel"""
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return UNKNOWN
+
+
+def _listed_vendors(workbook: Workbook):
+    if "DATA" not in workbook.sheetnames:
+        return []
+    vendors = [vendor for (vendor,) in workbook["DATA"].iter_rows(max_col=1, values_only=True) if vendor]
+    return [vendor for vendor in vendors if vendor in workbook.sheetnames]
+
+
+def _evaluate_vendor_sheet(worksheet, sheet_values: dict, item_prices: dict):
+    """Evaluate the G (total) and J (price/unit) row formulas, and collect the J values per item name"""
+    for row, values in enumerate(worksheet.iter_rows(max_col=10, values_only=True), 1):
+        values = values + (None,) * (10 - len(values))
+        name, quantity, cost, total, isi, per_unit = values[1], values[3], values[5], values[6], values[7], values[9]
+
+        if total == f"=D{row}*F{row}":
+            quantity, cost = _operand(quantity), _operand(cost)
+            total = UNKNOWN if UNKNOWN in (quantity, cost) else quantity * cost
+            if total is not UNKNOWN:
+                sheet_values[f"G{row}"] = total
+        else:
+            total = _operand(total)
+
+        if per_unit == f"=G{row}/H{row}":
+            isi = _operand(isi)
+            per_unit = UNKNOWN if UNKNOWN in (total, isi) or not isi else total / isi
+            if per_unit is not UNKNOWN:
+                sheet_values[f"J{row}"] = per_unit
+        elif per_unit is not None:
+            per_unit = _operand(per_unit)
+
+        if name is not None:
+            # SUMIF and MAXIFS criteria ignore case
+            item_prices.setdefault(str(name).lower(), []).append(per_unit)
+
+
+def _category_formula_text(worksheet, coordinate, shared_masters):
+    value = worksheet[coordinate].value
+    attributes = worksheet.formula_attributes.get(coordinate, {})
+    if value == "=" and attributes.get("t") == "shared":
+        master = shared_masters.get(attributes.get("si"))
+        return Translator(*master).translate_formula(coordinate) if master else ""
+    return value if isinstance(value, str) and value.startswith("=") else ""
+
+
+def _app_formulas(row, builders):
+    """Formula texts the app writes for a category row -> whether they add the carried totals"""
+    return {builder(row, carry): carry for builder in builders for carry in (False, True)}
+
+
+def _evaluate_category_sheet(worksheet, sheet_values: dict, item_prices: dict, carry: dict):
+    """Evaluate the D (average) and E (max) price formulas from the collected vendor prices, adding the carried
+    totals of archived rows when the formula refers to them. Only formulas exactly as the app writes them for their
+    row are evaluated, anything typed over them is left to Excel."""
+    shared_masters = {
+        attributes["si"]: (worksheet[coordinate].value, coordinate)
+        for coordinate, attributes in worksheet.formula_attributes.items()
+        if attributes.get("t") == "shared" and "ref" in attributes
+    }
+    for row, (name,) in enumerate(worksheet.iter_rows(min_row=3, max_col=1, values_only=True), 3):
+        if name is None:
+            continue
+        prices = item_prices.get(str(name).lower(), [])
+        if UNKNOWN in prices:
+            continue
+        numbers = [price for price in prices if price is not None]
+        carried = carry.get(str(name).lower())
+
+        average_formulas = _app_formulas(row, (get_avg_price_formula, get_consolidated_avg_formula))
+        adds_carry = average_formulas.get(_category_formula_text(worksheet, f"D{row}", shared_masters))
+        if adds_carry is not None:
+            # Sum of the prices over the count of purchase rows, blank prices count as 0
+            total, count = sum(numbers), len(prices)
+            if carried and adds_carry:
+                total, count = total + carried.total, count + carried.count
+            if count:
+                sheet_values[f"D{row}"] = total / count
+
+        max_formulas = _app_formulas(
+            row, (get_max_price_formula, get_shared_max_price_formula, get_consolidated_max_formula)
+        )
+        adds_carry = max_formulas.get(_category_formula_text(worksheet, f"E{row}", shared_masters))
+        if adds_carry is not None:
+            if carried and adds_carry:
+                numbers.append(carried.max)
+            sheet_values[f"E{row}"] = max(numbers, default=0)
+
+
+def evaluate_formulas(workbook: Workbook, categories: dict) -> dict[str, dict[str, float]]:
+    """Values of the formulas this app writes: the vendor G/J row formulas and the category average/max formulas.
+
+    Everything is computed in one pass over the vendor sheets listed in DATA. Cells whose inputs we cannot evaluate
+    (typed formulas, text, division by zero) are left out, Excel calculates those when the file is opened. Without
+    any listed vendor nothing is cached, the category formulas then refer to a Vendors range Excel cannot resolve.
+
+    :param categories: category config, only its category sheets are evaluated
+    :return: sheet name -> coordinate -> value
+    """
+    vendors = _listed_vendors(workbook)
+    if not vendors:
+        return {}
+    values = {}
+    item_prices = {}
+    carry = read_carry(workbook)
+    for vendor in vendors:
+        values[vendor] = {}
+        _evaluate_vendor_sheet(workbook[vendor], values[vendor], item_prices)
+
+    for category in categories["CATEGORIES"]:
+        if category in values or category not in workbook.sheetnames:
+            continue
+        values[category] = {}
+        _evaluate_category_sheet(workbook[category], values[category], item_prices, carry)
+    return {sheet_name: sheet_values for sheet_name, sheet_values in values.items() if sheet_values}
+
+
+def _fill_cached_values(sheet_xml: str, sheet_values: dict) -> str:
+    def fill(match):
+        value = sheet_values.get(match.group(1))
+        if value is None:
+            return match.group(0)
+        return f'<c r="{match.group(1)}"{match.group(2)}>{match.group(3)}<v>{value!r}</v>'
+
+    return FORMULA_CELL.sub(fill, sheet_xml)
+
+
+def write_cached_values(path, values: dict[str, dict[str, float]], compresslevel=None):
+    """Put evaluated formula values into a saved xlsx, as the cached values Excel would have stored"""
+    if not values:
+        return
+    logger = getLogger(LOGGER_NAME)
+    directory, name = os.path.split(os.path.abspath(path))
+    temp_fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f"~{name}.", suffix=".tmp")
+    os.close(temp_fd)
+    try:
+        with ZipFile(path) as source, ZipFile(
+            temp_path, "w", ZIP_DEFLATED, allowZip64=True, compresslevel=compresslevel
+        ) as target:
+            parts = {part: values[sheet_name] for sheet_name, part in sheet_parts(source) if sheet_name in values}
+            for info in source.infolist():
+                data = source.read(info.filename)
+                if info.filename in parts:
+                    data = _fill_cached_values(data.decode("utf-8"), parts[info.filename]).encode("utf-8")
+                target.writestr(info, data, compress_type=info.compress_type)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    logger.debug(f"Cached {sum(len(sheet_values) for sheet_values in values.values())} formula values")
@@ -1,19 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
+from dataclasses import replace
+from datetime import datetime
 from logging import getLogger
+from pathlib import Path
 
 import openpyxl
 from openpyxl.utils import column_index_from_string
 from openpyxl.workbook.workbook import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.workbook.defined_name import DefinedName
-from openpyxl.styles import Font
-
-from core.constants import ExcelItem, DATE_FORMAT, COMMA_FORMAT, RP_FORMAT, ITEM_INPUT_FORMAT, LOGGER_NAME
-from core.utils import get_skip_list
-
-
-def create_data_sheet(file, wb: Workbook, vendor_sheets):
-    """Create named range of all vendors to count from. Overwrites any previous data and named range if sheet exists."""
+from openpyxl.styles import Font, NamedStyle
+
+from core.constants import (
+    ExcelItem,
+    DATE_FORMAT,
+    COMMA_FORMAT,
+    RP_FORMAT,
+    ITEM_INPUT_FORMAT,
+    LOGGER_NAME,
+    DATE_STYLE,
+    COMMA_STYLE,
+    RP_STYLE,
+    HEADER_STYLE,
+    SHARED_FORMULAS,
+    CONSOLIDATED_PURCHASES,
+    PURCHASES_SHEET,
+    CARRY_SHEET,
+)
+from core.utils import get_skip_list, get_category_config
+from core.rolling import RollingAverages, get_rolling_averages
+from core.preflight import PreflightError, normalize_category, preflight_scan
+from core.checkpoint import InitCheckpoint
+from core.archive import archive_path, archive_workbook_rows, read_carry
+from core.workbook_io import WorkbookLock, locked_update, save_workbook
+from core.formulas import (
+    get_avg_price_formula,
+    get_max_price_formula,
+    get_consolidated_avg_formula,
+    get_consolidated_max_formula,
+    get_shared_max_price_formula,
+)
+
+
+def create_data_sheet(wb: Workbook, vendor_sheets):
+    """Create named range of all vendors to count from. Overwrites any previous data and named range if sheet exists.
+
+    Left alone when DATA and the range already list exactly these vendors, so Excel has nothing to recalculate.
+    """
     logger = getLogger(LOGGER_NAME)
+    if vendor_range_matches(wb, vendor_sheets):
+        logger.debug("Vendor list unchanged, keeping DATA")
+        return
     if "DATA" in wb.sheetnames:
         logger.debug("Clearing old DATA sheet")
         wb.remove(wb["DATA"])
@@ -22,12 +60,146 @@ def create_data_sheet(file, wb: Workbook, vendor_sheets):
 
     for row, vendor in enumerate(vendor_sheets):
         data_sheet[f"A{row+1}"] = vendor
-    new_range = DefinedName("Vendors", attr_text=f'DATA!$A$1:$A${len(vendor_sheets)}')
-    logger.debug(f"Created Vendor range: DATA!$A$1:$A${len(vendor_sheets)}")
+    set_vendor_range(wb, len(vendor_sheets))
+
+
+def vendor_range_text(vendor_count):
+    return f"DATA!$A$1:$A${vendor_count}"
+
+
+def set_vendor_range(wb: Workbook, vendor_count):
+    logger = getLogger(LOGGER_NAME)
+    new_range = DefinedName("Vendors", attr_text=vendor_range_text(vendor_count))
+    logger.debug(f"Created Vendor range: {vendor_range_text(vendor_count)}")
     # Delete and add new named range
     wb.defined_names.delete("Vendors")
     wb.defined_names.append(new_range)
-    wb.save(file)
+
+
+def listed_vendors(wb: Workbook) -> list:
+    vendors = [vendor for (vendor,) in wb["DATA"].iter_rows(min_col=1, max_col=1, values_only=True)]
+    while vendors and vendors[-1] is None:
+        vendors.pop()
+    return vendors
+
+
+def vendor_range_matches(wb: Workbook, vendor_sheets):
+    """Check DATA and the Vendors range already list these vendors, in this order"""
+    vendors_range = wb.defined_names.get("Vendors")
+    if "DATA" not in wb.sheetnames or vendors_range is None:
+        return False
+    if vendors_range.attr_text != vendor_range_text(len(vendor_sheets)):
+        return False
+    return listed_vendors(wb) == list(vendor_sheets)
+
+
+def extend_vendor_range(wb: Workbook, vendor, categories: dict):
+    """Add a new vendor to the end of DATA and grow the Vendors range by one, without rebuilding either"""
+    logger = getLogger(LOGGER_NAME)
+    if "DATA" not in wb.sheetnames:
+        create_data_sheet(wb, [sheet_name for sheet_name in wb.sheetnames if categories.is_vendor_sheet(sheet_name)])
+        return
+    vendors = listed_vendors(wb)
+    if vendor in vendors:
+        return
+    logger.debug(f"Adding {vendor} to the Vendors range")
+    wb["DATA"][f"A{len(vendors) + 1}"] = vendor
+    set_vendor_range(wb, len(vendors) + 1)
+
+
+def create_vendor_sheet(wb: Workbook, vendor, categories: dict):
+    """Create a vendor sheet with the header rows of the first existing vendor sheet, and add it to the range"""
+    logger = getLogger(LOGGER_NAME)
+    logger.info(f"Creating vendor sheet {vendor}")
+    vendor_sheets = [sheet_name for sheet_name in wb.sheetnames if categories.is_vendor_sheet(sheet_name)]
+    new_sheet = wb.create_sheet(vendor)
+    if vendor_sheets:
+        template = wb[vendor_sheets[0]]
+        for row in template.iter_rows(max_row=2):
+            for cell in row:
+                new_cell = new_sheet.cell(cell.row, cell.column, cell.value)
+                new_cell._style = copy(cell._style)
+        for merged_range in template.merged_cells.ranges:
+            if merged_range.max_row <= 2:
+                new_sheet.merge_cells(merged_range.coord)
+        for column, dimension in template.column_dimensions.items():
+            new_sheet.column_dimensions[column].width = dimension.width
+    extend_vendor_range(wb, vendor, categories)
+    return new_sheet
+
+
+def add_vendor(file, vendor, categories: dict):
+    """Add a vendor sheet to the workbook file. Purchases are only written to vendors that have their sheet.
+
+    :raises ValueError: if the name cannot be a vendor sheet
+    :return: False if the vendor already had its sheet
+    """
+    vendor = vendor.strip()
+    if not vendor or not categories.is_vendor_sheet(vendor):
+        raise ValueError(f"'{vendor}' cannot be a vendor sheet")
+    if len(vendor) > 31 or any(char in vendor for char in "[]:*?/\\"):
+        raise ValueError(f"'{vendor}' cannot be a sheet name, keep it under 32 characters without []:*?/\\")
+
+    def create_if_missing(workbook):
+        if vendor in workbook.sheetnames:
+            return False
+        create_vendor_sheet(workbook, vendor, categories)
+        return True
+
+    return locked_update(file, create_if_missing, categories=categories, sheets={vendor})
+
+
+def create_purchases_sheet(workbook: Workbook):
+    """Create the hidden consolidated purchases sheet, replacing any previous one"""
+    logger = getLogger(LOGGER_NAME)
+    if PURCHASES_SHEET in workbook.sheetnames:
+        logger.debug(f"Clearing old {PURCHASES_SHEET} sheet")
+        workbook.remove(workbook[PURCHASES_SHEET])
+    register_named_styles(workbook)
+    purchases_sheet = workbook.create_sheet(PURCHASES_SHEET)
+    purchases_sheet.sheet_state = "hidden"
+    for column, header in zip("ABCDE", ("ITEM", "VENDOR", "DATE", "PRICE/UNIT", "CATEGORY")):
+        purchases_sheet[f"{column}1"] = header
+        purchases_sheet[f"{column}1"].style = HEADER_STYLE
+    set_purchase_ranges(workbook)
+
+
+def set_purchase_ranges(workbook: Workbook):
+    """Point the PurchaseItems and PurchasePrices names at the filled rows of the purchases sheet"""
+    last_row = max(workbook[PURCHASES_SHEET].max_row, 2)
+    for name, column in (("PurchaseItems", "A"), ("PurchasePrices", "D")):
+        workbook.defined_names.delete(name)
+        workbook.defined_names.append(
+            DefinedName(name, attr_text=f"'{PURCHASES_SHEET}'!${column}$2:${column}${last_row}")
+        )
+
+
+def add_purchase_record(workbook: Workbook, vendor, vendor_row, category):
+    """Add one purchase to the purchases sheet. Item, date and price refer back to the vendor sheet row, so edits
+    made there in Excel still count."""
+    purchases_sheet = workbook[PURCHASES_SHEET]
+    purchases_sheet.append(
+        [f"='{vendor}'!B{vendor_row}", vendor, f"='{vendor}'!A{vendor_row}", f"='{vendor}'!J{vendor_row}", category]
+    )
+    row = purchases_sheet.max_row
+    purchases_sheet[f"C{row}"].style = DATE_STYLE
+    purchases_sheet[f"D{row}"].style = RP_STYLE
+
+
+def fill_purchases_sheet(workbook: Workbook, vendor_sheets, categories: dict):
+    """Add every purchase row of the vendor sheets, filed under the category the item is listed in"""
+    item_categories = {}
+    for category in categories["CATEGORIES"]:
+        for (name,) in workbook[category].iter_rows(min_row=3, max_col=1, values_only=True):
+            if name:
+                item_categories.setdefault(name, category)
+
+    for vendor in vendor_sheets:
+        vendor_sheet = workbook[vendor]
+        for row, (name,) in enumerate(vendor_sheet.iter_rows(min_row=3, min_col=2, max_col=2, values_only=True), 3):
+            if name:
+                add_purchase_record(workbook, vendor, row, item_categories.get(name))
+    set_purchase_ranges(workbook)
 
 
 def clean_item_names(vendor_sheet: Worksheet):
@@ -45,36 +217,98 @@ def clean_item_names(vendor_sheet: Worksheet):
     return vendor_sheet
 
 
+def register_named_styles(workbook: Workbook):
+    """Add the app's named styles to the workbook if missing. Cells then share one style entry per format."""
+    existing_styles = set(workbook.named_styles)
+    for style in (
+        NamedStyle(name=DATE_STYLE, number_format=DATE_FORMAT),
+        NamedStyle(name=COMMA_STYLE, number_format=COMMA_FORMAT),
+        NamedStyle(name=RP_STYLE, number_format=RP_FORMAT),
+        NamedStyle(name=HEADER_STYLE, font=Font(bold=True)),
+    ):
+        if style.name not in existing_styles:
+            workbook.add_named_style(style)
+
+
 def create_category_sheet(workbook, category):
     logger = getLogger(LOGGER_NAME)
     logger.info(f"Creating {category} in workbook")
 
+    register_named_styles(workbook)
     workbook.create_sheet(category)
     new_sheet: Worksheet = workbook[category]
 
     new_sheet["A1"] = "ITEM"
-    new_sheet["A1"].font = Font(bold=True)
+    new_sheet["A1"].style = HEADER_STYLE
     new_sheet.merge_cells("A1:A2")
 
     new_sheet["B1"] = "UNIT BELI"
-    new_sheet["B1"].font = Font(bold=True)
+    new_sheet["B1"].style = HEADER_STYLE
     new_sheet.merge_cells("B1:B2")
 
     new_sheet["C1"] = "UNIT ISI"
-    new_sheet["C1"].font = Font(bold=True)
+    new_sheet["C1"].style = HEADER_STYLE
     new_sheet.merge_cells("C1:C2")
 
     new_sheet["D1"] = "MOV AVER"
-    new_sheet["D1"].font = Font(bold=True)
+    new_sheet["D1"].style = HEADER_STYLE
     new_sheet["D2"] = "PRICE/UNIT"
-    new_sheet["D2"].font = Font(bold=True)
+    new_sheet["D2"].style = HEADER_STYLE
 
 
-def init_catsheet(file, categories: dict):
-    """Clear out category sheets and recreate the entries"""
+def check_vendor_rows(file, categories: dict):
+    """Raise PreflightError before any slow work when vendor rows have problems init would fail on. Warnings are
+    only logged."""
     logger = getLogger(LOGGER_NAME)
+    problems = preflight_scan(file, categories)
+    for problem in problems:
+        logger.warning(problem)
+    errors = [problem for problem in problems if not problem.warning]
+    if errors:
+        raise PreflightError(errors)
+
+
+def init_catsheet(file, categories: dict, preflight=True):
+    """Clear out category sheets and recreate the entries
+
+    :param preflight: scan the vendor rows first, and do nothing if any have problems
+    """
+    logger = getLogger(LOGGER_NAME)
+    if preflight:
+        check_vendor_rows(file, categories)
+    rolling = get_rolling_averages(file)
+
+    def init_with_checkpoint(input_wb):
+        # Fingerprinted under the lock, so it matches the file this run reads
+        checkpoint = InitCheckpoint(file)
+        checkpoint.load()
+        init_catsheet_workbook(input_wb, categories, rolling=rolling, checkpoint=checkpoint)
+        return checkpoint
+
     # Due to openpyxl's structure, we need the data_only=False wb to save formula
-    input_wb = openpyxl.load_workbook(file, data_only=False)
+    checkpoint = locked_update(file, init_with_checkpoint, categories=categories)
+    rolling.saved(file)
+    checkpoint.clear()
+    logger.info("All done with init")
+
+
+def init_catsheet_workbook(
+    input_wb: Workbook,
+    categories: dict,
+    shared_formulas=SHARED_FORMULAS,
+    consolidated=CONSOLIDATED_PURCHASES,
+    rolling: RollingAverages = None,
+    checkpoint: InitCheckpoint = None,
+):
+    """Clear out category sheets and recreate the entries of an already loaded workbook. Does not save.
+
+    :param consolidated: rebuild the hidden purchases sheet and point the category formulas at it. Always done when
+        the workbook already has the sheet.
+    :param rolling: rolling averages engine to rebuild, a throwaway one by default
+    :param checkpoint: records progress after every vendor sheet, and skips the sheets it already holds
+    """
+    logger = getLogger(LOGGER_NAME)
+    register_named_styles(input_wb)
     clean_category_sheets(categories, input_wb)
     logger.debug("Finished Clearing Category Sheets")
     # default dict
@@ -84,8 +318,17 @@ def init_catsheet(file, categories: dict):
     # Iterate over all vendor sheets
     vendor_sheets = [_ for _ in input_wb.sheetnames if _ not in skip_list]
     logger.debug("Creating Datasheet")
-    create_data_sheet(file, input_wb, vendor_sheets)
+    create_data_sheet(input_wb, vendor_sheets)
     logger.debug(f"VENDORS: {vendor_sheets}")
+    consolidated = consolidated or PURCHASES_SHEET in input_wb.sheetnames
+    if consolidated:
+        # Created first so init_formula picks the consolidated formulas
+        create_purchases_sheet(input_wb)
+    completed_sheets = set(checkpoint.completed_sheets) if checkpoint else set()
+    for category_item in checkpoint.category_items if checkpoint else ():
+        init_formula(ExcelItem(**category_item), input_wb)
+        done_set.add(category_item["name"])
+
     for sheet_name in vendor_sheets:
         if not sheet_name:
             continue
@@ -94,6 +337,11 @@ def init_catsheet(file, categories: dict):
         logger.info(f"Sheet: {sheet}")
 
         clean_sheet = clean_item_names(sheet)
+        if sheet_name in completed_sheets:
+            logger.info(f"{sheet_name} was completed by an earlier run, skipping")
+            continue
+
+        new_category_items = []
         vendor_items = next(clean_sheet.iter_cols(min_col=2, max_col=2, min_row=3, values_only=True))
         for item in vendor_items:
             if not item or item in done_set:
@@ -104,7 +352,7 @@ def init_catsheet(file, categories: dict):
             logger.debug(f"Look for '{item}' in {sheet_name}")
             row = vendor_items.index(item) + 3
             logger.debug(f"ROW: {row}, ITEM: {item}")
-            excel_item = row_to_excel_item(clean_sheet, row)
+            excel_item = row_to_excel_item(clean_sheet, row, categories)
 
             # Check if item is already in cat sheet
             category_items = next(input_wb[excel_item.category].iter_cols(1, 1, values_only=True))
@@ -115,13 +363,47 @@ def init_catsheet(file, categories: dict):
             logger.info(f"Appending {excel_item.name} to {excel_item.category}")
             update_cat_avg(excel_item, input_wb)
             done_set.add(item)
-    input_wb.save(file)
-    input_wb.close()
-    logger.info("All done with init")
-
-
-def row_to_excel_item(sheet: Worksheet, row):
-    """Try to get data from row with clean up. If missing data, give defaults"""
+            new_category_items.append(
+                {
+                    "category": excel_item.category,
+                    "name": excel_item.name,
+                    "unit_beli": excel_item.unit_beli,
+                    "unit_isi": excel_item.unit_isi,
+                }
+            )
+
+        if checkpoint:
+            checkpoint.sheet_done(sheet_name, new_category_items)
+
+    # Items whose purchases were all archived are only left in the carry sheet
+    for carry in read_carry(input_wb).values():
+        if carry.name not in done_set and carry.category in categories["CATEGORIES"]:
+            logger.info(f"Appending archived {carry.name} to {carry.category}")
+            init_formula(
+                ExcelItem(name=carry.name, unit_beli=carry.unit_beli, unit_isi=carry.unit_isi, category=carry.category),
+                input_wb,
+            )
+            done_set.add(carry.name)
+
+    if consolidated:
+        logger.debug(f"Filling {PURCHASES_SHEET}")
+        fill_purchases_sheet(input_wb, vendor_sheets, categories)
+
+    logger.debug("Writing rolling averages")
+    rolling = rolling or RollingAverages()
+    rolling.reset()
+    rolling.sync(input_wb, skip_list)
+    rolling.write_to_categories(input_wb, categories)
+
+    if shared_formulas:
+        share_workbook_formulas(input_wb, categories)
+
+
+def row_to_excel_item(sheet: Worksheet, row, categories: dict = None):
+    """Try to get data from row with clean up. If missing data, give defaults
+
+    :param categories: fix known category typos against these categories
+    """
     logger = getLogger(LOGGER_NAME)
 
     item_name = sheet[f"B{row}"].value
@@ -147,9 +429,13 @@ def row_to_excel_item(sheet: Worksheet, row):
     except IndexError:
         logger.error("Error getting Category, assigning Fresh")
         category_value = "Fresh"
+    if categories:
+        category_value = normalize_category(category_value, categories["CATEGORIES"]) or category_value
 
     logger.debug(f"Category: {category_value}")
-    return ExcelItem(name=item_name, vendor=sheet_title, unit_isi=unit_isi, unit_beli=unit_beli, category=category_value)
+    return ExcelItem(
+        name=item_name, vendor=sheet_title, unit_isi=unit_isi, unit_beli=unit_beli, category=category_value
+    )
 
 
 def clean_category_sheets(category_dict, input_wb):
@@ -170,7 +456,7 @@ def clean_category_sheets(category_dict, input_wb):
         category_sheet.delete_rows(3, max_row)
 
 
-def write_to_excel(date, file, excel_item: ExcelItem):
+def write_to_excel(date, file, excel_item: ExcelItem, categories: dict):
     """Write the given data to the purchasing Excel sheet.
 
     :param str date: date of purchase
@@ -178,18 +464,77 @@ def write_to_excel(date, file, excel_item: ExcelItem):
     :param excel_item: ExcelItem with data
     :type excel_item: ExcelItem
     """
+    excel_item = replace(excel_item, date=date)
+    # Need the data_only=False wb to save formula
+    rolling = get_rolling_averages(file)
+    locked_update(
+        file,
+        lambda input_wb: append_purchases(input_wb, [excel_item], categories, rolling=rolling),
+        categories=categories,
+        sheets=purchase_sheets([excel_item]),
+    )
+    rolling.saved(file)
+
+
+def write_batch_to_excel(file, excel_items: list[ExcelItem], categories: dict):
+    """Write a batch of purchases with one load and one save. Each ExcelItem carries its own date.
+
+    :param str file: file path to Excel sheet to edit
+    :param excel_items: ExcelItems with data
+    """
     logger = getLogger(LOGGER_NAME)
+    logger.info(f"Writing batch of {len(excel_items)} items")
 
-    # Load Excel file path
-    # Need the data_only=False wb to save formula
-    input_wb = openpyxl.load_workbook(file, data_only=False)
+    rolling = get_rolling_averages(file)
+    locked_update(
+        file,
+        lambda input_wb: append_purchases(input_wb, excel_items, categories, rolling=rolling),
+        categories=categories,
+        sheets=purchase_sheets(excel_items),
+    )
+    rolling.saved(file)
+
+
+def purchase_sheets(excel_items: list[ExcelItem]) -> set[str]:
+    """Sheets appending these purchases writes to, for update_workbook to tell whether anything changed"""
+    return {excel_item.vendor for excel_item in excel_items} | {excel_item.category for excel_item in excel_items}
 
-    # Create vendor sheet if new
+
+def append_purchases(
+    input_wb: Workbook,
+    excel_items: list[ExcelItem],
+    categories: dict,
+    shared_formulas=SHARED_FORMULAS,
+    rolling: RollingAverages = None,
+):
+    """Append a batch of purchases to a loaded workbook. Each ExcelItem carries its own date.
+
+    :param rolling: rolling averages engine of the workbook file, its averages are updated for the new rows
+    """
+    for excel_item in excel_items:
+        append_purchase(input_wb, excel_item.date, excel_item)
+
+    if rolling:
+        rolling.write_to_categories(input_wb, categories, rolling.sync(input_wb, categories.skip_set))
+
+    # openpyxl expands shared formulas when loading, so they are shared again before every save
+    if shared_formulas:
+        share_workbook_formulas(input_wb, categories)
+
+
+def append_purchase(input_wb: Workbook, date, excel_item: ExcelItem):
+    """Append one purchase row to its vendor sheet in a loaded workbook, and add the item to its category if new"""
+    logger = getLogger(LOGGER_NAME)
+    register_named_styles(input_wb)
+
+    # New vendors are added with add_vendor first, a typo should not become a vendor sheet
+    if excel_item.vendor not in input_wb.sheetnames:
+        raise ValueError(f"No sheet for vendor '{excel_item.vendor}', add the vendor first")
     input_vendor = input_wb[excel_item.vendor]
     input_row = input_vendor.max_row + 1
 
     # iterate backwards until last_row is after a row with data
-    while not input_vendor[f"B{input_row-1}"].value:
+    while input_row > 3 and not input_vendor[f"B{input_row-1}"].value:
         input_row -= 1
 
     # Hard coded minimum to not clash with merged cells:
@@ -209,27 +554,29 @@ def write_to_excel(date, file, excel_item: ExcelItem):
         input_vendor[f"{column}{input_row}"] = getattr(excel_item, ITEM_INPUT_FORMAT[column])
 
     # format cells for Rupiah
-    logger.debug("Assigning format strings")
+    logger.debug("Assigning named styles")
     date_cell = input_vendor.cell(input_row, column_index_from_string("A"))
-    date_cell.number_format = DATE_FORMAT
+    date_cell.style = DATE_STYLE
 
     cost_cell = input_vendor.cell(input_row, column_index_from_string("F"))
-    cost_cell.number_format = RP_FORMAT
+    cost_cell.style = RP_STYLE
 
     total_cell = input_vendor.cell(input_row, column_index_from_string("G"))
-    total_cell.number_format = RP_FORMAT
+    total_cell.style = RP_STYLE
 
     isi_cell = input_vendor.cell(input_row, column_index_from_string("H"))
-    isi_cell.number_format = COMMA_FORMAT
+    isi_cell.style = COMMA_STYLE
 
     per_unit_cell = input_vendor.cell(input_row, column_index_from_string("J"))
-    per_unit_cell.number_format = RP_FORMAT
+    per_unit_cell.style = RP_STYLE
+
+    if PURCHASES_SHEET in input_wb.sheetnames:
+        add_purchase_record(input_wb, excel_item.vendor, input_row, excel_item.category)
+        set_purchase_ranges(input_wb)
 
     logger.debug(f"Assigning {excel_item.name} to {excel_item.category}")
     update_cat_avg(excel_item, input_wb)
 
-    input_wb.save(file)
-
 
 def update_cat_avg(excel_item, workbook):
     """Calculate average price for each item, total quantity, total units.
@@ -250,14 +597,50 @@ def update_cat_avg(excel_item, workbook):
         logger.debug(f"Item: {excel_item.name} already entered.")
 
 
-def get_avg_price_formula(row):
-    return f"""=SUMPRODUCT(SUMIF(INDIRECT("'"&Vendors&"'!"&"B:B"),A{row}, INDIRECT("'"&Vendors&"'!"&"J:J"))) \
-/ SUMPRODUCT(COUNTIF(INDIRECT("'"&Vendors&"'!"&"B:B"), A{row}))
-"""
+def share_category_formulas(ws: Worksheet, first_row=3):
+    """Store the D/E formulas of a category sheet as one shared formula per column.
+
+    Only the first row keeps the formula text, the other rows refer to it, so the sheet XML no longer holds a copy of
+    the long INDIRECT formulas per item. Covers the item rows from first_row down to the first empty name.
+    """
+    last_row = first_row - 1
+    for (name,) in ws.iter_rows(min_row=first_row, max_col=1, values_only=True):
+        if not name:
+            break
+        last_row += 1
+    if last_row < first_row:
+        return
+
+    if PURCHASES_SHEET in ws.parent.sheetnames:
+        formula_funcs = (("D", get_consolidated_avg_formula), ("E", get_consolidated_max_formula))
+    else:
+        formula_funcs = (("D", get_avg_price_formula), ("E", get_shared_max_price_formula))
+    carry = CARRY_SHEET in ws.parent.sheetnames
+
+    used_ids = {int(attributes["si"]) for attributes in ws.formula_attributes.values() if "si" in attributes}
+    next_id = max(used_ids, default=-1) + 1
+    for column, formula_func in formula_funcs:
+        shared_id = str(next_id)
+        next_id += 1
+        ws[f"{column}{first_row}"] = formula_func(first_row, carry)
+        ws.formula_attributes[f"{column}{first_row}"] = {
+            "t": "shared",
+            "ref": f"{column}{first_row}:{column}{last_row}",
+            "si": shared_id,
+        }
+        for row in range(first_row + 1, last_row + 1):
+            cell = ws[f"{column}{row}"]
+            # Empty formula text, Excel fills it in from the first row
+            cell._value = "="
+            cell.data_type = "f"
+            cell.style = RP_STYLE
+            ws.formula_attributes[cell.coordinate] = {"t": "shared", "si": shared_id}
 
 
-def get_max_price_formula(row):
-    return f"""=MAX(MAXIFS(INDIRECT("'"&Vendors&"'!"&"J:J"), INDIRECT("'"&Vendors&"'!"&"B:B"), A{row}))"""
+def share_workbook_formulas(workbook: Workbook, categories: dict):
+    for category in categories["CATEGORIES"]:
+        if category in workbook.sheetnames:
+            share_category_formulas(workbook[category])
 
 
 def init_formula(excel_item: ExcelItem, workbook, row=None):
@@ -274,77 +657,218 @@ def init_formula(excel_item: ExcelItem, workbook, row=None):
         workbook[category].append({"A": excel_item.name, "B": excel_item.unit_beli, "C": excel_item.unit_isi})
         row = workbook[category].max_row
     row = row if row > 3 else 3
+    write_item_formulas(ws, row)
 
-    ws[f"D{row}"] = get_avg_price_formula(row)
-    ws[f"D{row}"].number_format = RP_FORMAT
 
-    ws[f"E{row}"] = get_max_price_formula(row)
-    ws.formula_attributes[f"E{row}"] = {"t": "array", "ref": f"E{row}:E{row}"}
-    ws[f"E{row}"].number_format = RP_FORMAT
+def write_item_formulas(ws: Worksheet, row):
+    """Write the average and max formulas of one category row, for the sheets this workbook has"""
+    carry = CARRY_SHEET in ws.parent.sheetnames
+    if PURCHASES_SHEET in ws.parent.sheetnames:
+        ws[f"D{row}"] = get_consolidated_avg_formula(row, carry)
+        ws[f"E{row}"] = get_consolidated_max_formula(row, carry)
+    else:
+        ws[f"D{row}"] = get_avg_price_formula(row, carry)
+        ws[f"E{row}"] = get_max_price_formula(row, carry)
+        ws.formula_attributes[f"E{row}"] = {"t": "array", "ref": f"E{row}:E{row}"}
+    ws[f"D{row}"].style = RP_STYLE
+    ws[f"E{row}"].style = RP_STYLE
+
 
+def archive_vendor_rows(
+    file, cutoff: datetime, archive_file=None, categories: dict = None, shared_formulas=SHARED_FORMULAS
+) -> int:
+    """Move the vendor rows dated before the cutoff into an archive workbook, so the purchase workbook stays small.
 
-def import_records(old_workbook_path, new_workbook_path, categories: dict):
-    """Check entries from old to new, append any missing to new"""
+    The moved purchases are summed per item into the hidden carry sheet, and the category formulas add those totals
+    to the vendor rows, so the averages and maxes stay the same. Rolling averages only see the rows left behind.
+
+    :param archive_file: workbook to append the rows to, created if missing. Next to the file by default.
+    :return: number of rows moved
+    """
+    logger = getLogger(LOGGER_NAME)
+    categories = categories or get_category_config()
+    archive_file = Path(archive_file or archive_path(file))
+
+    def move_rows(input_wb):
+        vendor_sheets = [sheet_name for sheet_name in input_wb.sheetnames if sheet_name not in get_skip_list()]
+        register_named_styles(input_wb)
+        with WorkbookLock(archive_file):
+            if archive_file.exists():
+                archive_wb = openpyxl.load_workbook(archive_file)
+            else:
+                archive_wb = openpyxl.Workbook()
+                archive_wb.remove(archive_wb.active)
+            moved = archive_workbook_rows(input_wb, archive_wb, vendor_sheets, cutoff, categories["CATEGORIES"])
+            if not moved:
+                return 0
+            # Saved first, so a crash before the purchase workbook is saved leaves the rows in both, not in neither
+            save_workbook(archive_wb, archive_file)
+            archive_wb.close()
+
+        if PURCHASES_SHEET in input_wb.sheetnames:
+            # Purchase records refer to the vendor rows by number
+            create_purchases_sheet(input_wb)
+            fill_purchases_sheet(input_wb, vendor_sheets, categories)
+        if shared_formulas:
+            share_workbook_formulas(input_wb, categories)
+        else:
+            for category in categories["CATEGORIES"]:
+                if category not in input_wb.sheetnames:
+                    continue
+                category_sheet = input_wb[category]
+                for row, (name,) in enumerate(category_sheet.iter_rows(min_row=3, max_col=1, values_only=True), 3):
+                    if name:
+                        write_item_formulas(category_sheet, row)
+        return moved
+
+    moved = locked_update(file, move_rows, categories=categories)
+    logger.info(f"Moved {moved} vendor rows dated before {cutoff:%d-%b-%y} to {archive_file}")
+    return moved
+
+
+def import_records(old_workbook_paths, new_workbook_path, categories: dict, streaming=True, preflight=True):
+    """Check entries from old workbooks to new, append any missing to new.
+
+    Several old workbooks can be given, ordered oldest to newest. They are merged one category at a time, where the
+    newest workbook wins for every value it has, and each category is written to the _IMPORT_ sheet before the next
+    one is read. The new workbook is then initialized and saved once.
+
+    :param old_workbook_paths: path, or list of paths ordered oldest to newest
+    :param streaming: read the old workbooks in read-only mode, so memory stays bounded no matter how much history
+        they hold
+    :param preflight: scan the vendor rows of the new workbook first, and do nothing if any have problems
+    """
     logger = getLogger(LOGGER_NAME)
+    if preflight:
+        check_vendor_rows(new_workbook_path, categories)
+    if isinstance(old_workbook_paths, (str, Path)):
+        old_workbook_paths = [old_workbook_paths]
+
+    logger.debug("Transferring items...")
+    locked_update(
+        new_workbook_path,
+        lambda workbook: write_import_sheet(
+            workbook, iter_merged_items(old_workbook_paths, categories, streaming), categories
+        ),
+        categories=categories,
+    )
+    logger.debug("Finished transfer!")
 
-    old_workbook = openpyxl.load_workbook(old_workbook_path, data_only=True)
-    new_workbook = openpyxl.load_workbook(new_workbook_path, data_only=True)
-    new_workbook_input = openpyxl.load_workbook(new_workbook_path, data_only=False)
 
-    try:
-        # Clear out old sheet if exists
-        item_category = new_workbook_input["_IMPORT_"]
-        new_workbook_input.remove(item_category)
-        new_workbook_input.create_sheet("_IMPORT_")
-        item_category = new_workbook_input["_IMPORT_"]
-    except KeyError:
-        new_workbook_input.create_sheet("_IMPORT_")
-        item_category = new_workbook_input["_IMPORT_"]
-
-    # Get item entries as sets
-    logger.debug("Generating item lists...")
-    logger.debug("Getting items from old workbook...")
-    old_cat_items = get_items_in_category(old_workbook, categories)
-    logger.debug("Getting items from new workbook...")
-
-    # Append old items to new workbook
-    for item_name in old_cat_items.keys():
-        logger.debug(f"Found old item: {str(item_name).strip()}")
+def write_import_sheet(new_workbook_input: Workbook, old_items, categories: dict):
+    """Replace the _IMPORT_ sheet with the merged old items, then init the category sheets from it
+
+    :param old_items: item dicts, as iter_merged_items yields them
+    """
+    logger = getLogger(LOGGER_NAME)
+    # Clear out old sheet if exists, the new one takes its place so the sheet order stays the same
+    sheet_index = None
+    if "_IMPORT_" in new_workbook_input.sheetnames:
+        sheet_index = new_workbook_input.sheetnames.index("_IMPORT_")
+        new_workbook_input.remove(new_workbook_input["_IMPORT_"])
+    item_category = new_workbook_input.create_sheet("_IMPORT_", sheet_index)
+
+    # Append old items to new workbook, below the two header rows the init skips on every vendor sheet
+    for row, old_item in enumerate(old_items, start=3):
+        logger.debug(f"Found old item: {str(old_item['name']).strip()}")
         item_column_details = {
-            "B": str(item_name).strip(),
-            "E": old_cat_items[item_name]["unit_beli"],
-            "I": old_cat_items[item_name]["unit_isi"],
-            "J": old_cat_items[item_name]["unit_price"],
-            "K": old_cat_items[item_name]["category"],
+            "B": str(old_item["name"]).strip(),
+            "E": old_item["unit_beli"],
+            "I": old_item["unit_isi"],
+            "J": old_item["unit_price"],
+            "K": old_item["category"],
         }
-        item_category.append(item_column_details)
+        for column, value in item_column_details.items():
+            item_category[f"{column}{row}"] = value
 
-    logger.debug("Saving and beginning init")
-    new_workbook_input.save(new_workbook_path)
-    init_catsheet(new_workbook_path, categories)
-    logger.debug("Finished transfer!")
+    logger.debug("Beginning init")
+    init_catsheet_workbook(new_workbook_input, categories)
 
 
-def get_items_in_category(workbook, categories):
+def iter_merged_items(old_workbook_paths, categories, streaming=True):
+    """Yield the merged items of several workbooks, ordered oldest to newest, one category at a time.
+
+    The workbooks are loaded and read concurrently, and only the category being merged is held in memory.
+    """
     logger = getLogger(LOGGER_NAME)
-    # Get new entries
-    category_items = {}
-    logger.debug("Checking info from workbook")
-    for category in categories["CATEGORIES"]:
+    with ThreadPoolExecutor(max_workers=len(old_workbook_paths) or 1) as executor:
+        workbooks = list(
+            executor.map(
+                lambda path: openpyxl.load_workbook(path, read_only=streaming, data_only=True), old_workbook_paths
+            )
+        )
         try:
-            category_sheet: Worksheet = workbook[category]
-        except KeyError:
-            logger.warning(f"Could not find Worksheet '{category}'. Will skip this.")
+            for category in categories["CATEGORIES"]:
+                logger.debug(f"Merging {category} of {len(workbooks)} workbooks")
+                workbook_items = executor.map(
+                    lambda workbook: first_by_name(iter_category_sheet(workbook, category)), workbooks
+                )
+                yield from merge_category_items(workbook_items).values()
+        finally:
+            for workbook in workbooks:
+                workbook.close()
+
+
+def read_category_items(workbook_path, categories, streaming=True):
+    """Load a workbook and get its category items, keyed by item name"""
+    logger = getLogger(LOGGER_NAME)
+    logger.debug(f"Getting items from {workbook_path}...")
+    workbook = openpyxl.load_workbook(workbook_path, read_only=streaming, data_only=True)
+    try:
+        return get_items_in_category(workbook, categories)
+    finally:
+        workbook.close()
+
+
+def merge_category_items(workbook_items):
+    """Merge item maps ordered oldest to newest. Newer values replace older ones, except empty values."""
+    merged = {}
+    for category_items in workbook_items:
+        for name, item in category_items.items():
+            if not name:
+                continue
+            if name not in merged:
+                merged[name] = dict(item)
+                continue
+            merged[name].update({key: value for key, value in item.items() if value is not None})
+    return merged
+
+
+def first_by_name(items) -> dict[str, dict]:
+    """Items keyed by name, the first entry of a name wins like it does for the category formulas"""
+    items_by_name = {}
+    for item in items:
+        items_by_name.setdefault(item["name"], item)
+    return items_by_name
+
+
+def iter_category_sheet(workbook, category):
+    """Yield the items of one category sheet, only reading the A-D columns.
+
+    Works for read-only workbooks too, where rows are parsed lazily.
+    """
+    try:
+        category_sheet: Worksheet = workbook[category]
+    except KeyError:
+        getLogger(LOGGER_NAME).warning(f"Could not find Worksheet '{category}'. Will skip this.")
+        return
+
+    for name, unit_beli, unit_isi, unit_price in category_sheet.iter_rows(min_row=3, max_col=4, values_only=True):
+        if not name:
             continue
+        yield {
+            "category": category,
+            "name": name,
+            "unit_beli": unit_beli,
+            "unit_isi": unit_isi,
+            "unit_price": unit_price,
+        }
+
 
-        for row in range(3, category_sheet.max_row):
-            item = {
-                "category": category,
-                "name": category_sheet[f"A{row}"].value,
-                "unit_beli": category_sheet[f"B{row}"].value,
-                "unit_isi": category_sheet[f"C{row}"].value,
-                "unit_price": category_sheet[f"D{row}"].value,
-            }
-            category_items[item["name"]] = item
-
-    return category_items
+def get_items_in_category(workbook, categories):
+    """Items of every category sheet keyed by name, the first entry of a name wins"""
+    logger = getLogger(LOGGER_NAME)
+    logger.debug("Checking info from workbook")
+    return first_by_name(
+        item for category in categories["CATEGORIES"] for item in iter_category_sheet(workbook, category)
+    )
@@ -0,0 +1,139 @@
+import csv
+from dataclasses import dataclass
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+
+import openpyxl
+
+from core.constants import LOGGER_NAME, INTERNAL_SHEETS, CARRY_SHEET
+from core.utils import get_category_config
+
+SNAPSHOT_COLUMNS = ("item", "category", "unit_isi", "count", "average", "min", "max", "last", "last_date")
+
+
+@dataclass(slots=True)
+class PriceStats:
+    """Running price figures of one item"""
+
+    item: str
+    category: str = None
+    unit_isi: str = None
+    count: int = 0
+    total: float = 0.0
+    min: float = None
+    max: float = None
+    last: float = None
+    last_date: datetime = None
+
+    def add(self, price, date):
+        self.count += 1
+        self.total += price
+        self.min = price if self.min is None else min(self.min, price)
+        self.max = price if self.max is None else max(self.max, price)
+        # Rows are in entry order, so a later row on the same date is the later purchase
+        if self.last_date is None or (date is not None and date >= self.last_date):
+            self.last = price
+            self.last_date = date
+
+    def add_carried(self, count, total, maximum):
+        """Add purchases moved to the archive workbook, only their count, sum and max are kept"""
+        self.count += count
+        self.total += total
+        self.max = maximum if self.max is None else max(self.max, maximum)
+
+    @property
+    def average(self):
+        return self.total / self.count
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def row_unit_price(quantity, cost, isi, per_unit):
+    """Price per isi unit of a vendor row. Uses the cached J value when Excel saved one, else (D*F)/H like J does."""
+    if _number(per_unit) is not None:
+        return per_unit
+    quantity, cost, isi = _number(quantity), _number(cost), _number(isi)
+    if quantity is None or cost is None or not isi:
+        return None
+    return quantity * cost / isi
+
+
+def price_snapshot(path, categories=None) -> list[PriceStats]:
+    """Per item purchase count, average, min, max and last price per unit, in one streaming pass over the vendor
+    sheets. Reads the stored values only, so nothing waits on Excel recalculating the category formulas."""
+    logger = getLogger(LOGGER_NAME)
+    categories = categories or get_category_config()
+    skip_set = set(categories["CATEGORIES"]) | set(categories["MISC"]) | set(INTERNAL_SHEETS)
+    stats: dict[str, PriceStats] = {}
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet_name in workbook.sheetnames:
+            if sheet_name in skip_set:
+                continue
+            logger.debug(f"Reading prices of {sheet_name}")
+            # A date, B name, D quantity, F cost, H isi, I isi unit, J price/unit, K category
+            for row in workbook[sheet_name].iter_rows(min_row=3, max_col=11, values_only=True):
+                row = row + (None,) * (11 - len(row))
+                date, name, _, quantity, _, cost, _, isi, unit_isi, per_unit, category = row
+                if not name:
+                    continue
+                price = row_unit_price(quantity, cost, isi, per_unit)
+                if price is None:
+                    continue
+                name = " ".join(str(name).split())
+                item_stats = stats.get(name.lower())
+                if item_stats is None:
+                    item_stats = stats[name.lower()] = PriceStats(name)
+                item_stats.category = category or item_stats.category
+                item_stats.unit_isi = unit_isi or item_stats.unit_isi
+                item_stats.add(price, date if isinstance(date, datetime) else None)
+
+        if CARRY_SHEET in workbook.sheetnames:
+            for row in workbook[CARRY_SHEET].iter_rows(min_row=2, max_col=7, values_only=True):
+                row = row + (None,) * (7 - len(row))
+                name, count, total, maximum, category, _, unit_isi = row
+                if not name or not count:
+                    continue
+                item_stats = stats.get(str(name).lower())
+                if item_stats is None:
+                    item_stats = stats[str(name).lower()] = PriceStats(str(name), category, unit_isi)
+                item_stats.add_carried(count, total or 0, maximum or 0)
+    finally:
+        workbook.close()
+
+    logger.info(f"Price snapshot of {len(stats)} items from {path}")
+    return sorted(stats.values(), key=lambda item_stats: item_stats.item.lower())
+
+
+def snapshot_columns(snapshot: list[PriceStats]) -> dict[str, list]:
+    return {column: [getattr(item_stats, column) for item_stats in snapshot] for column in SNAPSHOT_COLUMNS}
+
+
+def write_snapshot(snapshot: list[PriceStats], output_path):
+    """Write the snapshot as CSV, or as Parquet when the output ends in .parquet (needs pyarrow)"""
+    output_path = Path(output_path)
+    columns = snapshot_columns(snapshot)
+    if output_path.suffix.lower() == ".parquet":
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow, export to .csv instead")
+        pyarrow.parquet.write_table(pyarrow.table(columns), output_path)
+        return
+
+    with open(output_path, "w", encoding="utf-8-sig", newline="") as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(SNAPSHOT_COLUMNS)
+        for row in zip(*columns.values()):
+            writer.writerow(value.strftime("%Y-%m-%d") if isinstance(value, datetime) else value for value in row)
+
+
+def export_price_snapshot(workbook_path, output_path, categories=None):
+    snapshot = price_snapshot(workbook_path, categories)
+    write_snapshot(snapshot, output_path)
+    return len(snapshot)
@@ -0,0 +1,45 @@
+"""Category sheet formulas the app writes, shared by the writers and the formula evaluator"""
+
+
+def get_avg_price_formula(row, carry=False):
+    if carry:
+        return get_carry_avg_formula(
+            f"""SUMPRODUCT(SUMIF(INDIRECT("'"&Vendors&"'!"&"B:B"),A{row}, INDIRECT("'"&Vendors&"'!"&"J:J")))""",
+            f"""SUMPRODUCT(COUNTIF(INDIRECT("'"&Vendors&"'!"&"B:B"), A{row}))""",
+            row,
+        )
+    return f"""=SUMPRODUCT(SUMIF(INDIRECT("'"&Vendors&"'!"&"B:B"),A{row}, INDIRECT("'"&Vendors&"'!"&"J:J"))) \
+/ SUMPRODUCT(COUNTIF(INDIRECT("'"&Vendors&"'!"&"B:B"), A{row}))
+"""
+
+
+def get_max_price_formula(row, carry=False):
+    carry_max = f", SUMIF(CarryItems, A{row}, CarryMax)" if carry else ""
+    return f"""=MAX(MAXIFS(INDIRECT("'"&Vendors&"'!"&"J:J"), INDIRECT("'"&Vendors&"'!"&"B:B"), A{row}){carry_max})"""
+
+
+def get_consolidated_avg_formula(row, carry=False):
+    if carry:
+        return get_carry_avg_formula(
+            f"SUMIF(PurchaseItems, A{row}, PurchasePrices)", f"COUNTIF(PurchaseItems, A{row})", row
+        )
+    return f"=AVERAGEIFS(PurchasePrices, PurchaseItems, A{row})"
+
+
+def get_consolidated_max_formula(row, carry=False):
+    # MAXIFS is newer than the file format, Excel only recognises it in a file with its _xlfn prefix
+    if carry:
+        return f"=MAX(_xlfn.MAXIFS(PurchasePrices, PurchaseItems, A{row}), SUMIF(CarryItems, A{row}, CarryMax))"
+    return f"=_xlfn.MAXIFS(PurchasePrices, PurchaseItems, A{row})"
+
+
+def get_shared_max_price_formula(row, carry=False):
+    """Max formula that does not need to be entered as an array formula, so it can be shared.
+    SUMPRODUCT evaluates its argument as an array, like the array formula does."""
+    carry_max = f", SUMIF(CarryItems, A{row}, CarryMax)" if carry else ""
+    return f"""=SUMPRODUCT(MAX(MAXIFS(INDIRECT("'"&Vendors&"'!"&"J:J"), INDIRECT("'"&Vendors&"'!"&"B:B"), A{row}){carry_max}))"""
+
+
+def get_carry_avg_formula(total, count, row):
+    """Average that also counts the purchases moved to the archive workbook, from the carry sheet totals"""
+    return f"=({total} + SUMIF(CarryItems, A{row}, CarrySums)) / ({count} + SUMIF(CarryItems, A{row}, CarryCounts))"
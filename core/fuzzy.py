@@ -0,0 +1,89 @@
+import heapq
+import math
+
+
+def normalize_name(name):
+    """Compare names ignoring case and extra spaces, e.g. "Gula  pasir " is "gula pasir" """
+    return " ".join(str(name).split()).lower()
+
+
+def trigrams(normalized_name):
+    # Padding makes short names and word starts count
+    padded = f"  {normalized_name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Trigram index over catalog item names, to catch near duplicates like "Gulla pasir" before they are added.
+
+    Names are scored by the Dice coefficient of their trigram sets. A lookup only touches the names sharing one of the
+    query's rarer trigrams, so trigrams most names have, like " kg", cost nothing. This stays well under a millisecond
+    for tens of thousands of names.
+    """
+
+    __slots__ = ("_names", "_values", "_grams", "_postings", "_exact")
+
+    def __init__(self, entries=()):
+        """:param entries: (name, value) pairs, the value is handed back with the matches, e.g. the category"""
+        self._names = []
+        self._values = []
+        self._grams: list[frozenset[str]] = []
+        self._postings: dict[str, list[int]] = {}
+        self._exact: dict[str, int] = {}
+        for name, value in entries:
+            self.add(name, value)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name, value=None):
+        normalized = normalize_name(name)
+        if normalized in self._exact:
+            return
+        name_id = len(self._names)
+        self._names.append(name)
+        self._values.append(value)
+        self._exact[normalized] = name_id
+        grams = frozenset(trigrams(normalized))
+        self._grams.append(grams)
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(name_id)
+
+    def exact(self, name):
+        """(name, value) of the catalog name equal to this one after normalizing, or None"""
+        name_id = self._exact.get(normalize_name(name))
+        if name_id is None:
+            return None
+        return self._names[name_id], self._values[name_id]
+
+    def _candidates(self, grams, min_score) -> set[int]:
+        """Names that can score min_score against these trigrams.
+
+        A name of n trigrams needs 2 * shared / (len(grams) + n) >= min_score, so its size is bounded, and it shares at
+        least min_score * len(grams) / (2 - min_score) of the query's trigrams. Any such name has one of the rarest
+        len(grams) - that + 1 of them, the posting lists of the more common trigrams are never read.
+        """
+        if min_score <= 0:
+            return {name_id for gram in grams for name_id in self._postings.get(gram, ())}
+        min_score = min(min_score, 1.0)
+        min_size = len(grams) * min_score / (2 - min_score)
+        max_size = len(grams) * (2 - min_score) / min_score
+        # Rounding slack, so a name exactly at the threshold is not lost
+        min_shared = max(math.ceil(min_size - 1e-9), 1)
+        rarest = sorted(grams, key=lambda gram: len(self._postings.get(gram, ())))
+        candidates = set()
+        for gram in rarest[: len(grams) - min_shared + 1]:
+            for name_id in self._postings.get(gram, ()):
+                if min_size - 1e-9 <= len(self._grams[name_id]) <= max_size + 1e-9:
+                    candidates.add(name_id)
+        return candidates
+
+    def similar(self, name, k=5, min_score=0.5) -> list[tuple[float, str, object]]:
+        """Up to k (score, name, value) of the most similar catalog names, best first. Score 1.0 is the same name."""
+        grams = trigrams(normalize_name(name))
+        scores = (
+            (2 * len(grams & self._grams[name_id]) / (len(grams) + len(self._grams[name_id])), name_id)
+            for name_id in self._candidates(grams, min_score)
+        )
+        best = heapq.nlargest(k, scores)
+        return [(score, self._names[name_id], self._values[name_id]) for score, name_id in best if score >= min_score]
@@ -0,0 +1,176 @@
+import csv
+import io
+import math
+from datetime import datetime
+from logging import getLogger
+
+from core.constants import ExcelItem, LOGGER_NAME
+from core.item_store import ExcelItemStore
+
+# Accepted header names for each ExcelItem field, lower case
+PURCHASE_HEADERS = {
+    "date": ("date", "tanggal", "tgl"),
+    "name": ("item", "nama", "name", "nama barang"),
+    "vendor": ("vendor", "toko", "supplier"),
+    "brand": ("merek", "brand"),
+    "quantity": ("quantity", "qty", "jumlah"),
+    "unit_beli": ("unit", "unit beli", "satuan"),
+    "cost": ("harga", "cost", "price"),
+    "isi": ("isi",),
+    "unit_isi": ("isi unit", "unit isi", "satuan isi"),
+    "category": ("category", "kategori"),
+}
+REQUIRED_FIELDS = ("name", "quantity", "unit_beli", "cost", "isi")
+NUMBER_FIELDS = ("quantity", "cost", "isi")
+DATE_FORMATS = ("%d-%b-%y", "%d-%b-%Y", "%Y-%m-%d", "%d/%m/%Y", "%d/%m/%y")
+
+
+def parse_purchase_text(text) -> list[dict]:
+    """Parse CSV or TSV text with a header row into rows keyed by ExcelItem field names. Unknown columns are dropped."""
+    if not text.strip():
+        return []
+    try:
+        dialect = csv.Sniffer().sniff(text.splitlines()[0], delimiters=",\t;")
+    except csv.Error:
+        dialect = csv.excel_tab if "\t" in text else csv.excel
+
+    reader = csv.reader(io.StringIO(text), dialect)
+    header = next(reader)
+    header_fields = {}
+    for column, label in enumerate(header):
+        label = label.strip().lower()
+        for field, aliases in PURCHASE_HEADERS.items():
+            if label in aliases:
+                header_fields[column] = field
+
+    rows = []
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue
+        rows.append(
+            {header_fields[column]: value.strip() for column, value in enumerate(values) if column in header_fields}
+        )
+    return rows
+
+
+def read_purchase_file(path) -> list[dict]:
+    # utf-8-sig strips the BOM Excel puts on CSV exports
+    with open(path, "r", encoding="utf-8-sig", newline="") as purchase_file:
+        return parse_purchase_text(purchase_file.read())
+
+
+def parse_number(value):
+    """Parse a number as typed in Indonesian invoices, e.g. "Rp 12.500" or "1.250,5"
+
+    :raises ValueError: if it is not a finite number, float() alone takes "nan" and "inf"
+    """
+    text = str(value).replace("Rp", "").replace(" ", "").strip()
+    if "," in text and "." in text:
+        # The last separator is the decimal one
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    elif "," in text:
+        text = text.replace(",", ".")
+    elif text.count(".") > 1 or (text.count(".") == 1 and len(text.rsplit(".", 1)[1]) == 3):
+        # Dots grouping thousands
+        text = text.replace(".", "")
+    number = float(text)
+    if not math.isfinite(number):
+        raise ValueError(f"'{value}' is not a finite number")
+    return number
+
+
+def parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise ValueError(f"unknown date '{value}'")
+
+
+def build_catalog_index(cat_items_dict: dict[str, ExcelItemStore]) -> dict:
+    """Map lower case item names to (category, name, unit_isi)"""
+    catalog_index = {}
+    for category, store in cat_items_dict.items():
+        for name, unit_isi in zip(store.names, store.column("unit_isi")):
+            catalog_index.setdefault(" ".join(name.split()).lower(), (category, name, unit_isi))
+    return catalog_index
+
+
+def validate_purchase_rows(rows, catalog_index, categories, units, vendors, default_date=None, default_vendor=None):
+    """Validate parsed rows in one pass and turn the valid ones into ExcelItems.
+
+    Known items take their name, category and isi unit from the catalog. Unknown items are staged as new items and
+    need a valid category.
+
+    :return: tuple of valid ExcelItems and error messages, rows are numbered as in the file
+    """
+    logger = getLogger(LOGGER_NAME)
+    category_set = set(categories)
+    unit_set = {unit.lower(): unit for unit in units}
+    vendor_set = set(vendors)
+    excel_items = []
+    errors = []
+
+    # Row 1 is the header
+    for row_number, row in enumerate(rows, start=2):
+        problems = [f"missing {field}" for field in REQUIRED_FIELDS if not row.get(field)]
+        if problems:
+            errors.append(f"Row {row_number}: {', '.join(problems)}")
+            continue
+
+        values = dict(row)
+        for field in NUMBER_FIELDS:
+            try:
+                values[field] = parse_number(row[field])
+            except ValueError:
+                problems.append(f"{field} '{row[field]}' is not a number")
+                continue
+            if values[field] <= 0:
+                problems.append(f"{field} cannot be 0")
+
+        try:
+            values["date"] = parse_date(row["date"]) if row.get("date") else default_date
+        except ValueError as error:
+            problems.append(str(error))
+        if not values["date"]:
+            problems.append("missing date")
+
+        values["vendor"] = row.get("vendor") or default_vendor
+        if values["vendor"] not in vendor_set:
+            problems.append(f"unknown vendor '{values['vendor']}'")
+
+        for field in ("unit_beli", "unit_isi"):
+            unit = row.get(field)
+            if unit and unit.lower() not in unit_set:
+                problems.append(f"unknown unit '{unit}'")
+            elif unit:
+                values[field] = unit_set[unit.lower()]
+
+        known_item = catalog_index.get(" ".join(row["name"].split()).lower())
+        if known_item:
+            category, name, unit_isi = known_item
+            if row.get("category") and row["category"] != category:
+                logger.warning(f"Row {row_number}: {name} is in {category}, not {row['category']}")
+            values["name"] = name
+            values["category"] = category
+            if unit_isi and unit_isi != "NA":
+                if row.get("unit_isi") and values["unit_isi"] != unit_isi:
+                    problems.append(f"{name} is counted in {unit_isi}, not {row['unit_isi']}")
+                values["unit_isi"] = unit_isi
+        elif row.get("category") not in category_set:
+            problems.append(f"new item '{row['name']}' needs a valid category")
+
+        if not values.get("unit_isi"):
+            problems.append("missing isi unit")
+
+        if problems:
+            errors.append(f"Row {row_number}: {', '.join(problems)}")
+            continue
+        excel_items.append(ExcelItem(**{field: values.get(field) for field in PURCHASE_HEADERS}))
+
+    logger.info(f"Validated {len(rows)} purchase rows, {len(errors)} with problems")
+    return excel_items, errors
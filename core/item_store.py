@@ -0,0 +1,63 @@
+import sys
+from dataclasses import fields
+
+from core.constants import ExcelItem
+
+ITEM_FIELDS = tuple(field.name for field in fields(ExcelItem))
+# Short repeated strings are interned so thousands of items share one copy of "Kg" or "Fresh"
+INTERNED_FIELDS = {"vendor", "unit_beli", "unit_isi", "category"}
+
+
+class ExcelItemStore:
+    """Columnar container of ExcelItem data, one list per field.
+
+    Bulk paths (catalog, import, aggregation) hold tens of thousands of items. Storing parallel lists instead of one
+    object per item keeps memory down, and a single column can be scanned without touching the others. ExcelItems are
+    only created when indexed or iterated.
+    """
+
+    __slots__ = ("_columns",)
+
+    def __init__(self, items=()):
+        self._columns = {field: [] for field in ITEM_FIELDS}
+        self.extend(items)
+
+    def __len__(self):
+        return len(self._columns["name"])
+
+    def __getitem__(self, index) -> ExcelItem:
+        return ExcelItem(*(self._columns[field][index] for field in ITEM_FIELDS))
+
+    def __iter__(self):
+        for values in zip(*self._columns.values()):
+            yield ExcelItem(*values)
+
+    def append(self, item: ExcelItem = None, **values):
+        """Append an ExcelItem, or the field values of one as keywords"""
+        for field in ITEM_FIELDS:
+            value = getattr(item, field) if item is not None else values.get(field)
+            if field in INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            self._columns[field].append(value)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def clear(self):
+        for column in self._columns.values():
+            column.clear()
+
+    def column(self, field) -> list:
+        """Get the list of values for a field. Do not mutate it."""
+        return self._columns[field]
+
+    @property
+    def names(self) -> list:
+        return self._columns["name"]
+
+    def sort_by(self, field="name"):
+        """Sort all columns in place by one field"""
+        order = sorted(range(len(self)), key=self._columns[field].__getitem__)
+        for name, column in self._columns.items():
+            self._columns[name] = [column[index] for index in order]
@@ -0,0 +1,124 @@
+from PySide6.QtCore import QAbstractListModel, QAbstractTableModel, QModelIndex, Qt
+
+from core.constants import ExcelItem
+from core.item_store import ExcelItemStore
+
+
+def total_cost(item: ExcelItem):
+    return item.quantity * item.cost
+
+
+def unit_cost(item: ExcelItem):
+    return total_cost(item) / item.isi
+
+
+# Header and value getter for each commit table column
+COMMIT_COLUMNS = (
+    ("Date", lambda item: item.date),
+    ("Item", lambda item: item.name),
+    ("Vendor", lambda item: item.vendor),
+    ("Merek", lambda item: item.brand),
+    ("Quantity", lambda item: item.quantity),
+    ("Unit", lambda item: item.unit_beli),
+    ("Harga", lambda item: item.cost),
+    ("Total", total_cost),
+    ("Isi", lambda item: item.isi),
+    ("Isi Unit", lambda item: item.unit_isi),
+    ("Harga/Unit", unit_cost),
+    ("Category", lambda item: item.category),
+)
+
+
+class CatalogListModel(QAbstractListModel):
+    """List model over one category of the cached catalog.
+
+    Switching category only swaps the store reference, so the combo box does not rebuild one entry per item.
+    DisplayRole gives the item name and UserRole the ExcelItem, same as the old addItem(name, userData=item).
+    """
+
+    def __init__(self, parent=None):
+        super(CatalogListModel, self).__init__(parent)
+        self._store = ExcelItemStore()
+
+    def set_store(self, store: ExcelItemStore):
+        self.beginResetModel()
+        self._store = store
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._store)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self._store.names[index.row()]
+        if role == Qt.UserRole:
+            return self._store[index.row()]
+        return None
+
+
+class CommitTableModel(QAbstractTableModel):
+    """Table model over the ExcelItems staged for writing.
+
+    Values are computed from the items when displayed, nothing is stored per cell. UserRole gives the raw value.
+    """
+
+    def __init__(self, parent=None):
+        super(CommitTableModel, self).__init__(parent)
+        self._items: list[ExcelItem] = []
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._items)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(COMMIT_COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        # Views ask for every role of every cell, only compute the value for the two roles we answer
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.UserRole):
+            return None
+        value = COMMIT_COLUMNS[index.column()][1](self._items[index.row()])
+        if role == Qt.UserRole:
+            return value
+        if value is None:
+            return ""
+        if index.column() == 0:
+            return value.strftime("%d-%b-%y")
+        return str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COMMIT_COLUMNS[section][0]
+        return None
+
+    def add_items(self, items: list[ExcelItem]):
+        """Append items with a single insert notification"""
+        if not items:
+            return
+        first = len(self._items)
+        self.beginInsertRows(QModelIndex(), first, first + len(items) - 1)
+        self._items.extend(items)
+        self.endInsertRows()
+
+    def remove_row(self, row):
+        if not 0 <= row < len(self._items):
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._items[row]
+        self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._items = []
+        self.endResetModel()
+
+    def items(self) -> list[ExcelItem]:
+        """Staged items, in table order"""
+        return list(self._items)
@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+from logging import getLogger
+
+import openpyxl
+
+from core.constants import LOGGER_NAME, CATEGORY_TYPOS, INTERNAL_SHEETS
+from core.utils import get_category_config
+
+
+@dataclass(frozen=True)
+class PreflightProblem:
+    sheet: str
+    row: int
+    item: str
+    message: str
+    # Init gets by with a default, the row is written anyway
+    warning: bool = False
+
+    def __str__(self):
+        return f"{self.sheet} row {self.row} ({self.item}): {'warning, ' if self.warning else ''}{self.message}"
+
+
+class PreflightError(Exception):
+    """The workbook has rows init would fail on"""
+
+    def __init__(self, problems: list[PreflightProblem]):
+        super().__init__(f"{len(problems)} vendor row(s) have problems, first: {problems[0]}")
+        self.problems = problems
+
+
+def normalize_category(value, categories):
+    """Category a vendor sheet value means, ignoring case and spacing and fixing known typos. None if unknown."""
+    if not isinstance(value, str):
+        return None
+    normalized = " ".join(value.split()).lower()
+    for category in categories:
+        if category.lower() == normalized:
+            return category
+    category = CATEGORY_TYPOS.get(normalized)
+    return category if category in categories else None
+
+
+def _unit_problem(label, unit):
+    if unit is None or (isinstance(unit, str) and not unit.strip()):
+        return f"missing {label}"
+    if not isinstance(unit, str):
+        return f"{label} '{unit}' is not a unit"
+    return None
+
+
+def preflight_scan(path, categories=None) -> list[PreflightProblem]:
+    """Find every vendor row init would fail on, in one read-only pass.
+
+    Only the rows init reads are checked, the first one of each item name. Checks the category (K) after typo fixing,
+    and warns about the unit beli (E) and the unit isi (I, init falls back to E), which init writes as they are.
+    """
+    logger = getLogger(LOGGER_NAME)
+    categories = categories or get_category_config()
+    category_list = list(categories["CATEGORIES"])
+    skip_set = set(category_list) | set(categories["MISC"]) | set(INTERNAL_SHEETS)
+    problems = []
+    fixed_typos = 0
+    # Names as init cleans them, later rows of the same item are not read
+    seen_names = set()
+
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        for sheet_name in workbook.sheetnames:
+            if sheet_name in skip_set:
+                continue
+            for row, values in enumerate(workbook[sheet_name].iter_rows(min_row=3, max_col=11, values_only=True), 3):
+                values = values + (None,) * (11 - len(values))
+                name, unit_beli, unit_isi, category_value = values[1], values[4], values[8], values[10]
+                if not name or not str(name).strip():
+                    continue
+                clean_name = str(name).strip().capitalize()
+                if clean_name in seen_names:
+                    continue
+                seen_names.add(clean_name)
+
+                category = normalize_category(category_value, category_list)
+                if category is None:
+                    message = f"unknown category '{category_value}'" if category_value else "missing category"
+                    problems.append(PreflightProblem(sheet_name, row, str(name), message))
+                elif category != category_value:
+                    fixed_typos += 1
+
+                unit_problems = [_unit_problem("unit beli", unit_beli)]
+                if unit_isi not in (None, ""):
+                    unit_problems.append(_unit_problem("unit isi", unit_isi))
+                problems.extend(
+                    PreflightProblem(sheet_name, row, str(name), problem, warning=True)
+                    for problem in unit_problems
+                    if problem
+                )
+    finally:
+        workbook.close()
+
+    logger.info(f"Preflight of {path}: {len(problems)} problems, {fixed_typos} category typos fixed on the fly")
+    return problems
+
+
+def format_problems(problems: list[PreflightProblem], limit=None) -> str:
+    shown = problems if limit is None else problems[:limit]
+    lines = [str(problem) for problem in shown]
+    if len(problems) > len(shown):
+        lines.append(f"...and {len(problems) - len(shown)} more, see the log")
+    return "\n".join(lines)
@@ -0,0 +1,203 @@
+import bisect
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from logging import getLogger
+
+from openpyxl.workbook.workbook import Workbook
+
+from core.constants import LOGGER_NAME, ROLLING_PURCHASES, ROLLING_DAYS, RP_STYLE, HEADER_STYLE
+from core.export import row_unit_price
+from core.workbook_io import file_fingerprint, is_unchanged
+
+
+def item_key(name):
+    return " ".join(str(name).split()).lower()
+
+
+class ItemWindow:
+    """Running price sums of one item: all time, the last N purchases and the purchases within N days of the
+    latest one. Adding a purchase newer than the ones seen is O(1), a back dated one costs O(N)."""
+
+    __slots__ = ("count", "total", "last_n", "last_n_total", "days", "days_total")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last_n = deque()
+        self.last_n_total = 0.0
+        self.days = deque()
+        self.days_total = 0.0
+
+    def add(self, date, price, n_purchases, n_days):
+        self.count += 1
+        self.total += price
+
+        if not self.last_n or date >= self.last_n[-1][0]:
+            self.last_n.append((date, price))
+            self.last_n_total += price
+            if len(self.last_n) > n_purchases:
+                self.last_n_total -= self.last_n.popleft()[1]
+        elif len(self.last_n) < n_purchases or date >= self.last_n[0][0]:
+            self._insert_sorted(self.last_n, date, price)
+            while len(self.last_n) > n_purchases:
+                self.last_n.popleft()
+            self.last_n_total = sum(window_price for _, window_price in self.last_n)
+
+        if date == datetime.min:
+            return
+        if not self.days or date >= self.days[-1][0]:
+            self.days.append((date, price))
+            self.days_total += price
+            window_start = date - timedelta(days=n_days)
+            while self.days[0][0] < window_start:
+                self.days_total -= self.days.popleft()[1]
+        elif date >= self.days[-1][0] - timedelta(days=n_days):
+            self._insert_sorted(self.days, date, price)
+            self.days_total = sum(window_price for _, window_price in self.days)
+
+    @staticmethod
+    def _insert_sorted(window: deque, date, price):
+        dates = [window_date for window_date, _ in window]
+        window.insert(bisect.bisect_right(dates, date), (date, price))
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def last_n_average(self):
+        return self.last_n_total / len(self.last_n) if self.last_n else None
+
+    @property
+    def days_average(self):
+        return self.days_total / len(self.days) if self.days else None
+
+
+class RollingAverages:
+    """Rolling price averages of every item, kept up to date from the vendor sheet rows.
+
+    sync only reads the rows added since the last sync, so one engine per workbook file is kept for the session.
+    It can only trust the rows it read if the file is the one it saw saved: get_rolling_averages rebuilds when the
+    file changed since (e.g. edited in Excel), and a sync whose rows never reached the file (a failed or retried
+    write) makes the next sync rebuild.
+    """
+
+    def __init__(self, n_purchases=ROLLING_PURCHASES, n_days=ROLLING_DAYS):
+        self.n_purchases = n_purchases
+        self.n_days = n_days
+        self.items: dict[str, ItemWindow] = {}
+        # Vendor sheet -> last row read
+        self._rows_read: dict[str, int] = {}
+        # File as saved after the last sync, and whether a sync happened since that was not saved
+        self.fingerprint = None
+        self._unsaved = False
+
+    def reset(self):
+        self.items = {}
+        self._rows_read = {}
+        self.fingerprint = None
+        self._unsaved = False
+
+    def saved(self, file, fingerprint=None):
+        """Record that the workbook synced last was saved to the file"""
+        self.fingerprint = fingerprint or file_fingerprint(file)
+        self._unsaved = False
+
+    def check_file(self, file):
+        """Rebuild on the next sync if the file is not the one this engine saw saved"""
+        if self.fingerprint is None or not is_unchanged(file, self.fingerprint):
+            self.reset()
+
+    def add(self, name, date, price):
+        key = item_key(name)
+        window = self.items.get(key)
+        if window is None:
+            window = self.items[key] = ItemWindow()
+        window.add(date or datetime.min, price, self.n_purchases, self.n_days)
+        return key
+
+    def _is_stale(self, workbook: Workbook, vendor_sheets):
+        if self._unsaved:
+            return True
+        for vendor, last_row in self._rows_read.items():
+            if vendor not in vendor_sheets or workbook[vendor].max_row < last_row:
+                return True
+        return False
+
+    def sync(self, workbook: Workbook, skip_set) -> set[str]:
+        """Read the vendor rows added since the last sync, oldest purchase first.
+
+        :return: keys of the items that got new purchases
+        """
+        logger = getLogger(LOGGER_NAME)
+        vendor_sheets = [sheet_name for sheet_name in workbook.sheetnames if sheet_name not in skip_set]
+        if self._is_stale(workbook, vendor_sheets):
+            logger.info("Vendor rows changed since the last sync, rebuilding rolling averages")
+            self.reset()
+        self._unsaved = True
+
+        new_rows = []
+        for vendor in vendor_sheets:
+            sheet = workbook[vendor]
+            last_row = self._rows_read.get(vendor, 2)
+            if sheet.max_row <= last_row:
+                continue
+            # A date, B name, D quantity, F cost, H isi, J price/unit
+            for row in sheet.iter_rows(min_row=last_row + 1, max_col=11, values_only=True):
+                row = row + (None,) * (11 - len(row))
+                date, name, quantity, cost, isi, per_unit = row[0], row[1], row[3], row[5], row[7], row[9]
+                price = row_unit_price(quantity, cost, isi, per_unit)
+                if name and price is not None:
+                    new_rows.append((date if isinstance(date, datetime) else datetime.min, name, price))
+            self._rows_read[vendor] = sheet.max_row
+
+        new_rows.sort(key=lambda new_row: new_row[0])
+        touched = {self.add(name, date, price) for date, name, price in new_rows}
+        logger.debug(f"Rolling averages read {len(new_rows)} new purchases")
+        return touched
+
+    def write_to_categories(self, workbook: Workbook, categories: dict, keys=None):
+        """Write the last N purchases and last N days averages of each item into category columns F and G.
+
+        :param keys: only write these items, all items by default
+        """
+        for category in categories["CATEGORIES"]:
+            if category not in workbook.sheetnames:
+                continue
+            sheet = workbook[category]
+            write_rolling_headers(sheet, self.n_purchases, self.n_days)
+            for row, (name,) in enumerate(sheet.iter_rows(min_row=3, max_col=1, values_only=True), 3):
+                if not name:
+                    continue
+                key = item_key(name)
+                if keys is not None and key not in keys:
+                    continue
+                window = self.items.get(key)
+                sheet[f"F{row}"] = window.last_n_average if window else None
+                sheet[f"G{row}"] = window.days_average if window else None
+                sheet[f"F{row}"].style = RP_STYLE
+                sheet[f"G{row}"].style = RP_STYLE
+
+
+def write_rolling_headers(sheet, n_purchases=ROLLING_PURCHASES, n_days=ROLLING_DAYS):
+    if sheet["F1"].value:
+        return
+    for column, label in (("F", f"LAST {n_purchases} BUYS"), ("G", f"LAST {n_days} DAYS")):
+        sheet[f"{column}1"] = label
+        sheet[f"{column}2"] = "PRICE/UNIT"
+        sheet[f"{column}1"].style = HEADER_STYLE
+        sheet[f"{column}2"].style = HEADER_STYLE
+
+
+_engines: dict[str, RollingAverages] = {}
+
+
+def get_rolling_averages(file) -> RollingAverages:
+    """Rolling averages engine of a workbook file, kept for the whole session. Call saved on it after writing."""
+    path = os.path.abspath(file)
+    if path not in _engines:
+        _engines[path] = RollingAverages()
+    engine = _engines[path]
+    engine.check_file(path)
+    return engine
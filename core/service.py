@@ -0,0 +1,399 @@
+"""Local service keeping one purchase workbook in memory, e.g. python -m core.cli serve "Pembelian 2023.xlsx"
+
+Till PCs send their purchases to the service instead of each loading and saving the workbook. The service drops
+them in the workbook's write queue, writes them with one save every few seconds, and answers catalog queries from
+memory. Queued purchases survive a crash of the service, and clients writing directly flush them as well.
+"""
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import urlparse, parse_qs, quote, unquote
+from urllib.request import Request, urlopen
+
+import openpyxl
+
+from core.constants import LOGGER_NAME, SERVICE_HOST, SERVICE_PORT, SERVICE_SAVE_INTERVAL, ExcelItem
+from core.excel_functions import append_purchases
+from core.fuzzy import NameIndex
+from core.rolling import get_rolling_averages
+from core.utils import get_category_config
+from core.workbook_io import WorkbookLock, file_fingerprint, is_unchanged, save_workbook
+from core.write_queue import (
+    BATCH_SUFFIX,
+    PurchaseError,
+    batch_status,
+    claim_batches,
+    item_from_json,
+    item_to_json,
+    purchase_problems,
+    queue_dir,
+    set_aside,
+    submit_batch,
+    unclaim,
+)
+
+
+class WorkbookMismatchError(Exception):
+    """The service writes another workbook than the one the client has selected"""
+
+
+def same_workbook(file, other_file) -> bool:
+    # Clients reach the workbook through their own drive letter or share, so only the file names can be compared
+    return os.path.normcase(os.path.basename(file)) == os.path.normcase(os.path.basename(other_file))
+
+
+class WorkbookService:
+    """A workbook loaded once, the purchases waiting to be saved into it, and its catalog.
+
+    Every submission is a batch in the write queue until it is saved, so nothing is lost when the service stops. The
+    file is still locked for every save, so clients writing directly keep working. When the file changed on disk since
+    our last load or save, it is loaded again before the pending purchases are added. Purchases the workbook cannot
+    take are refused when submitted, or their batch is moved to the queue's failed folder when they only fail at the
+    save. status() tells which of these happened to a submission.
+    """
+
+    def __init__(self, file, categories=None):
+        self.file = file
+        self.categories = categories or get_category_config()
+        # Submitted batches not saved yet, their items are in the catalog meanwhile
+        self.pending: dict[Path, list[ExcelItem]] = {}
+        self.workbook = None
+        self.fingerprint = None
+        self.catalog: dict[str, dict[str, dict]] = {}
+        self.vendors: list[str] = []
+        self.name_index = NameIndex()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        logger = getLogger(LOGGER_NAME)
+        if self.workbook:
+            self.workbook.close()
+        self.fingerprint = file_fingerprint(self.file)
+        self.workbook = openpyxl.load_workbook(self.file)
+        self.vendors = [
+            sheet_name for sheet_name in self.workbook.sheetnames if self.categories.is_vendor_sheet(sheet_name)
+        ]
+        self.catalog = {}
+        for category in self.categories["CATEGORIES"]:
+            if category not in self.workbook.sheetnames:
+                continue
+            category_items = self.catalog[category] = {}
+            for name, unit_beli, unit_isi in self.workbook[category].iter_rows(min_row=3, max_col=3, values_only=True):
+                if name:
+                    category_items[str(name).strip()] = {"unit_beli": unit_beli, "unit_isi": unit_isi}
+        self.name_index = NameIndex(
+            (name, category) for category, category_items in self.catalog.items() for name in category_items
+        )
+        # Purchases still waiting are not in the file yet
+        for excel_items in self.pending.values():
+            self._add_to_catalog(excel_items)
+        logger.info(f"Service loaded {self.file}, {len(self.name_index)} catalog items")
+
+    def load(self):
+        with self._lock, WorkbookLock(self.file):
+            self._load()
+
+    def _add_to_catalog(self, excel_items: list[ExcelItem]):
+        for excel_item in excel_items:
+            if not self.name_index.exact(excel_item.name):
+                self.catalog.setdefault(excel_item.category, {})[excel_item.name] = {
+                    "unit_beli": excel_item.unit_beli,
+                    "unit_isi": excel_item.unit_isi,
+                }
+                self.name_index.add(excel_item.name, excel_item.category)
+
+    def submit(self, excel_items: list[ExcelItem]) -> str:
+        """Queue purchases for the next save. New items show up in the catalog right away.
+
+        :raises PurchaseError: if the workbook cannot take some of them, none are queued
+        :return: id of the submission, to ask for its status
+        """
+        with self._lock:
+            sheetnames = self.workbook.sheetnames if self.workbook else None
+            problems = purchase_problems(excel_items, self.categories, sheetnames)
+            if problems and sheetnames and not is_unchanged(self.file, self.fingerprint):
+                # E.g. a vendor added from a till since our last load
+                with WorkbookLock(self.file):
+                    self._load()
+                problems = purchase_problems(excel_items, self.categories, self.workbook.sheetnames)
+            if problems:
+                raise PurchaseError(problems)
+            batch_path = submit_batch(self.file, excel_items)
+            self.pending[batch_path] = excel_items
+            self._add_to_catalog(excel_items)
+            return batch_path.name.removesuffix(BATCH_SUFFIX)
+
+    def status(self, submission: str) -> dict:
+        """Whether a submission is "pending", "written" or "rejected", with the problems that rejected it"""
+        if not submission or os.path.basename(submission) != submission:
+            raise ValueError(f"Bad submission id '{submission}'")
+        status, problems = batch_status(queue_dir(self.file) / f"{submission}{BATCH_SUFFIX}")
+        return {"status": status, "problems": problems}
+
+    def _load_if_changed(self):
+        if self.workbook is None or not is_unchanged(self.file, self.fingerprint):
+            getLogger(LOGGER_NAME).info(f"{self.file} changed on disk, loading it again")
+            self._load()
+
+    def _write(self, excel_items: list[ExcelItem]):
+        # Caller holds both locks
+        if not excel_items:
+            return
+        self._load_if_changed()
+        rolling = get_rolling_averages(self.file)
+        try:
+            append_purchases(self.workbook, excel_items, self.categories, rolling=rolling)
+            save_workbook(self.workbook, self.file, categories=self.categories)
+        except Exception:
+            # The purchases may be half added, start from the file again on the next try
+            self.workbook = None
+            raise
+        self.fingerprint = file_fingerprint(self.file)
+        rolling.saved(self.file, self.fingerprint)
+
+    def save(self) -> int:
+        """Write every queued batch with one save, ours and those clients left in the queue.
+
+        A batch the workbook cannot take, e.g. after its category sheet was removed, is moved to the failed folder and
+        the others are written. When the save itself fails, e.g. the file is open elsewhere, they all stay queued.
+
+        :return: number of purchases written
+        """
+        logger = getLogger(LOGGER_NAME)
+        with self._lock:
+            if not any(queue_dir(self.file).glob(f"*{BATCH_SUFFIX}*")):
+                # Written by a client flushing the queue meanwhile
+                self._forget_pending()
+                return 0
+            with WorkbookLock(self.file):
+                batches = claim_batches(self.file)
+                try:
+                    self._load_if_changed()
+                except Exception:
+                    unclaim(batches)
+                    raise
+                rejected = {}
+                for batch_path, batch_items in batches.items():
+                    problems = purchase_problems(batch_items, self.categories, self.workbook.sheetnames)
+                    if problems:
+                        rejected[batch_path] = problems
+                valid = {
+                    batch_path: batch_items for batch_path, batch_items in batches.items() if batch_path not in rejected
+                }
+                try:
+                    self._write([excel_item for batch_items in valid.values() for excel_item in batch_items])
+                except OSError:
+                    unclaim(batches)
+                    raise
+                except Exception as error:
+                    logger.error(f"Service save failed, writing the batches one by one: {error}")
+                    written = self._write_one_by_one(valid)
+                else:
+                    for batch_path in valid:
+                        batch_path.unlink()
+                    written = sum(map(len, valid.values()))
+                for batch_path, problems in rejected.items():
+                    set_aside(batch_path, problems)
+                self._forget_pending()
+        logger.info(f"Service saved {written} purchases to {self.file}")
+        return written
+
+    def _write_one_by_one(self, batches: dict[Path, list[ExcelItem]]) -> int:
+        written = 0
+        remaining = list(batches)
+        for batch_path in batches:
+            remaining.remove(batch_path)
+            try:
+                self._write(batches[batch_path])
+            except OSError:
+                unclaim([batch_path, *remaining])
+                raise
+            except Exception as error:
+                set_aside(batch_path, [f"Writing the batch failed: {error}"])
+                continue
+            batch_path.unlink()
+            written += len(batches[batch_path])
+        return written
+
+    def _forget_pending(self):
+        # Caller holds our lock. Drop the batches that are no longer queued.
+        rejected = False
+        for batch_path in list(self.pending):
+            status, _ = batch_status(batch_path)
+            if status != "pending":
+                del self.pending[batch_path]
+                rejected = rejected or status == "rejected"
+        if rejected and self.workbook is not None:
+            # Rejected purchases were in the catalog since they were submitted
+            self._load()
+
+    def catalog_snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "vendors": list(self.vendors),
+                "categories": {
+                    category: [{"name": name, **units} for name, units in category_items.items()]
+                    for category, category_items in self.catalog.items()
+                },
+            }
+
+    def similar(self, name, k=5) -> list[dict]:
+        with self._lock:
+            return [
+                {"score": score, "name": similar_name, "category": category}
+                for score, similar_name, category in self.name_index.similar(name, k=k)
+            ]
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """JSON API of the service.
+
+    GET /catalog, GET /similar?name=..., GET /workbook, GET /purchases/<id> for the status of a submission,
+    POST /purchases with {"workbook": file name, "items": items as write_queue stores them}, POST /save
+    """
+
+    service: WorkbookService = None
+
+    def _reply(self, status, body):
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/catalog":
+            self._reply(200, self.service.catalog_snapshot())
+        elif url.path == "/similar":
+            name = parse_qs(url.query).get("name", [""])[0]
+            self._reply(200, self.service.similar(name))
+        elif url.path == "/workbook":
+            self._reply(200, {"file": os.path.basename(self.service.file)})
+        elif url.path.startswith("/purchases/"):
+            try:
+                self._reply(200, self.service.status(unquote(url.path.removeprefix("/purchases/"))))
+            except ValueError as error:
+                self._reply(400, {"error": str(error)})
+        else:
+            self._reply(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        if self.path == "/purchases":
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length))
+                workbook = body["workbook"]
+                items = [item_from_json(item) for item in body["items"]]
+            except (ValueError, TypeError, KeyError) as error:
+                self._reply(400, {"error": f"Bad purchases: {error}"})
+                return
+            if not same_workbook(self.service.file, workbook):
+                self._reply(409, {"error": f"The service writes {os.path.basename(self.service.file)}, not {workbook}"})
+                return
+            try:
+                self._reply(202, {"id": self.service.submit(items)})
+            except PurchaseError as error:
+                self._reply(400, {"error": str(error), "problems": error.problems})
+        elif self.path == "/save":
+            try:
+                self._reply(200, {"written": self.service.save()})
+            except Exception as error:
+                getLogger(LOGGER_NAME).error(f"Service save failed: {error}")
+                self._reply(500, {"error": str(error)})
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def log_message(self, format, *args):
+        getLogger(LOGGER_NAME).debug(f"{self.address_string()} {format % args}")
+
+
+def make_server(service: WorkbookService, host=SERVICE_HOST, port=SERVICE_PORT) -> ThreadingHTTPServer:
+    handler = type("BoundServiceRequestHandler", (ServiceRequestHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def save_periodically(service: WorkbookService, stop: threading.Event, interval=SERVICE_SAVE_INTERVAL):
+    logger = getLogger(LOGGER_NAME)
+    while not stop.wait(interval):
+        try:
+            service.save()
+        except Exception as error:
+            logger.error(f"Periodic save failed, retrying in {interval}s: {error}")
+
+
+def serve(file, host=SERVICE_HOST, port=SERVICE_PORT, interval=SERVICE_SAVE_INTERVAL):
+    """Run the service until interrupted, then write what is still pending"""
+    logger = getLogger(LOGGER_NAME)
+    service = WorkbookService(file)
+    service.load()
+    server = make_server(service, host, port)
+    stop = threading.Event()
+    saver = threading.Thread(target=save_periodically, args=(service, stop, interval), daemon=True)
+    saver.start()
+    logger.info(f"Serving {file} on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        saver.join()
+        server.server_close()
+        service.save()
+
+
+class ServiceClient:
+    """Client of a running service, for the GUI and for trying the service out"""
+
+    def __init__(self, url, timeout=10):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        request = Request(f"{self.url}{path}", data=data, headers={"Content-Type": "application/json"})
+        with urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def catalog(self) -> dict:
+        return self._request("/catalog")
+
+    def similar(self, name) -> list[dict]:
+        return self._request(f"/similar?name={quote(name)}")
+
+    def workbook(self) -> str:
+        """File name of the workbook the service writes"""
+        return self._request("/workbook")["file"]
+
+    def submit(self, file, excel_items: list[ExcelItem]) -> str:
+        """Queue purchases for the service's next save.
+
+        :param file: workbook the purchases are meant for, the service refuses them when it writes another one
+        :raises PurchaseError: if the service refused the purchases, none were queued
+        :raises WorkbookMismatchError: if the service writes another workbook, nothing was queued
+        :return: id of the submission, see status()
+        """
+        body = {"workbook": os.path.basename(file), "items": [item_to_json(excel_item) for excel_item in excel_items]}
+        try:
+            return self._request("/purchases", body)["id"]
+        except HTTPError as error:
+            if error.code not in (400, 409):
+                raise
+            reply = json.loads(error.read())
+            if error.code == 409:
+                raise WorkbookMismatchError(reply["error"]) from None
+            raise PurchaseError(reply.get("problems") or [reply["error"]]) from None
+
+    def status(self, submission: str) -> dict:
+        """{"status": "pending", "written" or "rejected", "problems": why it was rejected}"""
+        return self._request(f"/purchases/{quote(submission)}")
+
+    def save(self) -> int:
+        return self._request("/save", {})["written"]
@@ -7,7 +7,7 @@ from getpass import getuser
 
 from PySide6.QtWidgets import QMessageBox
 
-from core.constants import CAT_REF, DEFAULT_CATEGORIES
+from core.constants import CAT_REF, DEFAULT_CATEGORIES, INTERNAL_SHEETS
 
 LOGGER_FORMAT = "%(asctime)s - " "%(module)s.%(funcName)s - " "%(levelname)s - %(message)s"
 FORMATTER = logging.Formatter(LOGGER_FORMAT)
@@ -80,12 +80,12 @@ def write_default_categories_file():
     message.exec_()
 
 
-def read_categories_file():
+def read_categories_file(path=CAT_REF):
     """Read from category file"""
     category_dict = {"MISC": [], "CATEGORIES": []}
     is_cat = False
 
-    with open(CAT_REF, "r") as cat_file:
+    with open(path, "r") as cat_file:
         lines = cat_file.readlines()
 
         for line in lines:
@@ -103,7 +103,40 @@ def read_categories_file():
     return category_dict
 
 
-def get_skip_list():
-    categories = read_categories_file()
-    skip_list = categories["CATEGORIES"] + categories["MISC"]
-    return skip_list
+class CategoryConfig:
+    """Parsed category file with set based lookups.
+
+    Can be used anywhere the plain {"MISC": [...], "CATEGORIES": [...]} dict is expected.
+    """
+
+    def __init__(self, category_dict: dict, mtime_ns=None):
+        self._category_dict = category_dict
+        self.mtime_ns = mtime_ns
+        self.category_set = frozenset(category_dict["CATEGORIES"])
+        self.skip_set = frozenset(category_dict["CATEGORIES"] + category_dict["MISC"]).union(INTERNAL_SHEETS)
+
+    def __getitem__(self, key):
+        return self._category_dict[key]
+
+    def keys(self):
+        return self._category_dict.keys()
+
+    def is_vendor_sheet(self, sheet_name):
+        return sheet_name not in self.skip_set
+
+
+_config_cache: dict[str, CategoryConfig] = {}
+
+
+def get_category_config(path=CAT_REF) -> CategoryConfig:
+    """Get the parsed category file, only re-reading it when its mtime changed"""
+    mtime_ns = os.stat(path).st_mtime_ns
+    config = _config_cache.get(path)
+    if config is None or config.mtime_ns != mtime_ns:
+        config = CategoryConfig(read_categories_file(path), mtime_ns)
+        _config_cache[path] = config
+    return config
+
+
+def get_skip_list() -> frozenset:
+    return get_category_config().skip_set
@@ -0,0 +1,376 @@
+import hashlib
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from getpass import getuser
+from logging import getLogger
+from zipfile import ZipFile, ZIP_DEFLATED
+
+import openpyxl
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE
+from openpyxl.utils.indexed_list import IndexedList
+from openpyxl.writer.excel import ExcelWriter
+
+from core.constants import LOGGER_NAME, EVALUATE_FORMULAS
+from core.evaluate import evaluate_formulas, write_cached_values
+
+LOCK_TIMEOUT = 30  # seconds to wait for another client's write
+LOCK_STALE_AFTER = 120  # seconds before a lock left by a crashed client is broken
+CONFLICT_RETRIES = 3
+
+
+class WorkbookLockError(Exception):
+    """The workbook lock could not be acquired in time"""
+
+
+class WorkbookConflictError(Exception):
+    """The workbook kept changing on disk while we were writing to it"""
+
+
+@dataclass(frozen=True)
+class FileFingerprint:
+    mtime_ns: int
+    size: int
+    digest: str
+
+
+def file_digest(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as workbook_file:
+        for chunk in iter(lambda: workbook_file.read(1024 * 1024), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def file_fingerprint(path) -> FileFingerprint:
+    stat = os.stat(path)
+    return FileFingerprint(stat.st_mtime_ns, stat.st_size, file_digest(path))
+
+
+def is_unchanged(path, fingerprint: FileFingerprint):
+    """Check the file still matches the fingerprint. Only hashes the file again when mtime or size moved."""
+    stat = os.stat(path)
+    if stat.st_mtime_ns == fingerprint.mtime_ns and stat.st_size == fingerprint.size:
+        return True
+    return stat.st_size == fingerprint.size and file_digest(path) == fingerprint.digest
+
+
+def fsync_directory(directory):
+    """Make a rename durable. Directories cannot be opened on Windows, where the rename is already durable."""
+    if os.name == "nt":
+        return
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def _styled_objects(workbook):
+    for worksheet in workbook.worksheets:
+        yield from worksheet._cells.values()
+        yield from worksheet.row_dimensions.values()
+        yield from worksheet.column_dimensions.values()
+
+
+def compact_styles(workbook):
+    """Rebuild the style tables from the styles cells actually use, merging duplicates.
+
+    openpyxl keeps every style the file was loaded with, and equal fonts or formats under different ids stay apart,
+    so the style table only grows from save to save.
+    """
+    old_tables = {
+        "fontId": workbook._fonts,
+        "fillId": workbook._fills,
+        "borderId": workbook._borders,
+        "alignmentId": workbook._alignments,
+        "protectionId": workbook._protections,
+    }
+    old_number_formats = workbook._number_formats
+
+    # Default entries have to stay first, Excel also expects the two default fills
+    workbook._fonts = IndexedList(workbook._fonts[:1])
+    workbook._fills = IndexedList(workbook._fills[:2])
+    workbook._borders = IndexedList(workbook._borders[:1])
+    workbook._alignments = IndexedList(workbook._alignments[:1])
+    workbook._protections = IndexedList(workbook._protections[:1])
+    workbook._number_formats = IndexedList()
+    workbook._cell_styles = IndexedList([StyleArray()])
+    new_tables = {
+        "fontId": workbook._fonts,
+        "fillId": workbook._fills,
+        "borderId": workbook._borders,
+        "alignmentId": workbook._alignments,
+        "protectionId": workbook._protections,
+    }
+
+    remapped = {}
+    for styled in _styled_objects(workbook):
+        old_style = tuple(styled._style)
+        if old_style not in remapped:
+            new_style = StyleArray(old_style)
+            for id_name, old_table in old_tables.items():
+                setattr(new_style, id_name, new_tables[id_name].add(old_table[getattr(new_style, id_name)]))
+            if new_style.numFmtId >= BUILTIN_FORMATS_MAX_SIZE:
+                number_format = old_number_formats[new_style.numFmtId - BUILTIN_FORMATS_MAX_SIZE]
+                new_style.numFmtId = workbook._number_formats.add(number_format) + BUILTIN_FORMATS_MAX_SIZE
+            remapped[old_style] = tuple(new_style)
+        styled._style = StyleArray(remapped[old_style])
+
+    # Named styles keep ids into the tables too
+    for named_style in workbook._named_styles:
+        named_style.bind(workbook)
+
+
+def save_workbook(workbook, path, optimise=False, evaluate=EVALUATE_FORMULAS, categories=None):
+    """Save atomically: write a temp file in the same folder, fsync it and rename it over the original.
+
+    A crash or a dropped share mid save leaves the original workbook untouched, plus at worst a stray temp file.
+
+    :param optimise: compact the style tables and use maximum zip compression, slower to save but smaller to load
+    :param evaluate: store the values of the app's own formulas as cached values, see evaluate_formulas
+    :param categories: category config telling the category sheets apart, nothing is evaluated without it
+    """
+    path = os.path.abspath(path)
+    directory, name = os.path.split(path)
+    temp_fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f"~{name}.", suffix=".tmp")
+    os.close(temp_fd)
+    try:
+        if optimise:
+            compact_styles(workbook)
+            with ZipFile(temp_path, "w", ZIP_DEFLATED, allowZip64=True, compresslevel=9) as archive:
+                ExcelWriter(workbook, archive).save()
+        else:
+            workbook.save(temp_path)
+        if evaluate and categories:
+            write_cached_values(
+                temp_path, evaluate_formulas(workbook, categories), compresslevel=9 if optimise else None
+            )
+        if os.path.exists(path):
+            # mkstemp makes the file private, keep the permissions of the workbook on the share
+            os.chmod(temp_path, os.stat(path).st_mode)
+        with open(temp_path, "rb+") as temp_file:
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    fsync_directory(directory)
+
+
+def sheet_digest(worksheet) -> str:
+    """Digest of what openpyxl would write for a sheet: cell values and styles, formulas, merges and state.
+
+    Cells are taken in row/column order, so rewriting the same content in a different order is no change. Empty
+    unstyled cells, which openpyxl creates just by reading a range, are ignored like the writer ignores them. Shared
+    formulas count as the per cell formulas openpyxl expands them to when loading.
+    """
+    shared_formulas = {}
+    for coordinate, attributes in worksheet.formula_attributes.items():
+        if attributes.get("t") == "shared" and "ref" in attributes:
+            shared_formulas[attributes["si"]] = Translator(worksheet[coordinate].value, coordinate)
+
+    sha1 = hashlib.sha1()
+    for row_column in sorted(worksheet._cells):
+        cell = worksheet._cells[row_column]
+        if cell._value is None and not cell.has_style:
+            continue
+        value = cell._value
+        attributes = worksheet.formula_attributes.get(cell.coordinate)
+        if attributes and attributes.get("t") == "shared" and "ref" not in attributes:
+            value = shared_formulas[attributes["si"]].translate_formula(cell.coordinate)
+        elif isinstance(value, float):
+            # Written with 16 significant digits, so 0.42857142857142855 reads back as 0.4285714285714286
+            value = float("%.16g" % value)
+            if value.is_integer():
+                # Written as 6, read back as an int
+                value = int(value)
+        # A loaded cell has an all default style array where a new one has none
+        style = tuple(cell._style) if cell.has_style else None
+        sha1.update(repr((row_column, value, cell.data_type, style)).encode())
+
+    array_formulas = sorted(
+        (coordinate, sorted(attributes.items()))
+        for coordinate, attributes in worksheet.formula_attributes.items()
+        if attributes.get("t") != "shared"
+    )
+    sha1.update(repr(array_formulas).encode())
+    sha1.update(repr(sorted(str(merged) for merged in worksheet.merged_cells.ranges)).encode())
+    sha1.update(worksheet.sheet_state.encode())
+    return sha1.hexdigest()
+
+
+def workbook_digests(workbook, sheets=None) -> dict[str, str]:
+    """Digest per sheet, plus one under "" for the sheet order, defined names and named styles
+
+    :param sheets: names of the sheets to digest, every sheet when None
+    """
+    digests = {
+        worksheet.title: sheet_digest(worksheet)
+        for worksheet in workbook.worksheets
+        if sheets is None or worksheet.title in sheets
+    }
+    workbook_level = (
+        workbook.sheetnames,
+        [(defined_name.name, defined_name.attr_text) for defined_name in workbook.defined_names.definedName],
+        list(workbook.named_styles),
+    )
+    digests[""] = hashlib.sha1(repr(workbook_level).encode()).hexdigest()
+    return digests
+
+
+def changed_sheets(before: dict[str, str], after: dict[str, str]) -> list[str]:
+    """Names of the sheets added, removed or changed, "workbook" for workbook level changes"""
+    changed = [name or "workbook" for name in after if before.get(name) != after[name]]
+    return changed + [name for name in before if name not in after]
+
+
+def lock_path(path):
+    return f"{path}.lock"
+
+
+class WorkbookLock:
+    """Lock file next to the workbook, so clients on other machines of the share write one at a time.
+
+    Used as a context manager. Locks older than LOCK_STALE_AFTER are assumed to be left by a crashed client, so a
+    held lock is touched in the background to show its owner is still working.
+    """
+
+    def __init__(self, path, timeout=LOCK_TIMEOUT, stale_after=LOCK_STALE_AFTER):
+        self.path = lock_path(path)
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self._released = threading.Event()
+
+    def acquire(self):
+        logger = getLogger(LOGGER_NAME)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                lock_fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                self._break_if_stale()
+                if time.monotonic() > deadline:
+                    raise WorkbookLockError(f"Workbook is locked by {self.owner()}")
+                time.sleep(0.2)
+                continue
+            with os.fdopen(lock_fd, "w") as lock_file:
+                lock_file.write(f"{getuser()}@{socket.gethostname()} pid {os.getpid()}")
+            logger.debug(f"Acquired {self.path}")
+            self._released.clear()
+            threading.Thread(target=self._heartbeat, daemon=True).start()
+            return
+
+    def _heartbeat(self):
+        while not self._released.wait(self.stale_after / 3):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                # Moved aside by a client checking whether it is stale, it is put back
+                continue
+
+    def release(self):
+        self._released.set()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def owner(self):
+        try:
+            with open(self.path, "r") as lock_file:
+                return lock_file.read() or "unknown"
+        except OSError:
+            return "unknown"
+
+    def _break_if_stale(self):
+        """Remove the lock file if it is stale.
+
+        Another client may break the same lock and take a fresh one between our age check and the removal. So the
+        lock file is first renamed to a name only we know, which only one client can do, and removed only if it is
+        still the stale file we looked at. A fresh lock caught by the rename is put back.
+        """
+        logger = getLogger(LOGGER_NAME)
+        try:
+            stale = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        age = time.time() - stale.st_mtime
+        if age <= self.stale_after:
+            return
+        broken_path = f"{self.path}.{uuid.uuid4().hex}.broken"
+        try:
+            os.rename(self.path, broken_path)
+        except FileNotFoundError:
+            return
+        try:
+            moved = os.stat(broken_path)
+            if (moved.st_ino, moved.st_mtime_ns, moved.st_size) != (stale.st_ino, stale.st_mtime_ns, stale.st_size):
+                try:
+                    os.link(broken_path, self.path)
+                except OSError as error:
+                    logger.warning(f"Could not put back the lock {self.path} taken meanwhile: {error}")
+                return
+            with open(broken_path, "r") as lock_file:
+                logger.warning(f"Breaking stale lock of {lock_file.read() or 'unknown'}, {age:.0f}s old")
+        finally:
+            os.remove(broken_path)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def update_workbook(
+    file, mutate, data_only=False, retries=CONFLICT_RETRIES, optimise=False, categories=None, sheets=None
+):
+    """Load, mutate and save the workbook without clobbering outside saves. The caller should hold the WorkbookLock.
+
+    The file is fingerprinted before loading. If it changed by the time we save (e.g. someone saved it from Excel,
+    which does not know our lock), the stale workbook is dropped and mutate is replayed on a fresh load.
+
+    When mutate leaves every sheet as it was loaded, nothing is saved at all.
+
+    :param mutate: callable taking the loaded workbook, its return value is passed back
+    :param optimise: save even without changes, compacting styles
+    :param categories: category config, passed on to save_workbook
+    :param sheets: sheets mutate changes whenever it changes anything, only these are digested to tell. None digests
+        every sheet, for mutations that may leave the workbook as it was anywhere.
+    """
+    logger = getLogger(LOGGER_NAME)
+    for attempt in range(retries):
+        fingerprint = file_fingerprint(file)
+        workbook = openpyxl.load_workbook(file, data_only=data_only)
+        loaded_digests = workbook_digests(workbook, sheets)
+        result = mutate(workbook)
+        changed = changed_sheets(loaded_digests, workbook_digests(workbook, sheets))
+        if not changed and not optimise:
+            logger.info(f"Nothing changed in {file}, not saving")
+            workbook.close()
+            return result
+        if is_unchanged(file, fingerprint):
+            save_workbook(workbook, file, optimise=optimise, categories=categories)
+            logger.info(f"Saved {file}, changed: {', '.join(changed) or 'nothing'}")
+            workbook.close()
+            return result
+        logger.warning(f"{file} changed on disk while writing, retrying ({attempt + 1}/{retries})")
+        workbook.close()
+    raise WorkbookConflictError(f"{file} kept changing on disk, nothing was written")
+
+
+def locked_update(file, mutate, data_only=False, optimise=False, categories=None, sheets=None):
+    """update_workbook while holding the workbook lock"""
+    with WorkbookLock(file):
+        return update_workbook(
+            file, mutate, data_only=data_only, optimise=optimise, categories=categories, sheets=sheets
+        )
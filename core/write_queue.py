@@ -0,0 +1,303 @@
+import json
+import os
+import time
+import uuid
+from dataclasses import asdict
+from datetime import datetime
+from getpass import getuser
+from logging import getLogger
+from pathlib import Path
+
+from core.constants import ExcelItem, INTERNAL_SHEETS, LOGGER_NAME
+from core.excel_functions import append_purchases, purchase_sheets
+from core.rolling import get_rolling_averages
+from core.workbook_io import LOCK_TIMEOUT, WorkbookConflictError, WorkbookLock, WorkbookLockError, update_workbook
+
+BATCH_SUFFIX = ".json"
+CLAIMED_SUFFIX = ".claimed"
+# Batches the workbook cannot take are moved here, with the reason next to them in an .error file
+FAILED_DIR = "failed"
+ERROR_SUFFIX = ".error"
+
+
+class PurchaseError(Exception):
+    """Purchases the workbook cannot take, none of the batch was written"""
+
+    def __init__(self, problems: list[str]):
+        super().__init__(f"{len(problems)} purchase(s) cannot be written, first: {problems[0]}")
+        self.problems = problems
+
+
+def queue_dir(file) -> Path:
+    """Spool folder next to the workbook, shared by every client on the drive"""
+    return Path(f"{file}.queue")
+
+
+def item_to_json(excel_item: ExcelItem) -> dict:
+    item_dict = asdict(excel_item)
+    item_dict["date"] = excel_item.date.isoformat() if excel_item.date else None
+    return item_dict
+
+
+def item_from_json(item_dict: dict) -> ExcelItem:
+    item_dict = dict(item_dict)
+    item_dict["date"] = datetime.fromisoformat(item_dict["date"]) if item_dict.get("date") else None
+    return ExcelItem(**item_dict)
+
+
+class BatchPendingError(Exception):
+    """Our batch is still in the queue: another client claimed it and has not finished writing it. It stays queued
+    either way, a later flush writes it if that client fails."""
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def purchase_problems(excel_items: list[ExcelItem], categories, sheetnames=None) -> list[str]:
+    """Find the purchases append_purchases would fail on, or would write to a sheet that is not a vendor sheet
+
+    :param sheetnames: sheets of the loaded workbook, every category and vendor must have its sheet in it
+    """
+    category_set = set(categories["CATEGORIES"])
+    skip_set = category_set | set(categories["MISC"]) | set(INTERNAL_SHEETS)
+    problems = []
+    for number, excel_item in enumerate(excel_items, 1):
+        messages = []
+        if not excel_item.name or not str(excel_item.name).strip():
+            messages.append("missing name")
+        if excel_item.category not in category_set:
+            messages.append(f"unknown category '{excel_item.category}'")
+        elif sheetnames is not None and excel_item.category not in sheetnames:
+            messages.append(f"no sheet for category '{excel_item.category}'")
+        if not excel_item.vendor:
+            messages.append("missing vendor")
+        elif excel_item.vendor in skip_set:
+            messages.append(f"'{excel_item.vendor}' is not a vendor sheet")
+        elif sheetnames is not None and excel_item.vendor not in sheetnames:
+            messages.append(f"no sheet for vendor '{excel_item.vendor}'")
+        for label, unit in (("unit beli", excel_item.unit_beli), ("unit isi", excel_item.unit_isi)):
+            if not isinstance(unit, str) or not unit.strip():
+                messages.append(f"missing {label}")
+        for label, value in (("quantity", excel_item.quantity), ("cost", excel_item.cost), ("isi", excel_item.isi)):
+            if not _is_number(value):
+                messages.append(f"{label} '{value}' is not a number")
+        if _is_number(excel_item.isi) and not excel_item.isi:
+            messages.append("isi cannot be 0")
+        if messages:
+            problems.append(f"Item {number} ({excel_item.name}): {', '.join(messages)}")
+    return problems
+
+
+def submit_batch(file, excel_items: list[ExcelItem]) -> Path:
+    """Drop a batch in the write queue. The file is renamed into place so a flush never reads half of it."""
+    spool = queue_dir(file)
+    spool.mkdir(exist_ok=True)
+    name = f"{datetime.now():%Y%m%d%H%M%S%f}-{getuser()}-{uuid.uuid4().hex[:8]}"
+    temp_path = spool / f"{name}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as batch_file:
+        json.dump([item_to_json(item) for item in excel_items], batch_file)
+    batch_path = spool / f"{name}{BATCH_SUFFIX}"
+    os.replace(temp_path, batch_path)
+    return batch_path
+
+
+def failed_path(batch_path: Path) -> Path:
+    """Where a batch ends up when the workbook cannot take it"""
+    return batch_path.parent / FAILED_DIR / batch_path.name.removesuffix(CLAIMED_SUFFIX)
+
+
+def set_aside(batch_path: Path, problems: list[str]):
+    """Move a claimed batch to the failed folder, with the reason next to it"""
+    logger = getLogger(LOGGER_NAME)
+    target = failed_path(batch_path)
+    target.parent.mkdir(exist_ok=True)
+    os.replace(batch_path, target)
+    target.with_name(target.name + ERROR_SUFFIX).write_text("\n".join(problems), encoding="utf-8")
+    logger.error(f"Set aside queued batch {target.name}: {problems[0]}")
+
+
+def unclaim(batch_paths):
+    """Put claimed batches back in the queue, nothing of them was saved and the next flush writes them"""
+    for batch_path in batch_paths:
+        os.replace(batch_path, batch_path.with_name(batch_path.name.removesuffix(CLAIMED_SUFFIX)))
+
+
+def claim_batches(file) -> dict[Path, list[ExcelItem]]:
+    """Claim every queued batch and read it. Call it holding the workbook lock.
+
+    Claimed files left behind by a crashed flush are claimed again, unreadable batches are set aside.
+    """
+    spool = queue_dir(file)
+    if not spool.exists():
+        return {}
+    for batch_path in spool.glob(f"*{BATCH_SUFFIX}"):
+        os.replace(batch_path, batch_path.with_name(batch_path.name + CLAIMED_SUFFIX))
+    batches = {}
+    for batch_path in sorted(spool.glob(f"*{CLAIMED_SUFFIX}")):
+        try:
+            with open(batch_path, "r", encoding="utf-8") as batch_file:
+                batches[batch_path] = [item_from_json(item) for item in json.load(batch_file)]
+        except (ValueError, TypeError, AttributeError) as error:
+            set_aside(batch_path, [f"Unreadable batch: {error}"])
+    return batches
+
+
+def batch_status(batch_path: Path) -> tuple[str, list[str]]:
+    """Whether a submitted batch is still pending, was rejected with the reasons why, or was written"""
+    if batch_path.exists() or batch_path.with_name(batch_path.name + CLAIMED_SUFFIX).exists():
+        return "pending", []
+    rejection = _rejection(batch_path)
+    if rejection:
+        return "rejected", rejection.problems
+    return "written", []
+
+
+def flush_write_queue(file, categories: dict, timeout=None) -> int:
+    """Write every queued batch with one load and one save.
+
+    Batches are claimed by renaming them, so a client that gives up waiting can still withdraw a batch nobody started
+    on. Claimed files left behind by a crashed flush are written by the next one.
+
+    A batch the workbook cannot take, e.g. with a category that has no sheet, is moved to the failed folder instead of
+    blocking the queue, and the other batches are written without it. When the workbook could not be saved at all the
+    batches go back in the queue.
+
+    :return: number of items written
+    """
+    logger = getLogger(LOGGER_NAME)
+    lock = WorkbookLock(file) if timeout is None else WorkbookLock(file, timeout=timeout)
+    with lock:
+        batches = claim_batches(file)
+        if not batches:
+            return 0
+
+        rolling = get_rolling_averages(file)
+        rejected = {}
+
+        def append_valid_batches(workbook):
+            # Replayed on a fresh load when the file changed meanwhile, so decide again from scratch
+            rejected.clear()
+            excel_items = []
+            for batch_path, batch_items in batches.items():
+                problems = purchase_problems(batch_items, categories, workbook.sheetnames)
+                if problems:
+                    rejected[batch_path] = problems
+                else:
+                    excel_items.extend(batch_items)
+            append_purchases(workbook, excel_items, categories, rolling=rolling)
+
+        logger.info(f"Writing {len(batches)} queued batches, {sum(map(len, batches.values()))} items")
+        try:
+            update_workbook(
+                file,
+                append_valid_batches,
+                categories=categories,
+                sheets=purchase_sheets([excel_item for batch_items in batches.values() for excel_item in batch_items]),
+            )
+        except (WorkbookConflictError, OSError):
+            unclaim(batches)
+            raise
+        except Exception as error:
+            # Some batch passed the checks and still failed, write them one by one to find it
+            logger.error(f"Writing the queued batches together failed, writing them one by one: {error}")
+            return _write_one_by_one(file, batches, rolling, categories)
+        rolling.saved(file)
+
+        written = 0
+        for batch_path, batch_items in batches.items():
+            if batch_path in rejected:
+                set_aside(batch_path, rejected[batch_path])
+            else:
+                batch_path.unlink()
+                written += len(batch_items)
+    return written
+
+
+def _write_one_by_one(file, batches: dict[Path, list[ExcelItem]], rolling, categories) -> int:
+    written = 0
+    remaining = list(batches)
+    for batch_path in batches:
+        remaining.remove(batch_path)
+        try:
+            update_workbook(
+                file,
+                lambda workbook: append_purchases(workbook, batches[batch_path], categories, rolling=rolling),
+                categories=categories,
+                sheets=purchase_sheets(batches[batch_path]),
+            )
+        except (WorkbookConflictError, OSError):
+            unclaim([batch_path, *remaining])
+            raise
+        except Exception as error:
+            set_aside(batch_path, [f"Writing the batch failed: {error}"])
+            continue
+        rolling.saved(file)
+        batch_path.unlink()
+        written += len(batches[batch_path])
+    return written
+
+
+def _rejection(batch_path: Path):
+    rejected = failed_path(batch_path)
+    if rejected.exists():
+        error_path = rejected.with_name(rejected.name + ERROR_SUFFIX)
+        return PurchaseError(error_path.read_text(encoding="utf-8").splitlines())
+    return None
+
+
+def _await_claimed_batch(batch_path: Path, error: WorkbookLockError, timeout=LOCK_TIMEOUT):
+    """Wait for the client that claimed our batch to write it, set it aside or put it back in the queue"""
+    claimed_path = batch_path.with_name(batch_path.name + CLAIMED_SUFFIX)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if claimed_path.exists():
+            time.sleep(0.2)
+            continue
+        rejection = _rejection(batch_path)
+        if rejection:
+            raise rejection
+        try:
+            batch_path.unlink()
+        except FileNotFoundError:
+            if claimed_path.exists():
+                # Put back and claimed again by the next flush
+                continue
+            return
+        # Put back unwritten, and now withdrawn
+        raise error
+    raise BatchPendingError(f"Queued, another client is still writing it: {error}")
+
+
+def write_batch_queued(file, excel_items: list[ExcelItem], categories: dict):
+    """Queue a batch and flush the queue. Waits for other clients and writes their batches along with ours.
+
+    :raises PurchaseError: if the workbook cannot take our batch, nothing of it was written
+    :raises WorkbookLockError: if the workbook stayed locked and our batch was withdrawn unwritten
+    :raises BatchPendingError: if another client claimed our batch and did not finish writing it in time
+    """
+    problems = purchase_problems(excel_items, categories)
+    if problems:
+        raise PurchaseError(problems)
+    batch_path = submit_batch(file, excel_items)
+    try:
+        flush_write_queue(file, categories)
+    except WorkbookLockError as error:
+        try:
+            batch_path.unlink()
+        except FileNotFoundError:
+            # Already claimed by the client holding the lock
+            _await_claimed_batch(batch_path, error)
+            return
+        raise
+    except Exception:
+        # Back in the queue when nothing was saved, take it out again. Otherwise it was dealt with.
+        try:
+            batch_path.unlink()
+        except FileNotFoundError:
+            pass
+        else:
+            raise
+    rejection = _rejection(batch_path)
+    if rejection:
+        raise rejection
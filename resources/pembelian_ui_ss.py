@@ -18,8 +18,8 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
 from PySide6.QtWidgets import (QAbstractItemView, QAbstractSpinBox, QApplication, QCheckBox,
     QComboBox, QDoubleSpinBox, QFrame, QHBoxLayout,
     QHeaderView, QLabel, QLineEdit, QPushButton,
-    QSizePolicy, QSpacerItem, QTableWidget, QTableWidgetItem,
-    QVBoxLayout, QWidget)
+    QSizePolicy, QSpacerItem, QTableView, QVBoxLayout,
+    QWidget)
 
 class Ui_pembelian(object):
     def setupUi(self, pembelian):
@@ -350,33 +350,7 @@ class Ui_pembelian(object):
         self.verticalLayout_11 = QVBoxLayout()
         self.verticalLayout_11.setSpacing(0)
         self.verticalLayout_11.setObjectName(u"verticalLayout_11")
-        self.commit_table = QTableWidget(self.inner_frame_3)
-        if (self.commit_table.columnCount() < 12):
-            self.commit_table.setColumnCount(12)
-        __qtablewidgetitem = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(0, __qtablewidgetitem)
-        __qtablewidgetitem1 = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(1, __qtablewidgetitem1)
-        __qtablewidgetitem2 = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(2, __qtablewidgetitem2)
-        __qtablewidgetitem3 = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(3, __qtablewidgetitem3)
-        __qtablewidgetitem4 = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(4, __qtablewidgetitem4)
-        __qtablewidgetitem5 = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(5, __qtablewidgetitem5)
-        __qtablewidgetitem6 = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(6, __qtablewidgetitem6)
-        __qtablewidgetitem7 = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(7, __qtablewidgetitem7)
-        __qtablewidgetitem8 = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(8, __qtablewidgetitem8)
-        __qtablewidgetitem9 = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(9, __qtablewidgetitem9)
-        __qtablewidgetitem10 = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(10, __qtablewidgetitem10)
-        __qtablewidgetitem11 = QTableWidgetItem()
-        self.commit_table.setHorizontalHeaderItem(11, __qtablewidgetitem11)
+        self.commit_table = QTableView(self.inner_frame_3)
         self.commit_table.setObjectName(u"commit_table")
         sizePolicy1 = QSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         sizePolicy1.setHorizontalStretch(0)
@@ -408,6 +382,11 @@ class Ui_pembelian(object):
 
         self.horizontalLayout_9.addWidget(self.import_button)
 
+        self.export_button = QPushButton(self.inner_frame_3)
+        self.export_button.setObjectName(u"export_button")
+
+        self.horizontalLayout_9.addWidget(self.export_button)
+
         self.init_button = QPushButton(self.inner_frame_3)
         self.init_button.setObjectName(u"init_button")
 
@@ -519,31 +498,8 @@ class Ui_pembelian(object):
         self.isi_unit_combo.setItemText(4, QCoreApplication.translate("pembelian", u"ml", None))
 
         self.add_vendor_button.setText(QCoreApplication.translate("pembelian", u"Add", None))
-        ___qtablewidgetitem = self.commit_table.horizontalHeaderItem(0)
-        ___qtablewidgetitem.setText(QCoreApplication.translate("pembelian", u"Date", None));
-        ___qtablewidgetitem1 = self.commit_table.horizontalHeaderItem(1)
-        ___qtablewidgetitem1.setText(QCoreApplication.translate("pembelian", u"Item", None));
-        ___qtablewidgetitem2 = self.commit_table.horizontalHeaderItem(2)
-        ___qtablewidgetitem2.setText(QCoreApplication.translate("pembelian", u"Vendor", None));
-        ___qtablewidgetitem3 = self.commit_table.horizontalHeaderItem(3)
-        ___qtablewidgetitem3.setText(QCoreApplication.translate("pembelian", u"Merek", None));
-        ___qtablewidgetitem4 = self.commit_table.horizontalHeaderItem(4)
-        ___qtablewidgetitem4.setText(QCoreApplication.translate("pembelian", u"Quantity", None));
-        ___qtablewidgetitem5 = self.commit_table.horizontalHeaderItem(5)
-        ___qtablewidgetitem5.setText(QCoreApplication.translate("pembelian", u"Unit", None));
-        ___qtablewidgetitem6 = self.commit_table.horizontalHeaderItem(6)
-        ___qtablewidgetitem6.setText(QCoreApplication.translate("pembelian", u"Harga", None));
-        ___qtablewidgetitem7 = self.commit_table.horizontalHeaderItem(7)
-        ___qtablewidgetitem7.setText(QCoreApplication.translate("pembelian", u"Total", None));
-        ___qtablewidgetitem8 = self.commit_table.horizontalHeaderItem(8)
-        ___qtablewidgetitem8.setText(QCoreApplication.translate("pembelian", u"Isi", None));
-        ___qtablewidgetitem9 = self.commit_table.horizontalHeaderItem(9)
-        ___qtablewidgetitem9.setText(QCoreApplication.translate("pembelian", u"Isi Unit", None));
-        ___qtablewidgetitem10 = self.commit_table.horizontalHeaderItem(10)
-        ___qtablewidgetitem10.setText(QCoreApplication.translate("pembelian", u"Harga/Unit", None));
-        ___qtablewidgetitem11 = self.commit_table.horizontalHeaderItem(11)
-        ___qtablewidgetitem11.setText(QCoreApplication.translate("pembelian", u"Category", None));
         self.import_button.setText(QCoreApplication.translate("pembelian", u"Import Data", None))
+        self.export_button.setText(QCoreApplication.translate("pembelian", u"Export Prices", None))
         self.init_button.setText(QCoreApplication.translate("pembelian", u"Init Data", None))
         self.test_button.setText(QCoreApplication.translate("pembelian", u"TEST", None))
         self.confirm_button.setText(QCoreApplication.translate("pembelian", u"Confirm", None))
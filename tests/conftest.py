@@ -0,0 +1,27 @@
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+from core.excel_functions import init_catsheet
+from core.utils import get_category_config
+
+
+@pytest.fixture
+def purchase_workbook(tmp_path, monkeypatch):
+    """Initialized purchase workbook with one Toko A row, and the category file it was made with in the cwd.
+
+    The category sheets are created by the init.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "excel_categories.txt").write_text("[MISC]\nDATA\n[CATEGORIES]\nFresh\nCleaning\n")
+    workbook = openpyxl.Workbook()
+    vendor_sheet = workbook.active
+    vendor_sheet.title = "Toko A"
+    vendor_sheet.append(["TGL", "ITEM"])
+    vendor_sheet.append([None, "NAMA"])
+    vendor_sheet.append([datetime(2021, 1, 2), "Gula", None, 2, "Kg", 15000, "=D3*F3", 1000, "g", "=G3/H3", "Fresh"])
+    path = tmp_path / "Pembelian.xlsx"
+    workbook.save(path)
+    init_catsheet(str(path), get_category_config(), preflight=False)
+    return str(path)
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import openpyxl
+
+from core.archive import archive_workbook_rows, read_carry
+from core.excel_functions import register_named_styles
+
+
+def test_archived_rows_are_carried_and_formulas_follow_their_rows():
+    workbook = openpyxl.Workbook()
+    vendor_sheet = workbook.active
+    vendor_sheet.title = "Toko A"
+    vendor_sheet.append(["TGL", "Item"])
+    vendor_sheet.append([None, "Nama"])
+    for day, cost in ((1, 4000), (20, 6000), (2, 8000)):
+        row = vendor_sheet.max_row + 1
+        vendor_sheet.append(
+            [
+                datetime(2021, 1, day),
+                "Kopi",
+                None,
+                1,
+                "bks",
+                cost,
+                f"=D{row}*F{row}",
+                1000,
+                "g",
+                f"=G{row}/H{row}",
+                "Fresh",
+            ]
+        )
+    register_named_styles(workbook)
+    archive_wb = openpyxl.Workbook()
+    archive_wb.remove(archive_wb.active)
+
+    moved = archive_workbook_rows(workbook, archive_wb, ["Toko A"], datetime(2021, 1, 10), ["Fresh"])
+
+    assert moved == 2
+    assert [row[5:7] for row in vendor_sheet.iter_rows(min_row=3, values_only=True)] == [(6000, "=D3*F3")]
+    assert [row[9] for row in archive_wb["Toko A"].iter_rows(min_row=3, values_only=True)] == ["=G3/H3", "=G4/H4"]
+    carried = read_carry(workbook)["kopi"]
+    assert (carried.count, carried.total, carried.max, carried.category) == (2, 12, 8, "Fresh")
@@ -0,0 +1,29 @@
+import openpyxl
+
+from core.catalog import changed_sheet_names, read_catalog, sheet_checksums
+from core.utils import get_category_config
+
+
+def test_changed_sheet_names_include_added_and_removed_sheets():
+    before = {"Fresh": 1, "Cleaning": 2, "Toko A": 3}
+    after = {"Fresh": 1, "Cleaning": 5, "Toko B": 4}
+    assert changed_sheet_names(before, after) == {"Cleaning", "Toko A", "Toko B"}
+    assert changed_sheet_names(before, dict(before)) == set()
+
+
+def test_only_the_changed_category_sheets_are_read_again(purchase_workbook):
+    categories = get_category_config()
+    snapshot = read_catalog(purchase_workbook, categories)
+    assert snapshot.stores["Fresh"].names == ["Gula"]
+    assert snapshot.vendors == ["Toko A"]
+
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    workbook["Cleaning"]["A3"] = "Sabun"
+    workbook.save(purchase_workbook)
+
+    checksums = sheet_checksums(purchase_workbook)
+    assert "Cleaning" in changed_sheet_names(snapshot.checksums, checksums)
+    refreshed = read_catalog(purchase_workbook, categories, sheets={"Cleaning"}, checksums=checksums)
+    assert list(refreshed.stores) == ["Cleaning"]
+    assert refreshed.stores["Cleaning"].names == ["Sabun"]
+    assert refreshed.checksums is checksums
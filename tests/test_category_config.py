@@ -0,0 +1,18 @@
+import os
+
+from core.utils import get_category_config
+
+
+def test_config_is_cached_until_file_changes(tmp_path):
+    cat_file = tmp_path / "excel_categories.txt"
+    cat_file.write_text("[MISC]\nLIST\n[CATEGORIES]\nFresh\n")
+
+    config = get_category_config(str(cat_file))
+    assert config["CATEGORIES"] == ["Fresh"]
+    assert not config.is_vendor_sheet("LIST")
+    assert config.is_vendor_sheet("Toko A")
+    assert get_category_config(str(cat_file)) is config
+
+    cat_file.write_text("[MISC]\nLIST\n[CATEGORIES]\nFresh\nCleaning\n")
+    os.utime(cat_file, ns=(config.mtime_ns + 1_000_000, config.mtime_ns + 1_000_000))
+    assert get_category_config(str(cat_file))["CATEGORIES"] == ["Fresh", "Cleaning"]
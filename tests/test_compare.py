@@ -0,0 +1,40 @@
+import openpyxl
+
+from core.compare import compare_workbooks
+
+CATEGORIES = {"MISC": ["DATA"], "CATEGORIES": ["Fresh"]}
+
+
+def save_category_rows(path, rows):
+    workbook = openpyxl.Workbook()
+    category_sheet = workbook.active
+    category_sheet.title = "Fresh"
+    category_sheet.append(["ITEM"])
+    category_sheet.append([])
+    for row in rows:
+        category_sheet.append(row)
+    workbook.save(path)
+
+
+def test_status_follows_the_item_lists_not_the_prices(tmp_path):
+    # Formula text stands in for a price Excel never calculated
+    save_category_rows(
+        tmp_path / "2022.xlsx",
+        [["Gula", "Kg", "g", 10], ["Kopi", "bks", "g", "=G3/H3"], ["Teh", "bks", "g", 5], ["Garam", "Kg", "g", None]],
+    )
+    save_category_rows(
+        tmp_path / "2023.xlsx",
+        [["gula ", "Kg", "g", 12], ["Kopi", "bks", "g", 20], ["Teh", "bks", "g", None], ["Susu", "L", "ml", None]],
+    )
+
+    comparisons, (totals,) = compare_workbooks(tmp_path / "2022.xlsx", tmp_path / "2023.xlsx", CATEGORIES)
+
+    assert {comparison.item: comparison.status for comparison in comparisons} == {
+        "Garam": "discontinued",
+        "gula ": "compared",
+        "Kopi": "no price",
+        "Susu": "new",
+        "Teh": "no price",
+    }
+    assert (totals.compared, totals.new, totals.discontinued, totals.no_price) == (1, 1, 1, 2)
+    assert totals.change_percent == 20
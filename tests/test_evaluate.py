@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import openpyxl
+
+from core.evaluate import evaluate_formulas
+from core.excel_functions import init_catsheet
+from core.utils import get_category_config
+
+
+def test_cached_values_match_hand_computed_ones(purchase_workbook):
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    vendor_sheet = workbook["Toko A"]
+    for row, values in enumerate(
+        [
+            ["Gula", None, 1, "Kg", 20000, None, 500, "g", None, "Fresh"],
+            # No cost yet, counts as a purchase at 0 in the average
+            ["Gula", None, 1, "Kg", None, None, 1000, "g", None, "Fresh"],
+            ["Sabun", None, 4, "pcs", 2500, None, 1, "pcs", None, "Cleaning"],
+        ],
+        start=4,
+    ):
+        values[5], values[8] = f"=D{row}*F{row}", f"=G{row}/H{row}"
+        vendor_sheet.append([datetime(2021, 1, row)] + values)
+    workbook.save(purchase_workbook)
+
+    init_catsheet(purchase_workbook, get_category_config(), preflight=False)
+
+    cached = openpyxl.load_workbook(purchase_workbook, data_only=True)
+    assert [(row[6], row[9]) for row in cached["Toko A"].iter_rows(min_row=3, values_only=True)] == [
+        (30000, 30),
+        (20000, 40),
+        (0, 0),
+        (10000, 10000),
+    ]
+    category_prices = {
+        row[0]: row[3:5]
+        for sheet in ("Fresh", "Cleaning")
+        for row in cached[sheet].iter_rows(min_row=3, values_only=True)
+    }
+    assert category_prices == {"Gula": ((30 + 40 + 0) / 3, 40), "Sabun": (10000, 10000)}
+
+
+def test_nothing_is_cached_without_listed_vendors(purchase_workbook):
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    del workbook["DATA"]
+
+    assert evaluate_formulas(workbook, get_category_config()) == {}
+
+
+def test_only_the_app_formulas_of_category_sheets_are_cached(purchase_workbook):
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    notes = workbook.create_sheet("Notes")
+    notes["A3"] = "Gula"
+    notes["D3"] = '=SUMIF(X:X,"a",Y:Y)/3'
+    notes["E3"] = '=SUMPRODUCT(MAXIFS(INDIRECT("\'"&Vendors&"\'!"&"J:J"), INDIRECT("\'"&Vendors&"\'!"&"B:B"), A3))'
+    # Typed over in Excel, still mentions SUMIF
+    workbook["Fresh"]["D3"] = "=SUMIF(Toko!B:B, A3, Toko!J:J) / 2"
+
+    values = evaluate_formulas(workbook, get_category_config())
+
+    assert "Notes" not in values
+    assert values["Fresh"] == {"E3": 30}
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+import openpyxl
+
+from core.export import price_snapshot
+
+CATEGORIES = {"MISC": ["DATA"], "CATEGORIES": ["Fresh"]}
+
+
+def test_snapshot_from_vendor_rows(tmp_path):
+    workbook = openpyxl.Workbook()
+    vendor = workbook.active
+    vendor.title = "Toko A"
+    vendor.append(["DATE", "ITEM"])
+    vendor.append([])
+    # Price per unit from the cached J value, or from quantity * cost / isi when J was never calculated
+    vendor.append([datetime(2021, 1, 5), "Gula", None, 2, "Kg", 10000, None, 2000, "g", None, "Fresh"])
+    vendor.append([datetime(2021, 1, 2), "gula ", None, 1, "Kg", 14000, None, 1000, "g", 14, "Fresh"])
+    vendor.append([datetime(2021, 1, 3), "Kopi", None, 1, "bks", "n/a", None, 200, "g", None, "Fresh"])
+    workbook.create_sheet("Fresh").append(["ITEM"])
+    path = tmp_path / "prices.xlsx"
+    workbook.save(path)
+
+    (gula,) = price_snapshot(path, CATEGORIES)
+
+    assert (gula.item, gula.count, gula.min, gula.max, gula.average) == ("Gula", 2, 10, 14, 12)
+    assert (gula.last, gula.last_date) == (10, datetime(2021, 1, 5))
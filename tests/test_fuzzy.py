@@ -0,0 +1,37 @@
+import random
+import string
+
+from core.fuzzy import NameIndex, normalize_name, trigrams
+
+INDEX = NameIndex([("Gula pasir", "Fresh"), ("Gula merah", "Fresh"), ("Sabun cuci", "Cleaning")])
+
+
+def test_exact_ignores_case_and_spaces():
+    assert INDEX.exact(" gula  PASIR") == ("Gula pasir", "Fresh")
+    assert INDEX.exact("Gula") is None
+
+
+def test_similar_catches_typos():
+    matches = INDEX.similar("Gulla pasir")
+
+    assert matches[0][1:] == ("Gula pasir", "Fresh")
+    assert all(name != "Sabun cuci" for _, name, _ in matches)
+
+
+def test_common_trigrams_do_not_widen_the_lookup():
+    rng = random.Random(3)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 8))) for _ in range(400)]
+    # Every name ends in " 1 kg", so its trigrams are in every posting list they have
+    names = [f"{rng.choice(words)} {rng.choice(words)} 1 kg" for _ in range(20000)]
+    index = NameIndex((name, None) for name in names)
+    query = f"{words[0]}x {words[1]} 1 kg"
+
+    grams = trigrams(normalize_name(query))
+    assert len(index._candidates(grams, 0.5)) < len(index) / 20
+
+    def dice(name):
+        name_grams = trigrams(normalize_name(name))
+        return 2 * len(grams & name_grams) / (len(grams) + len(name_grams))
+
+    expected = sorted((dice(name) for name in set(names) if dice(name) >= 0.5), reverse=True)[:5]
+    assert [score for score, _, _ in index.similar(query)] == expected
@@ -0,0 +1,49 @@
+import openpyxl
+import pytest
+
+from core.excel_functions import import_records
+from core.utils import get_category_config
+
+
+def save_category_rows(path, rows_by_category):
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for category, rows in rows_by_category.items():
+        category_sheet = workbook.create_sheet(category)
+        category_sheet.append(["ITEM"])
+        category_sheet.append([])
+        for row in rows:
+            category_sheet.append(row)
+    workbook.save(path)
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_newest_workbook_wins_per_item(purchase_workbook, tmp_path, streaming):
+    save_category_rows(
+        tmp_path / "2021.xlsx",
+        {"Fresh": [["Kopi", "bks", "g", 50], ["Teh", "bks", "g", 20]], "Cleaning": [["Sabun", "pcs", "pcs", 3]]},
+    )
+    # Kopi is listed twice in 2022, the first row is the one the category formulas find
+    save_category_rows(
+        tmp_path / "2022.xlsx",
+        {"Fresh": [["Kopi", "pack", None, 60], ["Kopi", "sachet", "g", 1]], "Cleaning": [["Sikat", "pcs", "pcs", 9]]},
+    )
+
+    import_records(
+        [tmp_path / "2021.xlsx", tmp_path / "2022.xlsx"],
+        purchase_workbook,
+        get_category_config(),
+        streaming=streaming,
+        preflight=False,
+    )
+
+    import_sheet = openpyxl.load_workbook(purchase_workbook)["_IMPORT_"]
+    imported = {
+        row[1]: (row[4], row[8], row[9], row[10]) for row in import_sheet.iter_rows(min_row=3, values_only=True)
+    }
+    assert imported == {
+        "Kopi": ("pack", "g", 60, "Fresh"),
+        "Teh": ("bks", "g", 20, "Fresh"),
+        "Sabun": ("pcs", "pcs", 3, "Cleaning"),
+        "Sikat": ("pcs", "pcs", 9, "Cleaning"),
+    }
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+
+from core.ingest import parse_purchase_text, parse_number, validate_purchase_rows
+
+CATALOG_INDEX = {"gula pasir": ("Fresh", "Gula pasir", "g")}
+UNITS = ["Kg", "g", "pcs", "L", "ml"]
+
+
+def test_parse_tab_separated_rows_with_aliases():
+    rows = parse_purchase_text("Tanggal\tItem\tQty\tIgnored\n01-Feb-21\tGula\t2\tx\n\t\t\t\n")
+
+    assert rows == [{"date": "01-Feb-21", "name": "Gula", "quantity": "2"}]
+
+
+def test_parse_number_handles_thousand_separators():
+    assert parse_number("Rp 12.500") == 12500
+    assert parse_number("1.250,5") == 1250.5
+    assert parse_number("2,5") == 2.5
+    assert parse_number("1.5") == 1.5
+    for not_finite in ("nan", "inf", "-Infinity"):
+        with pytest.raises(ValueError):
+            parse_number(not_finite)
+
+
+def test_validate_uses_catalog_and_reports_problems():
+    rows = [
+        {"name": "gula  PASIR", "quantity": "2", "unit_beli": "kg", "cost": "12.500", "isi": "1000"},
+        {"name": "Madu", "quantity": "0", "unit_beli": "box", "cost": "1", "isi": "1", "unit_isi": "L"},
+    ]
+    items, errors = validate_purchase_rows(
+        rows, CATALOG_INDEX, ["Fresh"], UNITS, ["Toko A"], default_date=datetime(2021, 2, 1), default_vendor="Toko A"
+    )
+
+    assert len(items) == 1
+    assert (items[0].name, items[0].category, items[0].unit_beli, items[0].unit_isi) == (
+        "Gula pasir",
+        "Fresh",
+        "Kg",
+        "g",
+    )
+    assert errors == ["Row 3: quantity cannot be 0, unknown unit 'box', new item 'Madu' needs a valid category"]
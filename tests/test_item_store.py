@@ -0,0 +1,25 @@
+from core.constants import ExcelItem
+from core.item_store import ExcelItemStore
+
+
+def test_store_round_trips_items():
+    items = [ExcelItem(name="Kopi", unit_beli="bks", unit_isi="g"), ExcelItem(name="Gula", unit_beli="Kg")]
+    store = ExcelItemStore(items)
+
+    assert len(store) == 2
+    assert list(store) == items
+    assert store[1] == items[1]
+
+
+def test_store_sorts_all_columns_together():
+    store = ExcelItemStore()
+    store.append(name="Kopi", unit_isi="g")
+    store.append(name="Air", unit_isi="ml")
+    store.sort_by("name")
+
+    assert store.names == ["Air", "Kopi"]
+    assert store.column("unit_isi") == ["ml", "g"]
+
+
+def test_excel_item_is_slotted():
+    assert not hasattr(ExcelItem(), "__dict__")
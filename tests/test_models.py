@@ -0,0 +1,16 @@
+from datetime import datetime
+
+from PySide6.QtCore import Qt
+
+from core.constants import ExcelItem
+from core.models import CommitTableModel
+
+
+def test_commit_table_shows_dates_and_leaves_missing_ones_empty():
+    model = CommitTableModel()
+    model.add_items([ExcelItem("Gula", "Toko A", date=datetime(2021, 1, 3)), ExcelItem("Sabun", "Toko A")])
+
+    assert model.data(model.index(0, 0)) == "03-Jan-21"
+    assert model.data(model.index(1, 0)) == ""
+    assert model.data(model.index(1, 0), Qt.UserRole) is None
+    assert model.data(model.index(0, 1), Qt.ToolTipRole) is None
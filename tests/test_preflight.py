@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import openpyxl
+
+from core.preflight import normalize_category, preflight_scan
+from core.utils import get_category_config
+
+CATEGORIES = ["Fresh", "Stationery", "Maintenance"]
+
+
+def test_normalize_category_fixes_case_spacing_and_typos():
+    assert normalize_category("  fresh ", CATEGORIES) == "Fresh"
+    assert normalize_category("Stationary", CATEGORIES) == "Stationery"
+    assert normalize_category("maintainance", CATEGORIES) == "Maintenance"
+    assert normalize_category("Snacks", CATEGORIES) is None
+    assert normalize_category(None, CATEGORIES) is None
+
+
+def test_only_the_rows_init_reads_are_checked(purchase_workbook):
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    vendor_sheet = workbook["Toko A"]
+    # Init reads the first Gula row, later ones do not matter
+    vendor_sheet.append([datetime(2021, 1, 3), " gula", None, 1, "Kg", 16000, "=D4*F4", 1000, "g", "=G4/H4", "Snacks"])
+    vendor_sheet.append([datetime(2021, 1, 3), "Sabun", None, 1, None, 3000, "=D5*F5", 1, "pcs", "=G5/H5", "Snacks"])
+    workbook.save(purchase_workbook)
+
+    problems = preflight_scan(purchase_workbook, get_category_config())
+    assert [(problem.row, problem.message, problem.warning) for problem in problems] == [
+        (5, "unknown category 'Snacks'", False),
+        (5, "missing unit beli", True),
+    ]
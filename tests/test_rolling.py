@@ -0,0 +1,57 @@
+import random
+from datetime import datetime, timedelta
+
+import openpyxl
+
+from core.constants import ExcelItem
+from core.excel_functions import write_batch_to_excel
+from core.rolling import ItemWindow, get_rolling_averages
+from core.utils import get_category_config
+
+
+def test_windows_match_recomputing_from_scratch():
+    rng = random.Random(7)
+    start = datetime(2021, 1, 1)
+    purchases = [(start + timedelta(days=rng.randrange(400)), float(rng.randrange(1, 100))) for _ in range(200)]
+    window = ItemWindow()
+    for seen, (date, price) in enumerate(purchases, 1):
+        window.add(date, price, 5, 30)
+
+        history = sorted(purchases[:seen], key=lambda purchase: purchase[0])
+        last_dates = [purchase_date for purchase_date, _ in history]
+        newest = last_dates[-1]
+        in_days = [p for d, p in history if d >= newest - timedelta(days=30)]
+        assert abs(window.average - sum(p for _, p in history) / seen) < 1e-9
+        assert abs(window.days_average - sum(in_days) / len(in_days)) < 1e-9
+        assert len(window.last_n) == min(seen, 5)
+        assert [d for d, _ in window.last_n] == last_dates[-5:]
+
+
+def rolling_prices(path, name):
+    workbook = openpyxl.load_workbook(path)
+    for row in workbook["Fresh"].iter_rows(min_row=3, values_only=True):
+        if row[0] == name:
+            return row[5], row[6]
+
+
+def test_written_purchases_update_the_averages_and_outside_edits_rebuild_them(purchase_workbook):
+    # The fixture has Gula at 30 per g
+    write_batch_to_excel(
+        purchase_workbook,
+        [ExcelItem("Gula", "Toko A", None, 1, "Kg", 20000, 500, "g", "Fresh", datetime(2021, 1, 3))],
+        get_category_config(),
+    )
+    assert rolling_prices(purchase_workbook, "Gula") == (35, 35)
+
+    # Corrected in Excel, 50 per g
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    workbook["Toko A"]["F3"] = 25000
+    workbook.save(purchase_workbook)
+
+    write_batch_to_excel(
+        purchase_workbook,
+        [ExcelItem("Gula", "Toko A", None, 1, "Kg", 60000, 1000, "g", "Fresh", datetime(2021, 1, 4))],
+        get_category_config(),
+    )
+    assert rolling_prices(purchase_workbook, "Gula") == (50, 50)
+    assert get_rolling_averages(purchase_workbook).items["gula"].count == 3
@@ -0,0 +1,91 @@
+import threading
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+from core.constants import ExcelItem
+from core.excel_functions import add_vendor
+from core.service import ServiceClient, WorkbookMismatchError, WorkbookService, make_server
+from core.utils import get_category_config
+from core.write_queue import PurchaseError, queue_dir
+
+
+def purchase(name, category="Cleaning", vendor="Toko A"):
+    return ExcelItem(name, vendor, None, 1, "pcs", 3000, 1, "pcs", category, datetime(2021, 1, 3))
+
+
+@pytest.fixture
+def service(purchase_workbook):
+    service = WorkbookService(purchase_workbook)
+    service.load()
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield service, ServiceClient(f"http://127.0.0.1:{server.server_port}")
+    server.shutdown()
+    server.server_close()
+
+
+def vendor_items(path, vendor="Toko A"):
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return [row[1] for row in workbook[vendor].iter_rows(min_row=3, values_only=True)]
+    finally:
+        workbook.close()
+
+
+def test_purchases_are_saved_together_and_in_the_catalog_meanwhile(service):
+    service, client = service
+    sabun = client.submit(service.file, [purchase("Sabun")])
+    with pytest.raises(PurchaseError, match="no sheet for vendor 'Toko B'"):
+        client.submit(service.file, [purchase("Sikat", vendor="Toko B")])
+    # Added from a till after the service loaded the workbook
+    add_vendor(service.file, "Toko B", get_category_config())
+    sikat = client.submit(service.file, [purchase("Sikat", vendor="Toko B")])
+    assert client.status(sabun) == {"status": "pending", "problems": []}
+    assert "Sabun" in [item["name"] for item in client.catalog()["categories"]["Cleaning"]]
+    assert client.similar("sabun")[0]["name"] == "Sabun"
+
+    assert client.save() == 2
+    assert vendor_items(service.file) == ["Gula", "Sabun"]
+    assert vendor_items(service.file, "Toko B") == ["Sikat"]
+    assert client.status(sikat)["status"] == "written"
+    assert client.save() == 0
+
+
+def test_queued_purchases_survive_a_restart(purchase_workbook):
+    service = WorkbookService(purchase_workbook)
+    service.load()
+    service.submit([purchase("Sabun")])
+    # Stopped before its next save
+    service = WorkbookService(purchase_workbook)
+    service.load()
+    assert service.save() == 1
+    assert vendor_items(purchase_workbook) == ["Gula", "Sabun"]
+
+
+def test_purchases_for_another_workbook_are_refused(service):
+    service, client = service
+    assert client.workbook() == "Pembelian.xlsx"
+    with pytest.raises(WorkbookMismatchError):
+        client.submit("Pembelian 2022.xlsx", [purchase("Sabun")])
+    assert not any(queue_dir(service.file).glob("*.json"))
+
+
+def test_bad_purchases_are_refused_or_set_aside(service):
+    service, client = service
+    with pytest.raises(PurchaseError, match="unknown category 'Snacks'"):
+        client.submit(service.file, [purchase("Keripik", category="Snacks")])
+    assert service.pending == {}
+
+    apel = client.submit(service.file, [purchase("Apel", category="Fresh")])
+    client.submit(service.file, [purchase("Sabun")])
+    # The category sheet goes away before the save
+    workbook = openpyxl.load_workbook(service.file)
+    del workbook["Fresh"]
+    workbook.save(service.file)
+
+    assert client.save() == 1
+    assert vendor_items(service.file) == ["Gula", "Sabun"]
+    assert client.status(apel) == {"status": "rejected", "problems": ["Item 1 (Apel): no sheet for category 'Fresh'"]}
+    assert "Apel" not in str(client.catalog())
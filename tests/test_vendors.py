@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+from core.constants import ExcelItem
+from core.excel_functions import (
+    add_vendor,
+    create_vendor_sheet,
+    extend_vendor_range,
+    listed_vendors,
+    vendor_range_matches,
+)
+from core.utils import get_category_config
+from core.write_queue import PurchaseError, write_batch_queued
+
+
+def test_vendor_range_matches_only_the_same_vendors_in_order(purchase_workbook):
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    assert vendor_range_matches(workbook, ["Toko A"])
+    assert not vendor_range_matches(workbook, ["Toko A", "Toko B"])
+    assert not vendor_range_matches(workbook, ["Toko B"])
+
+    workbook.defined_names.delete("Vendors")
+    assert not vendor_range_matches(workbook, ["Toko A"])
+
+
+def test_extend_vendor_range_appends_once(purchase_workbook):
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    extend_vendor_range(workbook, "Toko B", get_category_config())
+    extend_vendor_range(workbook, "Toko B", get_category_config())
+
+    assert listed_vendors(workbook) == ["Toko A", "Toko B"]
+    assert workbook.defined_names.get("Vendors").attr_text == "DATA!$A$1:$A$2"
+
+
+def test_create_vendor_sheet_copies_the_header_and_lists_the_vendor(purchase_workbook):
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    new_sheet = create_vendor_sheet(workbook, "Toko B", get_category_config())
+
+    header = [[cell.value for cell in row] for row in new_sheet.iter_rows(max_row=2)]
+    assert header == [[cell.value for cell in row] for row in workbook["Toko A"].iter_rows(max_row=2)]
+    assert new_sheet.max_row == 2
+    assert vendor_range_matches(workbook, ["Toko A", "Toko B"])
+
+
+def test_purchases_for_unknown_vendors_are_refused_until_added(purchase_workbook):
+    categories = get_category_config()
+    purchase = ExcelItem("Sabun", "Toko B", None, 1, "pcs", 3000, 1, "pcs", "Cleaning", datetime(2021, 1, 3))
+    with pytest.raises(PurchaseError, match="no sheet for vendor 'Toko B'"):
+        write_batch_queued(purchase_workbook, [purchase], categories)
+    assert "Toko B" not in openpyxl.load_workbook(purchase_workbook).sheetnames
+
+    with pytest.raises(ValueError):
+        add_vendor(purchase_workbook, "Fresh", categories)
+    assert add_vendor(purchase_workbook, " Toko B ", categories)
+    assert not add_vendor(purchase_workbook, "Toko B", categories)
+    write_batch_queued(purchase_workbook, [purchase], categories)
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    assert [row[1] for row in workbook["Toko B"].iter_rows(min_row=3, values_only=True)] == ["Sabun"]
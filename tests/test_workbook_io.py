@@ -0,0 +1,71 @@
+import shutil
+from datetime import datetime
+
+import openpyxl
+
+from core import workbook_io
+from core.constants import ExcelItem
+from core.excel_functions import import_records, init_catsheet, write_batch_to_excel
+from core.utils import get_category_config
+from core.workbook_io import changed_sheets, file_fingerprint, workbook_digests
+
+
+def test_digest_matches_after_save_and_reload(tmp_path):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Fresh"
+    sheet["A3"] = "Gula"
+    sheet["A4"] = "Kopi"
+    sheet["F3"] = 6.0
+    sheet["D3"] = "=B3*C3"
+    sheet.formula_attributes["D3"] = {"t": "shared", "ref": "D3:D4", "si": "0"}
+    sheet["D4"]._value = "="
+    sheet["D4"].data_type = "f"
+    sheet.formula_attributes["D4"] = {"t": "shared", "si": "0"}
+    path = tmp_path / "digest.xlsx"
+    workbook.save(path)
+
+    assert changed_sheets(workbook_digests(workbook), workbook_digests(openpyxl.load_workbook(path))) == []
+
+
+def test_reports_changed_and_new_sheets():
+    workbook = openpyxl.Workbook()
+    before = workbook_digests(workbook)
+    workbook.active["A1"] = "changed"
+    workbook.create_sheet("Toko A")
+
+    assert changed_sheets(before, workbook_digests(workbook)) == ["Sheet", "Toko A", "workbook"]
+
+
+def test_repeated_init_and_import_save_nothing(purchase_workbook, tmp_path):
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    for row in range(4, 7):
+        # 3 * 1000 / 7000 = 0.42857142857142855, which is written as 0.4285714285714286
+        values = [datetime(2021, 2, row), "Kopi", None, 3, "bks", 1000, f"=D{row}*F{row}", 7000, "g", f"=G{row}/H{row}"]
+        workbook["Toko A"].append(values + ["Fresh"])
+    workbook.save(purchase_workbook)
+    categories = get_category_config()
+    init_catsheet(purchase_workbook, categories, preflight=False)
+    old_path = tmp_path / "Pembelian 2020.xlsx"
+    shutil.copy(purchase_workbook, old_path)
+    import_records(old_path, purchase_workbook, categories, preflight=False)
+
+    saved = file_fingerprint(purchase_workbook)
+    init_catsheet(purchase_workbook, categories, preflight=False)
+    import_records(old_path, purchase_workbook, categories, preflight=False)
+    assert file_fingerprint(purchase_workbook) == saved
+
+
+def test_appending_purchases_only_digests_their_sheets(purchase_workbook, monkeypatch):
+    digested = []
+    original_sheet_digest = workbook_io.sheet_digest
+
+    def recording_sheet_digest(worksheet):
+        digested.append(worksheet.title)
+        return original_sheet_digest(worksheet)
+
+    monkeypatch.setattr(workbook_io, "sheet_digest", recording_sheet_digest)
+    purchase = ExcelItem("Sabun", "Toko A", None, 1, "pcs", 3000, 1, "pcs", "Cleaning", datetime(2021, 1, 3))
+    write_batch_to_excel(purchase_workbook, [purchase], get_category_config())
+
+    assert sorted(digested) == ["Cleaning", "Cleaning", "Toko A", "Toko A"]
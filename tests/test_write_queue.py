@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import openpyxl
+import pytest
+
+from core.constants import ExcelItem
+from core.utils import get_category_config
+from core.workbook_io import WorkbookLock, WorkbookLockError, lock_path
+from core.write_queue import (
+    BatchPendingError,
+    PurchaseError,
+    flush_write_queue,
+    queue_dir,
+    submit_batch,
+    write_batch_queued,
+)
+
+
+def purchase(name, category="Cleaning", vendor="Toko A"):
+    return ExcelItem(name, vendor, None, 1, "pcs", 3000, 1, "pcs", category, datetime(2021, 1, 3))
+
+
+def vendor_items(path, vendor="Toko A"):
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return [row[1] for row in workbook[vendor].iter_rows(min_row=3, values_only=True)]
+    finally:
+        workbook.close()
+
+
+def test_concurrent_writers_both_land(purchase_workbook):
+    categories = get_category_config()
+    writers = [
+        threading.Thread(target=write_batch_queued, args=(purchase_workbook, [purchase(name)], categories))
+        for name in "AB"
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    assert sorted(vendor_items(purchase_workbook)) == ["A", "B", "Gula"]
+    assert not list(queue_dir(purchase_workbook).glob("*.json*"))
+
+
+def test_stale_lock_is_broken_and_live_lock_waits(purchase_workbook):
+    lock_file = lock_path(purchase_workbook)
+    with open(lock_file, "w") as crashed_client:
+        crashed_client.write("crashed till")
+    old = time.time() - 600
+    os.utime(lock_file, (old, old))
+    write_batch_queued(purchase_workbook, [purchase("Sabun")], get_category_config())
+    assert "Sabun" in vendor_items(purchase_workbook)
+
+    with WorkbookLock(purchase_workbook):
+        with pytest.raises(WorkbookLockError):
+            flush_write_queue(purchase_workbook, get_category_config(), timeout=0.2)
+
+
+def test_poisoned_batch_is_set_aside_and_the_next_one_written(purchase_workbook):
+    # Valid when queued, but its category sheet was deleted before the flush
+    workbook = openpyxl.load_workbook(purchase_workbook)
+    del workbook["Fresh"]
+    workbook.save(purchase_workbook)
+    poisoned = submit_batch(purchase_workbook, [purchase("Apel", category="Fresh")])
+
+    write_batch_queued(purchase_workbook, [purchase("Sabun")], get_category_config())
+
+    assert vendor_items(purchase_workbook) == ["Gula", "Sabun"]
+    failed = queue_dir(purchase_workbook) / "failed"
+    assert (failed / poisoned.name).exists()
+    assert "no sheet for category 'Fresh'" in (failed / f"{poisoned.name}.error").read_text()
+    with pytest.raises(PurchaseError):
+        write_batch_queued(purchase_workbook, [purchase("Apel", category="Fresh")], get_category_config())
+    assert "Apel" not in vendor_items(purchase_workbook)
+
+
+def test_breaking_a_stale_lock_spares_a_lock_taken_meanwhile(purchase_workbook, monkeypatch):
+    lock_file = lock_path(purchase_workbook)
+    with open(lock_file, "w") as crashed_client:
+        crashed_client.write("crashed till")
+    old = time.time() - 600
+    os.utime(lock_file, (old, old))
+    rename = os.rename
+
+    def other_client_breaks_it_first(source, destination):
+        # Between our age check and our rename, another till breaks the lock and takes it
+        os.remove(source)
+        with open(source, "w") as other_client:
+            other_client.write("other till")
+        rename(source, destination)
+
+    monkeypatch.setattr(os, "rename", other_client_breaks_it_first)
+    WorkbookLock(purchase_workbook)._break_if_stale()
+    monkeypatch.setattr(os, "rename", rename)
+
+    with open(lock_file) as lock:
+        assert lock.read() == "other till"
+    assert [path.name for path in Path(purchase_workbook).parent.glob("*.broken")] == []
+
+
+def test_a_batch_claimed_by_a_busy_client_is_awaited(purchase_workbook, monkeypatch):
+    monkeypatch.setattr("core.write_queue._await_claimed_batch.__defaults__", (0.5,))
+
+    # Another till claimed our batch and is still writing it
+    def claim_and_time_out(file, categories, timeout=None):
+        for batch_path in queue_dir(file).glob("*.json"):
+            os.replace(batch_path, batch_path.with_name(batch_path.name + ".claimed"))
+        raise WorkbookLockError("Workbook is locked by other till")
+
+    monkeypatch.setattr("core.write_queue.flush_write_queue", claim_and_time_out)
+    with pytest.raises(BatchPendingError):
+        write_batch_queued(purchase_workbook, [purchase("Sabun")], get_category_config())
+    (claimed,) = queue_dir(purchase_workbook).glob("*.claimed")
+    assert claimed.exists()